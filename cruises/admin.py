@@ -1,10 +1,21 @@
-from django.contrib import admin
+import io
+from django.contrib import admin, messages
 from django.contrib.gis.admin import GISModelAdmin
-from import_export.admin import ImportExportModelAdmin
+from django.db import DatabaseError
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
+from import_export.admin import ImportExportModelAdmin, ImportMixin
 from django.utils.html import format_html
-from .models import Vessel, Cruise, Leg, Scientist, Position, RefList, CruiseStatus, Route, Segment
+from .export import start_export
+from .forms import CSVUploadForm
+from .ingest import ingest_positions
+from .models import Vessel, Cruise, Leg, Scientist, Position, RefList, CruiseStatus, Route, Segment, Export
 from .resources import VesselResource, CruiseStatusResource, CruiseResource, PositionResource, LegResource, ScientistResource
 
+ROUTE_SUMMARY_FIELDS = [
+    'length', 'n_points', 'start_time', 'end_time', 'max_gap', 'mean_speed', 'crossings', 'west', 'south', 'east', 'north',
+]
+
 class LegInline(admin.TabularInline):
     model = Leg
     extra = 0
@@ -21,7 +32,7 @@ class PositionInline(admin.TabularInline):
     model = Position
     extra = 0
     fields = ['date', 'time', 'lat', 'lon']
-    ordering = ['-date', '-time']
+    ordering = ['-timestamp']
 
 class SegmentInline(admin.TabularInline):
     model = Segment
@@ -33,6 +44,7 @@ class SegmentInline(admin.TabularInline):
 class RouteInline(admin.StackedInline):
     model = Route
     can_delete = False
+    readonly_fields = ROUTE_SUMMARY_FIELDS
     verbose_name_plural = 'Route'
     fk_name = 'cruise'
 
@@ -48,14 +60,80 @@ class VesselAdmin(GISModelAdmin, ImportExportModelAdmin):
         return "No Image"
     image_tag.short_description = 'Image'
 
+class CrossesAntimeridianFilter(admin.SimpleListFilter):
+    title = 'crosses the antimeridian'
+    parameter_name = 'crosses_antimeridian'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Yes'), ('no', 'No')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(route__crossings__gt=0)
+        if self.value() == 'no':
+            return queryset.exclude(route__crossings__gt=0)
+        return queryset
+
 @admin.register(Cruise)
 class CruiseAdmin(GISModelAdmin, ImportExportModelAdmin):
-    list_display = ['cruise_name', 'vessel', 'user', 'iso2_country', 'status']
+    list_display = ['cruise_name', 'vessel', 'user', 'iso2_country', 'status', 'track_start', 'track_length', 'track_fixes']
+    list_select_related = ['vessel', 'user', 'status', 'route']
     search_fields = ['cruise_name', 'vessel__vessel_name', 'user__username']
-    list_filter = ['iso2_country', 'status']
+    list_filter = ['iso2_country', 'status', 'route__start_time', CrossesAntimeridianFilter]
     ordering = ['cruise_name']
     inlines = [LegInline, ScientistInline, PositionInline, RouteInline]
     resource_class = CruiseResource
+    actions = ['import_track', 'export_csv', 'export_parquet', 'export_netcdf']
+
+    @admin.display(description='Track start', ordering='route__start_time')
+    def track_start(self, obj):
+        route = getattr(obj, 'route', None)
+        return route.start_time if route else None
+
+    @admin.display(description='Length (km)', ordering='route__length')
+    def track_length(self, obj):
+        route = getattr(obj, 'route', None)
+        return round(route.length) if route and route.length is not None else None
+
+    @admin.display(description='Fixes', ordering='route__n_points')
+    def track_fixes(self, obj):
+        route = getattr(obj, 'route', None)
+        return route.n_points if route else None
+
+    @admin.action(description="Bulk import a track CSV into the selected cruise")
+    def import_track(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one cruise to import a track into.", messages.WARNING)
+            return None
+        url = reverse('admin:cruises_position_import_track')
+        return redirect(f"{url}?cruise={queryset.get().pk}")
+
+    def export_positions(self, request, queryset, format):
+        export = Export.objects.create(format=format, user=request.user)
+        export.cruises.set(queryset)
+        export = start_export(export)
+        url = reverse('admin:cruises_export_change', args=[export.pk])
+        if export.status == 'failed':
+            self.message_user(request, f"Export failed: {export.error}", messages.ERROR)
+        elif export.status == 'done':
+            download = reverse('export-download', args=[export.pk])
+            self.message_user(
+                request, format_html('Exported {} positions: <a href="{}">download</a>.', export.rows, download), messages.SUCCESS,
+            )
+        else:
+            self.message_user(request, format_html('Export queued; <a href="{}">follow it here</a>.', url), messages.INFO)
+
+    @admin.action(description="Export the positions of the selected cruises as CSV")
+    def export_csv(self, request, queryset):
+        self.export_positions(request, queryset, 'csv')
+
+    @admin.action(description="Export the positions of the selected cruises as GeoParquet")
+    def export_parquet(self, request, queryset):
+        self.export_positions(request, queryset, 'parquet')
+
+    @admin.action(description="Export the positions of the selected cruises as NetCDF trajectories")
+    def export_netcdf(self, request, queryset):
+        self.export_positions(request, queryset, 'netcdf')
 
 @admin.register(Leg)
 class LegAdmin(ImportExportModelAdmin):
@@ -73,13 +151,43 @@ class ScientistAdmin(ImportExportModelAdmin):
     ordering = ['last_name', 'first_name']
     resource_class = ScientistResource
 
+# Exports go through the cruise actions, which stream to a file, rather than a tablib dataset of every row.
 @admin.register(Position)
-class PositionAdmin(GISModelAdmin, ImportExportModelAdmin):
+class PositionAdmin(ImportMixin, GISModelAdmin):
     list_display = ('date', 'time', 'lat', 'lon', 'coordinates')
     search_fields = ['cruise__cruise_name']
-    ordering = ['-date', '-time']
+    ordering = ['-timestamp']
     resource_class = PositionResource
 
+    def get_urls(self):
+        urls = [
+            path('import-track/', self.admin_site.admin_view(self.import_track_view), name='cruises_position_import_track'),
+        ]
+        return urls + super().get_urls()
+
+    def import_track_view(self, request):
+        """Bulk load a track CSV through COPY, rebuilding each touched route once."""
+        if request.method == 'POST':
+            form = CSVUploadForm(request.POST, request.FILES)
+            if form.is_valid():
+                file = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+                try:
+                    loaded, dropped = ingest_positions(file, cruise=form.cleaned_data['cruise'])
+                except (DatabaseError, KeyError, ValueError) as e:
+                    self.message_user(request, f"Import failed: {e}", messages.ERROR)
+                else:
+                    self.message_user(
+                        request,
+                        f"Loaded {sum(loaded.values())} positions into {len(loaded)} cruises"
+                        f" and dropped {sum(dropped.values())} duplicate, outlying or redundant rows.",
+                        messages.SUCCESS,
+                    )
+                    return redirect('admin:cruises_position_changelist')
+        else:
+            form = CSVUploadForm(initial={'cruise': request.GET.get('cruise')})
+        context = {**self.admin_site.each_context(request), 'form': form, 'opts': self.model._meta, 'title': "Import track CSV"}
+        return render(request, 'admin/csv_form.html', context)
+
 @admin.register(RefList)
 class RefListAdmin(ImportExportModelAdmin):
     list_display = ['list_type', 'list_desc']
@@ -95,7 +203,10 @@ class CruiseStatusAdmin(ImportExportModelAdmin):
 
 @admin.register(Route)
 class RouteAdmin(GISModelAdmin, ImportExportModelAdmin):
-    list_display = ['cruise', 'path']
+    list_display = ['cruise', 'length', 'n_points', 'start_time', 'end_time', 'mean_speed', 'max_gap', 'crossings']
+    list_select_related = ['cruise']
+    list_filter = ['start_time']
+    readonly_fields = ROUTE_SUMMARY_FIELDS
     search_fields = ['cruise__cruise_name']
     ordering = ['cruise']
     inlines = [SegmentInline]
@@ -104,6 +215,22 @@ class RouteAdmin(GISModelAdmin, ImportExportModelAdmin):
 class SegmentAdmin(GISModelAdmin, ImportExportModelAdmin):
     list_display = ['start_position', 'end_position', 'leg', 'path']
     search_fields = ['start_position__date', 'end_position__date', 'leg__cruise__cruise_name']
-    ordering = ['start_position__date', 'end_position__date']
+    ordering = ['start_position__timestamp', 'end_position__timestamp']
+
+@admin.register(Export)
+class ExportAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'format', 'user', 'status', 'rows', 'created_at', 'finished_at', 'download']
+    list_filter = ['format', 'status']
+    readonly_fields = ['format', 'cruises', 'user', 'status', 'rows', 'error', 'created_at', 'finished_at', 'download']
+    ordering = ['-created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='File')
+    def download(self, obj):
+        if obj.status == 'done' and obj.file:
+            return format_html('<a href="{}">Download</a>', reverse('export-download', args=[obj.pk]))
+        return None
 
 # Register other models as before...
@@ -0,0 +1,72 @@
+"""
+Archiving the positions of finished cruises.
+
+Positions of cruises that are over are moved out of the live positions table
+into the archive table, one statement per direction, so the indexes scanned for
+current tracks, time ranges and tiles only hold the cruises still in use.
+The route of an archived cruise keeps its path, levels of detail and summary,
+so it still shows on maps and in search results; its segments, which point at
+the positions, are dropped and rebuilt when the positions are restored.
+"""
+import logging
+from uuid import UUID
+
+from django.db import connection, transaction
+
+from .caching import invalidate_responses
+from .models import ArchivedPosition, Cruise, Position, Route, Segment, deferred_route_updates
+from .tiles import invalidate_tiles
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = ('position_id', 'cruise', 'date', 'time', 'timestamp', 'lat', 'lon', 'coordinates')
+# The generated timestamp is computed again on the way back in.
+RESTORED_FIELDS = tuple(name for name in ARCHIVED_FIELDS if name != 'timestamp')
+
+
+def columns(model, fields):
+    return ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+
+
+def move_positions(source, target, fields, cruise_ids):
+    """Move the ``fields`` of every row of ``cruise_ids`` from ``source`` to ``target``; returns the row count."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {connection.ops.quote_name(source._meta.db_table)}
+                WHERE {connection.ops.quote_name(source._meta.get_field('cruise').column)} = ANY(%s)
+                RETURNING {columns(source, fields)}
+            )
+            INSERT INTO {connection.ops.quote_name(target._meta.db_table)} ({columns(target, fields)})
+            SELECT {columns(source, fields)} FROM moved
+        """, [[UUID(str(cruise_id)) for cruise_id in cruise_ids]])
+        return cursor.rowcount
+
+
+def finished_cruises(ended_before):
+    """Cruises with live positions whose track ended before the aware datetime ``ended_before``."""
+    return Cruise.objects.filter(route__end_time__lt=ended_before, positions__isnull=False).distinct()
+
+
+def archive_cruises(cruise_ids):
+    """Move the positions of ``cruise_ids`` to the archive, keeping their routes as they are."""
+    cruise_ids = list(cruise_ids)
+    with transaction.atomic():
+        Segment.objects.filter(route__cruise_id__in=cruise_ids).delete()
+        moved = move_positions(Position, ArchivedPosition, ARCHIVED_FIELDS, cruise_ids)
+        invalidate_responses(Position, cruise_ids=cruise_ids)  # Raw SQL sends no post_delete signals
+        invalidate_tiles(*Route.objects.filter(cruise_id__in=cruise_ids, west__isnull=False).values_list('west', 'south', 'east', 'north'))
+    logger.info("Archived %d positions of %d cruises", moved, len(cruise_ids))
+    return moved
+
+
+def restore_cruises(cruise_ids):
+    """Move the archived positions of ``cruise_ids`` back and rebuild their routes."""
+    cruise_ids = list(cruise_ids)
+    with deferred_route_updates() as touched:
+        with transaction.atomic():
+            moved = move_positions(ArchivedPosition, Position, RESTORED_FIELDS, cruise_ids)
+            invalidate_responses(Position, cruise_ids=cruise_ids)
+        touched.update(cruise_ids)
+    logger.info("Restored %d positions of %d cruises", moved, len(cruise_ids))
+    return moved
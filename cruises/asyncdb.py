@@ -0,0 +1,145 @@
+"""
+Pooled async database access for the views served under ASGI.
+
+Django's async ORM methods (``aget``, ``aiterator`` and the like) run each
+query in a worker thread on a connection of that thread. That is fine for the
+few short queries of a cruise page. A streamed track, though, would take a
+thread hop per chunk for as long as a slow client keeps the stream open.
+:func:`stream_rows` instead runs the SQL Django compiles for a queryset on a
+psycopg ``AsyncConnection`` taken from a pool, and reads it through a
+server-side cursor on the event loop. Thousands of slow downloads can then
+share one uvicorn worker and a handful of connections.
+
+Each event loop gets its own pool, opened on first use and sized by
+``ASYNC_DB_POOL``. When every connection is busy for longer than its
+``timeout``, or more than ``max_waiting`` requests are queued for one,
+:class:`PoolExhausted` is raised and the view answers 503.
+
+Pooled connections are made with the parameters and PostGIS adapters Django
+uses for its own, so compiled queries bind their parameters the same way.
+Rows come back as psycopg converts them, without Django's field converters:
+uuid, date, time, numeric and timestamp columns arrive as Python values, but
+geometry columns arrive as hex EWKB. Only ``values_list`` querysets of such
+plain columns should be streamed this way.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+from django.conf import settings
+from django.contrib.gis.db.backends.postgis.adapter import PostGISAdapter
+from django.contrib.gis.db.backends.postgis.base import postgis_adapters
+from django.db import connections
+from psycopg.types import TypeInfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout, TooManyRequests
+
+from .instrumentation import current_request
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip by server-side cursors.
+STREAM_ITERSIZE = 2000
+
+_pools = weakref.WeakKeyDictionary()
+
+
+class PoolExhausted(Exception):
+    """No pooled connection could be had in time."""
+
+
+def connection_params(alias='default'):
+    """What Django passes psycopg to connect ``alias``, less its sync cursor class."""
+    params = connections[alias].get_connection_params()
+    params.pop('cursor_factory', None)
+    params['application_name'] = 'pacific_cruises-asgi'
+    return params
+
+
+async def _configure(connection):
+    # Dump GEOS parameters (the bbox filter's polygons, say) as Django's own connections do.
+    infos = [await TypeInfo.fetch(connection, name) for name in ('geometry', 'geography', 'raster')]
+    for dumper in postgis_adapters(*(info.oid if info else None for info in infos)):
+        connection.adapters.register_dumper(PostGISAdapter, dumper)
+    await connection.execute("SET TIME ZONE 'UTC'")
+    await connection.commit()
+
+
+async def get_pool():
+    """The connection pool of the running event loop, opened on first use."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        options = settings.ASYNC_DB_POOL
+        pool = _pools[loop] = AsyncConnectionPool(
+            kwargs=connection_params(),
+            open=False,
+            configure=_configure,
+            name='asgi',
+            min_size=options['min_size'],
+            max_size=options['max_size'],
+            timeout=options['timeout'],
+            max_waiting=options['max_waiting'],
+            max_idle=options['max_idle'],
+        )
+        await pool.open()
+    return pool
+
+
+def compile_queryset(queryset):
+    """The SQL and parameters Django would run for ``queryset``."""
+    return queryset.query.get_compiler(using=queryset.db).as_sql()
+
+
+def _count_query(elapsed):
+    record = current_request.get()
+    if record is not None:
+        record.queries += 1
+        record.query_time += elapsed
+
+
+async def _fetch_rows(queryset, itersize):
+    sql, params = compile_queryset(queryset)
+    pool = await get_pool()
+    try:
+        connection = await pool.getconn()
+    except (PoolTimeout, TooManyRequests) as e:
+        raise PoolExhausted(str(e)) from e
+    try:
+        async with connection.transaction(), connection.cursor(name='stream_rows') as cursor:
+            cursor.itersize = itersize
+            start = time.perf_counter()
+            await cursor.execute(sql, params)
+            _count_query(time.perf_counter() - start)
+            async for row in cursor:
+                yield row
+    finally:
+        await pool.putconn(connection)
+
+
+async def _chain(first, rows):
+    yield first
+    async for row in rows:
+        yield row
+
+
+async def _empty():
+    return
+    yield
+
+
+async def stream_rows(queryset, itersize=STREAM_ITERSIZE):
+    """
+    The rows of a ``values_list`` queryset, as an async iterator over a server-side cursor.
+
+    The first row is read before returning, so the connection is taken, and
+    :class:`PoolExhausted` raised, while the view can still answer with an
+    error. The connection goes back to the pool when the iteration ends, or
+    when the iterator is closed because the client went away.
+    """
+    rows = _fetch_rows(queryset, itersize)
+    try:
+        first = await anext(rows)
+    except StopAsyncIteration:
+        return _empty()
+    return _chain(first, rows)
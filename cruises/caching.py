@@ -0,0 +1,159 @@
+"""
+Response cache for the read-only side of the API.
+
+Rendered GET responses are stored in the default cache, keyed by path, query
+string and ``Accept`` header together with generation counters for the models
+the view depends on. Saving or deleting a row bumps its counters once the
+transaction commits, which makes every cached response built from the old data
+unreachable; they then expire on their own.
+
+Rows that belong to one cruise bump only that cruise's counter and a counter
+shared by list responses, so responses about other cruises stay cached.
+Models shared between cruises, such as vessels and statuses, keep a single
+counter that every response depending on them reads.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'api-cache:{namespace}:{outcome}'
+
+
+# Scope of the counters read by responses that are not about a single cruise.
+LIST_SCOPE = 'list'
+
+
+def generation_key(model, scope=None):
+    """The counter of ``model`` for every response, or for those of ``scope``: a cruise id or ``LIST_SCOPE``."""
+    key = f'api-cache:generation:{model._meta.label_lower}'
+    return f'{key}:{scope}' if scope is not None else key
+
+
+def invalidate_responses(*models, cruise_ids=None):
+    """
+    Drop cached responses that depend on ``models`` once the current transaction commits.
+
+    With ``cruise_ids``, only the responses about those cruises and list
+    responses are dropped.
+    """
+    if cruise_ids is None:
+        keys = [generation_key(model) for model in models]
+    else:
+        scopes = [LIST_SCOPE, *{str(cruise_id) for cruise_id in cruise_ids}]
+        keys = [generation_key(model, scope) for model in models for scope in scopes]
+    transaction.on_commit(lambda: _bump_generations(keys))
+
+
+def _bump_generations(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+        except Exception as e:
+            logger.error(f"Could not invalidate cached responses under {key}: {e}")
+
+
+def _count(namespace, outcome):
+    key = STATS_KEY.format(namespace=namespace, outcome=outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def response_cache_stats(namespaces):
+    """Hits and misses counted for each cache namespace."""
+    keys = {
+        (namespace, outcome): STATS_KEY.format(namespace=namespace, outcome=outcome)
+        for namespace in namespaces for outcome in ('hits', 'misses')
+    }
+    counts = cache.get_many(keys.values())
+    stats = {namespace: {'hits': 0, 'misses': 0} for namespace in namespaces}
+    for (namespace, outcome), key in keys.items():
+        stats[namespace][outcome] = counts.get(key, 0)
+    return stats
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match', '')
+    return etag in (tag.strip() for tag in if_none_match.split(',')) or if_none_match.strip() == '*'
+
+
+class CachedResponseMixin:
+    """
+    Cache a viewset's rendered GET responses, with ``ETag``/``If-None-Match``.
+
+    ``cache_models`` lists every model whose rows can show up in the
+    responses; ``cache_namespace`` names the view in keys and hit/miss counts.
+    Responses to URLs with a ``cache_cruise_kwarg`` are about that one cruise
+    and read its counters; the others read the list counters of the models
+    :meth:`list_cache_models` names.
+    """
+    cache_models = ()
+    cache_namespace = None
+    cache_cruise_kwarg = None
+
+    def list_cache_models(self, request):
+        """The models whose rows of any cruise can show up in a response that is not about one cruise."""
+        return self.cache_models
+
+    def generation_keys(self, request):
+        cruise_id = self.kwargs.get(self.cache_cruise_kwarg) if self.cache_cruise_kwarg else None
+        if cruise_id is not None:
+            scoped = [generation_key(model, str(cruise_id)) for model in self.cache_models]
+        else:
+            scoped = [generation_key(model, LIST_SCOPE) for model in self.list_cache_models(request)]
+        return [generation_key(model) for model in self.cache_models] + scoped
+
+    def response_cache_key(self, request):
+        keys = self.generation_keys(request)
+        generations = cache.get_many(keys)
+        versions = '.'.join(str(generations.get(key, 0)) for key in keys)
+        request_id = hashlib.md5(
+            f"{request.get_full_path()}|{request.headers.get('Accept', '')}".encode()
+        ).hexdigest()
+        return f'api-cache:{self.cache_namespace}:{versions}:{request_id}'
+
+    def cached_response(self, request):
+        """The cache key of a GET and the response cached under it, or ``None`` on a miss."""
+        key = self.response_cache_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            _count(self.cache_namespace, 'misses')
+            return key, None
+        _count(self.cache_namespace, 'hits')
+        content, content_type, etag = entry
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Cache'] = 'HIT'
+        return key, self.conditional_response(request, response, etag)
+
+    def cache_response(self, request, key, response):
+        """Render and store a fresh response to a GET under ``key``, unless it failed or streams."""
+        if response.status_code != 200 or response.streaming:
+            return response
+        response.render()
+        etag = f'"{hashlib.md5(response.content).hexdigest()}"'
+        cache.set(key, (response.content, response['Content-Type'], etag), settings.API_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return self.conditional_response(request, response, etag)
+
+    def conditional_response(self, request, response, etag):
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super().dispatch(request, *args, **kwargs)
+        key, response = self.cached_response(request)
+        if response is None:
+            response = self.cache_response(request, key, super().dispatch(request, *args, **kwargs))
+        return response
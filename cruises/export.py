@@ -0,0 +1,249 @@
+"""
+Exports of whole cruise datasets to files under ``EXPORT_ROOT``.
+
+Positions are written a cruise at a time in track order, live and archived
+alike, without ever holding more than one chunk of rows:
+
+``csv``
+    ``COPY ... TO STDOUT`` straight into the file, in the columns
+    ``import_positions`` reads, so an export can be loaded again.
+``parquet``
+    GeoParquet 1.0: one row group per chunk read from a server-side cursor,
+    with the points as WKB in a ``geometry`` column and the ``geo``
+    metadata, bounding box included, written with the footer.
+``netcdf``
+    CF-1.8 trajectories in a contiguous ragged array: one trajectory per
+    cruise, positions along an unlimited ``obs`` dimension and ``rowSize``
+    counting each cruise's share of them.
+
+:func:`start_export` runs an export in the request when the routes say it
+holds at most ``EXPORT_INLINE_LIMIT`` positions, and queues it for Celery
+otherwise. Either way the file appears under its final name only once it is
+complete.
+"""
+import csv
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from uuid import UUID
+
+import netCDF4
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BigIntegerField, FloatField, Func, Sum
+from django.db.models.functions import Cast
+
+from .ingest import read_chunks
+from .models import POSITION_ORDERING, ArchivedPosition, Cruise, Export, Position, Route
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = 'exports'
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'netcdf': '.nc'}
+CSV_FIELDS = ('position_id', 'cruise', 'date', 'time', 'lat', 'lon')
+
+# Little-endian ISO WKB point: byte order, type, x, y.
+WKB_POINT = np.dtype([('order', 'u1'), ('type', '<u4'), ('x', '<f8'), ('y', '<f8')])
+
+PARQUET_SCHEMA = pa.schema([
+    ('cruise_id', pa.string()),
+    ('position_id', pa.string()),
+    ('time', pa.timestamp('us', tz='UTC')),
+    ('lat', pa.float64()),
+    ('lon', pa.float64()),
+    ('geometry', pa.binary()),
+])
+
+
+class EpochMicroseconds(Func):
+    template = '(EXTRACT(EPOCH FROM %(expressions)s) * 1000000)::bigint'
+    output_field = BigIntegerField()
+
+
+def track_chunks(cruise_ids, chunk_size=None):
+    """
+    The positions of each cruise in track order, in chunks of at most ``chunk_size``.
+
+    Yields the index of the cruise in ``cruise_ids`` with the position ids,
+    times in microseconds since the epoch, latitudes and longitudes of the
+    chunk (NaN where missing) as arrays.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    for index, cruise_id in enumerate(cruise_ids):
+        for model in (Position, ArchivedPosition):
+            rows = (
+                model.objects.filter(cruise_id=cruise_id)
+                .order_by(*POSITION_ORDERING)
+                .annotate(micros=EpochMicroseconds('timestamp'), y=Cast('lat', FloatField()), x=Cast('lon', FloatField()))
+                .values_list('position_id', 'micros', 'y', 'x')
+            )
+            for chunk in read_chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+                position_ids, micros, lat, lon = zip(*chunk)
+                yield (
+                    index, np.array([str(position_id) for position_id in position_ids]), np.array(micros, dtype=np.int64),
+                    np.array(lat, dtype=np.float64), np.array(lon, dtype=np.float64),
+                )
+
+
+def write_csv(path, cruises):
+    """Copy every cruise's positions into a CSV at ``path``; returns the row count."""
+    written = 0
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerow(CSV_FIELDS)
+    with open(path, 'ab') as file, connection.cursor() as cursor:
+        for cruise_id, _ in cruises:
+            for model in (Position, ArchivedPosition):
+                table = connection.ops.quote_name(model._meta.db_table)
+                columns = ', '.join(
+                    f'{connection.ops.quote_name(model._meta.get_field(name).column)} AS {name}' for name in CSV_FIELDS
+                )
+                order = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in POSITION_ORDERING)
+                # COPY takes no parameters; the id is spelled out as a UUID literal.
+                with cursor.copy(
+                    f"COPY (SELECT {columns} FROM {table} WHERE cruise_id = '{UUID(str(cruise_id))}' ORDER BY {order}) "
+                    f"TO STDOUT (FORMAT CSV)"
+                ) as copy:
+                    for data in copy:
+                        file.write(data)
+                written += cursor.rowcount
+    return written
+
+
+def wkb_points(lon, lat):
+    """A binary Arrow array of WKB points, null where either coordinate is missing."""
+    points = np.empty(len(lon), dtype=WKB_POINT)
+    points['order'] = 1
+    points['type'] = 1
+    points['x'] = lon
+    points['y'] = lat
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    offsets = np.arange(len(lon) + 1, dtype=np.int32) * WKB_POINT.itemsize
+    return pa.Array.from_buffers(
+        pa.binary(), len(lon),
+        [pa.py_buffer(np.packbits(valid, bitorder='little')), pa.py_buffer(offsets), pa.py_buffer(points.tobytes())],
+        null_count=int((~valid).sum()),
+    )
+
+
+def write_parquet(path, cruises):
+    """Write every cruise's positions as GeoParquet at ``path``; returns the row count."""
+    written = 0
+    west = south = np.inf
+    east = north = -np.inf
+    # Without the serialized Arrow schema, readers take the schema metadata from the footer, where ``geo`` goes
+    # once the bounding box is known; the columns' Parquet types carry everything else.
+    with pq.ParquetWriter(path, PARQUET_SCHEMA, compression='zstd', store_schema=False) as writer:
+        for index, position_ids, micros, lat, lon in track_chunks([cruise_id for cruise_id, _ in cruises]):
+            writer.write_table(pa.Table.from_arrays([
+                pa.repeat(pa.scalar(str(cruises[index][0])), len(micros)),
+                pa.array(position_ids),
+                pa.array(micros, type=pa.timestamp('us', tz='UTC')),
+                pa.array(lat, from_pandas=True),
+                pa.array(lon, from_pandas=True),
+                wkb_points(lon, lat),
+            ], schema=PARQUET_SCHEMA))
+            written += len(micros)
+            if not np.isnan(lon).all():
+                west, east = min(west, np.nanmin(lon)), max(east, np.nanmax(lon))
+                south, north = min(south, np.nanmin(lat)), max(north, np.nanmax(lat))
+        geometry = {'encoding': 'WKB', 'geometry_types': ['Point']}
+        if np.isfinite(west):
+            geometry['bbox'] = [float(west), float(south), float(east), float(north)]
+        writer.add_key_value_metadata({'geo': json.dumps({
+            'version': '1.0.0', 'primary_column': 'geometry', 'columns': {'geometry': geometry},
+        })})
+    return written
+
+
+def write_netcdf(path, cruises):
+    """Write every cruise's positions as CF trajectories at ``path``; returns the row count."""
+    with netCDF4.Dataset(path, 'w', format='NETCDF4') as dataset:
+        dataset.Conventions = 'CF-1.8'
+        dataset.featureType = 'trajectory'
+        dataset.title = 'Pacific cruise tracks'
+        dataset.history = f'{datetime.now(timezone.utc):%Y-%m-%dT%H:%M:%SZ} exported from the Pacific Cruises database'
+        dataset.createDimension('trajectory', len(cruises))
+        dataset.createDimension('obs', None)
+
+        trajectory = dataset.createVariable('trajectory', str, ('trajectory',))
+        trajectory.cf_role = 'trajectory_id'
+        trajectory.long_name = 'cruise id'
+        name = dataset.createVariable('cruise_name', str, ('trajectory',))
+        name.long_name = 'cruise name'
+        row_size = dataset.createVariable('rowSize', 'i8', ('trajectory',))
+        row_size.long_name = 'number of positions of the cruise'
+        row_size.sample_dimension = 'obs'
+        for index, (cruise_id, cruise_name) in enumerate(cruises):
+            trajectory[index] = str(cruise_id)
+            name[index] = cruise_name
+
+        time = dataset.createVariable('time', 'f8', ('obs',), zlib=True)
+        time.standard_name = 'time'
+        time.units = 'seconds since 1970-01-01 00:00:00 UTC'
+        time.calendar = 'standard'
+        time.axis = 'T'
+        coordinates = {}
+        for variable, standard_name, units, axis in (('lat', 'latitude', 'degrees_north', 'Y'), ('lon', 'longitude', 'degrees_east', 'X')):
+            coordinates[variable] = dataset.createVariable(variable, 'f8', ('obs',), zlib=True, fill_value=np.nan)
+            coordinates[variable].standard_name = standard_name
+            coordinates[variable].units = units
+            coordinates[variable].axis = axis
+        time.coordinates = 'lat lon'
+
+        counts = np.zeros(len(cruises), dtype=np.int64)
+        written = 0
+        for index, _, micros, lat, lon in track_chunks([cruise_id for cruise_id, _ in cruises]):
+            end = written + len(micros)
+            time[written:end] = micros / 1e6
+            coordinates['lat'][written:end] = lat
+            coordinates['lon'][written:end] = lon
+            counts[index] += len(micros)
+            written = end
+        row_size[:] = counts
+    return written
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'netcdf': write_netcdf}
+
+
+def export_cruises(export):
+    """The (id, name) of every cruise ``export`` covers, ordered by id."""
+    cruises = export.cruises.all() if export.cruises.exists() else Cruise.objects.all()
+    return list(cruises.order_by('pk').values_list('pk', 'cruise_name'))
+
+
+def run_export(export):
+    """Write ``export`` to its file and record how it went."""
+    Export.objects.filter(pk=export.pk).update(status='running')
+    name = f'{EXPORT_DIR}/{export.pk}{EXTENSIONS[export.format]}'
+    path = Export.file.field.storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.part'
+    try:
+        export.rows = WRITERS[export.format](partial, export_cruises(export))
+        os.replace(partial, path)
+    except Exception as e:
+        logger.error(f"Export {export.pk} failed: {e}")
+        if os.path.exists(partial):
+            os.remove(partial)
+        export.status, export.error = 'failed', str(e)
+    else:
+        export.status, export.file.name = 'done', name
+    export.finished_at = datetime.now(timezone.utc)
+    export.save(update_fields=['status', 'file', 'rows', 'error', 'finished_at'])
+    return export
+
+
+def start_export(export):
+    """Run ``export`` now if it is small, or queue it once the current transaction commits."""
+    routes = Route.objects.all() if not export.cruises.exists() else Route.objects.filter(cruise__in=export.cruises.all())
+    expected = routes.aggregate(total=Sum('n_points'))['total'] or 0
+    if expected <= settings.EXPORT_INLINE_LIMIT:
+        return run_export(export)
+    from .tasks import export_positions  # tasks imports this module
+    transaction.on_commit(lambda: export_positions.delay(str(export.pk)))
+    return export
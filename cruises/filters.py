@@ -0,0 +1,109 @@
+"""
+Cleaning of position tracks before they are stored.
+
+Each batch of fixes on its way into the positions table is put into track
+order per cruise and run through three filters, each working on whole NumPy
+arrays:
+
+``duplicate``
+    A fix at the same time as an earlier one of its cruise is dropped, so the
+    first one wins.
+``speed``
+    A fix that could only have been reached, and left again, at more than
+    ``max_speed`` knots is an outlier and is dropped.
+``thinned``
+    A fix less than ``min_distance`` metres from the last fix kept, and less
+    than ``min_interval`` seconds after it, adds nothing to the track and is
+    dropped. A ship holding station then stores one fix per interval rather
+    than one every few seconds.
+
+Fixes already stored can be passed in with the batch. They are compared
+against but never dropped, so filtering carries on from the previous batch.
+Fixes without coordinates only go through the duplicate filter. A limit of 0
+turns its filter off.
+"""
+from collections import Counter
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # metres
+KNOT = 1852 / 3600  # metres per second
+
+# Fixes compared with the last one kept in a single vectorised step while thinning.
+THINNING_BLOCK = 256
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Great circle distance in metres between points given in degrees."""
+    lon1, lat1, lon2, lat2 = (np.radians(value) for value in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def speed_outliers(seconds, lon, lat, stored, max_speed):
+    """Fixes of one track reached and left faster than ``max_speed`` knots."""
+    elapsed = np.diff(seconds)
+    distance = haversine(lon[:-1], lat[:-1], lon[1:], lat[1:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fast = np.where(elapsed > 0, distance / elapsed, np.inf) > max_speed * KNOT
+    return np.r_[False, fast] & np.r_[fast, False] & ~stored
+
+
+def thinned(seconds, lon, lat, stored, min_distance, min_interval):
+    """Fixes of one track within both limits of the last fix kept before them."""
+    drop = np.zeros(len(seconds), dtype=bool)
+    anchor = 0
+    while anchor < len(seconds) - 1:
+        # Every fix from ``end`` on is at least the interval after the anchor.
+        end = np.searchsorted(seconds, seconds[anchor] + min_interval) if min_interval else len(seconds)
+        start = following = anchor + 1
+        while start < end:
+            stop = min(end, start + THINNING_BLOCK)
+            far = stored[start:stop].copy()
+            if min_distance:
+                far |= haversine(lon[anchor], lat[anchor], lon[start:stop], lat[start:stop]) >= min_distance
+            hits = np.flatnonzero(far)
+            if len(hits):
+                following = start + hits[0]
+                break
+            start = following = stop
+        drop[anchor + 1:following] = True
+        anchor = following
+    return drop
+
+
+def filter_track(cruises, seconds, lon, lat, stored, max_speed=0, min_distance=0, min_interval=0):
+    """
+    Which fixes to keep, and a :class:`Counter` of those dropped by filter.
+
+    ``cruises`` labels the track each fix belongs to, ``seconds`` is its time
+    and ``lon``/``lat`` its position in degrees (NaN when missing). ``stored``
+    marks fixes that are already in the database.
+    """
+    _, track = np.unique(cruises, return_inverse=True)
+    # Track order, with a stored fix ahead of new ones at the same time.
+    order = np.lexsort((~stored, seconds, track))
+    track, seconds, lon, lat, stored = track[order], seconds[order], lon[order], lat[order], stored[order]
+    same_track = np.r_[False, track[1:] == track[:-1]]
+
+    duplicate = same_track & np.r_[False, seconds[1:] == seconds[:-1]] & ~stored
+    drop = {'duplicate': duplicate, 'speed': np.zeros_like(duplicate), 'thinned': np.zeros_like(duplicate)}
+    fixes = np.flatnonzero(~duplicate & ~np.isnan(lon) & ~np.isnan(lat))
+    if len(fixes) and (max_speed or min_distance or min_interval):
+        bounds = np.flatnonzero(np.r_[True, track[fixes][1:] != track[fixes][:-1], True])
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            rows = fixes[first:last]
+            if max_speed:
+                outliers = speed_outliers(seconds[rows], lon[rows], lat[rows], stored[rows], max_speed)
+                drop['speed'][rows[outliers]] = True
+                rows = rows[~outliers]
+            if min_distance or min_interval:
+                drop['thinned'][rows[thinned(seconds[rows], lon[rows], lat[rows], stored[rows], min_distance, min_interval)]] = True
+
+    keep = np.ones(len(order), dtype=bool)
+    dropped = Counter()
+    for reason, mask in drop.items():
+        keep[order[mask]] = False
+        if mask.any():
+            dropped[reason] = int(mask.sum())
+    return keep, dropped
@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.gis import forms as gis_forms
 from django.contrib.gis.geos import Point
-from .models import Position
+from .models import Cruise, Position
 
 class PositionForm(gis_forms.ModelForm):
     latitude = forms.FloatField(required=False, help_text="Enter latitude")
@@ -24,3 +24,7 @@ class PositionForm(gis_forms.ModelForm):
 
 class CSVUploadForm(forms.Form):
     csv_file = forms.FileField()
+    cruise = forms.ModelChoiceField(
+        queryset=Cruise.objects.all(), required=False,
+        help_text="Load every row into this cruise instead of reading a cruise column",
+    )
@@ -0,0 +1,175 @@
+"""
+Track geometry for cruise routes.
+
+All route paths are built here. A track is a sequence of (lon, lat) points; it
+is cut into a MultiLineString wherever a step jumps more than 180 degrees of
+longitude, i.e. crosses the antimeridian, so that maps draw it the short way
+round instead of across the whole globe.
+"""
+import logging
+import struct
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.contrib.gis.geos import GEOSGeometry, MultiLineString, Polygon
+
+logger = logging.getLogger(__name__)
+
+Point2D = Tuple[float, float]
+
+
+def wrap_longitude(lon):
+    """Bring longitudes outside -180..180 back into range, leaving +/-180 as given."""
+    lon = np.asarray(lon, dtype=np.float64)
+    return np.where(np.abs(lon) > 180, (lon + 180) % 360 - 180, lon)
+
+
+def split_latitudes(x1, y1, x2, y2, x_split, great_circle=False):
+    """
+    Latitude at which each step from (x1, y1) to (x2, y2) meets ``x_split``.
+
+    Steps are measured the short way across the antimeridian. By default the
+    latitude is interpolated linearly in longitude, which is how the track is
+    drawn on a map; ``great_circle`` gives the latitude of the geodesic instead.
+    """
+    x2 = np.where(x1 > 0, x2 + 360, x2 - 360)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if great_circle:
+            lam1, lam2, lam = np.radians(x1), np.radians(x2), np.radians(x_split)
+            phi1, phi2 = np.radians(y1), np.radians(y2)
+            latitude = np.degrees(np.arctan(
+                (np.sin(phi1) * np.cos(phi2) * np.sin(lam - lam2) - np.sin(phi2) * np.cos(phi1) * np.sin(lam - lam1))
+                / (np.cos(phi1) * np.cos(phi2) * np.sin(lam1 - lam2))
+            ))
+        else:
+            latitude = y1 + (y2 - y1) * (x_split - x1) / (x2 - x1)
+    # Points lying on the antimeridian are their own split point.
+    return np.select([x_split == x1, x_split == x2], [y1, y2], latitude)
+
+
+def split_track(coords: np.ndarray, tolerance: float = 1e-6, great_circle: bool = False) -> List[np.ndarray]:
+    """
+    Cut an (n, 2) array of lon/lat points into pieces that stay on one side of the antimeridian.
+
+    Each crossing ends its piece at +/-180 on the side of the step's first point
+    and starts the next piece at the mirrored point. Points already on the
+    antimeridian are not duplicated, so a piece may be a single point.
+    """
+    x = coords[:, 0]
+    # Fast path: a track spanning less than 180 degrees cannot cross.
+    if len(coords) < 2 or np.ptp(x) <= 180 - tolerance:
+        return [coords]
+    crossings = np.flatnonzero(np.abs(np.diff(x)) > 180 - tolerance)
+    if not crossings.size:
+        return [coords]
+
+    y = coords[:, 1]
+    x1, x2 = x[crossings], x[crossings + 1]
+    x_split = np.where(x1 > 0, 180.0, -180.0)
+    y_split = split_latitudes(x1, y[crossings], x2, y[crossings + 1], x_split, great_circle)
+
+    pieces = np.split(coords, crossings + 1)
+    for i, (xs, ys) in enumerate(zip(x_split.tolist(), y_split.tolist())):
+        if tuple(pieces[i][-1]) != (xs, ys):
+            pieces[i] = np.vstack((pieces[i], (xs, ys)))
+        if tuple(pieces[i + 1][0]) != (-xs, ys):
+            pieces[i + 1] = np.vstack(((-xs, ys), pieces[i + 1]))
+    logger.debug("Split track of %d points at %d antimeridian crossings", len(coords), crossings.size)
+    return pieces
+
+
+def multilinestring_from_arrays(lines: List[np.ndarray]) -> MultiLineString:
+    """Build a MultiLineString from (n, 2) coordinate arrays via a single WKB buffer."""
+    wkb = [struct.pack('<BII', 1, 5, len(lines))]
+    for line in lines:
+        wkb.append(struct.pack('<BII', 1, 2, len(line)))
+        wkb.append(np.ascontiguousarray(line, dtype='<f8').tobytes())
+    return GEOSGeometry(memoryview(b''.join(wkb)))
+
+
+def handle_antimeridian_crossing(points: List[Point2D], tolerance: float = 1e-6, great_circle: bool = False) -> MultiLineString:
+    """Split a track into a MultiLineString wherever it crosses the antimeridian."""
+    if not len(points):
+        return MultiLineString()
+    coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    coords[:, 0] = wrap_longitude(coords[:, 0])
+    pieces = split_track(coords, tolerance, great_circle)
+    return multilinestring_from_arrays([piece for piece in pieces if len(piece) > 1])
+
+
+def create_multilinestring_route(points: List[Point2D], great_circle: bool = False) -> MultiLineString:
+    if len(points) < 2:
+        return MultiLineString()
+    return handle_antimeridian_crossing(points, great_circle=great_circle)
+
+
+def extend_route_path(path: Optional[MultiLineString], previous: Point2D, *points: Point2D, great_circle: bool = False) -> MultiLineString:
+    """
+    Append ``points`` to a route path whose last track point was ``previous``.
+
+    The result is exactly what :func:`create_multilinestring_route` returns for
+    the whole track, without revisiting the points before ``previous``.
+    """
+    lines = [np.asarray(line.coords, dtype=np.float64) for line in path] if path else []
+    step = np.array([previous, *points], dtype=np.float64)
+    step[:, 0] = wrap_longitude(step[:, 0])
+    first, *rest = split_track(step, great_circle=great_circle)
+    if len(first) > 1:
+        if lines and tuple(lines[-1][-1]) == tuple(first[0]):
+            lines[-1] = np.vstack((lines[-1], first[1:]))
+        else:
+            lines.append(first)
+    lines.extend(rest)
+    return multilinestring_from_arrays([line for line in lines if len(line) > 1])
+
+
+def simplify_path(path: MultiLineString, tolerance: float) -> MultiLineString:
+    """Douglas-Peucker simplification of each line of ``path``, in degrees."""
+    simplified = path.simplify(tolerance)
+    if not isinstance(simplified, MultiLineString):
+        simplified = MultiLineString(simplified, srid=path.srid)
+    return simplified
+
+
+def tolerance_for_zoom(zoom: int, tile_size: int = 256) -> float:
+    """Degrees of longitude covered by one pixel of a web map at ``zoom``."""
+    return 360 / (tile_size * 2 ** zoom)
+
+
+def bbox_polygon(min_lon: float, min_lat: float, max_lon: float, max_lat: float, margin: float = 0.01) -> Polygon:
+    """
+    A lon/lat box for filtering geography columns, widened by ``margin`` degrees.
+
+    Geography edges are great circles, which bow away from the parallels the
+    box means; vertices every degree along each parallel, plus the margin,
+    keep the polygon covering the whole box.
+    """
+    west, east = max(min_lon - margin, -180), min(max_lon + margin, 180)
+    south, north = max(min_lat - margin, -90), min(max_lat + margin, 90)
+    lons = np.linspace(west, east, max(int(np.ceil(east - west)), 1) + 1)
+    ring = (
+        [(lon, south) for lon in lons]
+        + [(lon, north) for lon in lons[::-1]]
+        + [(west, south)]
+    )
+    return Polygon(ring, srid=4326)
+
+
+def track_bounds(path: MultiLineString) -> Optional[Tuple[float, float, float, float]]:
+    """
+    The smallest (west, south, east, north) box holding ``path``.
+
+    Longitudes are taken round the shortest way, so a track across the
+    antimeridian gets a box with ``west`` greater than ``east``.
+    """
+    if not path:
+        return None
+    coords = np.concatenate([np.asarray(line.coords, dtype=np.float64) for line in path])
+    lons = np.unique(coords[:, 0] % 360)
+    # The box leaves out the widest stretch of longitude with no points in it.
+    gaps = np.diff(lons, append=lons[0] + 360)
+    widest = int(np.argmax(gaps))
+    west, east = (float(lon - 360 if lon > 180 else lon) for lon in (lons[(widest + 1) % len(lons)], lons[widest]))
+    if west == 180:
+        west = -180.0  # A box starting on the antimeridian starts from its western side.
+    return west, float(coords[:, 1].min()), east, float(coords[:, 1].max())
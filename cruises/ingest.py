@@ -0,0 +1,154 @@
+"""
+Bulk loading of position tracks.
+
+Track files are read in chunks. Each chunk is cleaned by the filters of
+:mod:`cruises.filters`, its ``coordinates`` are encoded in one vectorised pass,
+and the rows are streamed into the positions table with PostgreSQL ``COPY``.
+Route signals are held back for the whole load, so every cruise touched by
+the file has its route and segments rebuilt exactly once.
+"""
+import csv
+import logging
+from collections import Counter
+from itertools import islice
+from uuid import uuid4
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .caching import invalidate_responses
+from .filters import filter_track
+from .models import Position, deferred_route_updates
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10000
+
+COPY_FIELDS = ('position_id', 'cruise', 'date', 'time', 'lat', 'lon', 'coordinates')
+
+# Little-endian EWKB point carrying its SRID: byte order, type, srid, x, y.
+EWKB_POINT = np.dtype([('order', 'u1'), ('type', '<u4'), ('srid', '<u4'), ('x', '<f8'), ('y', '<f8')])
+EWKB_POINT_WITH_SRID = 0x20000001
+
+
+def encode_points(lon, lat, srid=4326):
+    """Hex EWKB for each lon/lat pair, or ``None`` where either is missing."""
+    points = np.empty(len(lon), dtype=EWKB_POINT)
+    points['order'] = 1
+    points['type'] = EWKB_POINT_WITH_SRID
+    points['srid'] = srid
+    points['x'] = lon
+    points['y'] = lat
+    encoded = points.tobytes().hex()
+    width = 2 * EWKB_POINT.itemsize
+    missing = np.isnan(lon) | np.isnan(lat)
+    return [
+        None if missing[i] else encoded[i * width:(i + 1) * width]
+        for i in range(len(points))
+    ]
+
+
+def parse_degrees(values):
+    """Parse a column of decimal degrees, rounded to what the model stores."""
+    parsed = np.array([(value or '').strip() or 'nan' for value in values], dtype=np.float64)
+    # Round through the six-decimal text the DecimalFields hold, so the
+    # coordinates match exactly what Position.save() would derive.
+    return np.char.mod('%.6f', parsed).astype(np.float64)
+
+
+def read_chunks(rows, chunk_size=CHUNK_SIZE):
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def last_fixes(cruise_ids):
+    """The latest stored fix with coordinates of each cruise, as (cruise_id, timestamp, lon, lat)."""
+    return (
+        Position.objects.filter(cruise_id__in=cruise_ids, lat__isnull=False, lon__isnull=False)
+        .order_by('cruise_id', '-timestamp', '-position_id')
+        .distinct('cruise_id')
+        .values_list('cruise_id', 'timestamp', 'lon', 'lat')
+    )
+
+
+def filter_rows(chunk, cruise_id=None):
+    """
+    The rows of ``chunk`` that pass the ingest filters, in their original
+    order, and a :class:`Counter` of the rows dropped by each filter.
+
+    The latest stored fix of each cruise goes through the filters with the
+    chunk, so fixes are compared with the track loaded before them.
+    """
+    if not chunk:
+        return chunk, Counter()
+    cruise_ids = [str(cruise_id or row.get('cruise') or row.get('cruise_id')) for row in chunk]
+    stored = list(last_fixes(set(cruise_ids)))
+    moments = [f"{row['date']}T{row['time']}" for row in chunk]
+    keep, dropped = filter_track(
+        np.array([str(fix[0]) for fix in stored] + cruise_ids),
+        np.r_[
+            np.array([fix[1].replace(tzinfo=None) for fix in stored], dtype='datetime64[us]'),
+            np.array(moments, dtype='datetime64[us]'),
+        ].astype(np.int64) / 1e6,
+        np.r_[[float(fix[2]) for fix in stored], parse_degrees([row.get('lon') for row in chunk])],
+        np.r_[[float(fix[3]) for fix in stored], parse_degrees([row.get('lat') for row in chunk])],
+        np.arange(len(stored) + len(chunk)) < len(stored),
+        max_speed=settings.INGEST_MAX_SPEED,
+        min_distance=settings.INGEST_MIN_DISTANCE,
+        min_interval=settings.INGEST_MIN_INTERVAL,
+    )
+    return [row for row, kept in zip(chunk, keep[len(stored):]) if kept], dropped
+
+
+def copy_positions(chunk, cruise_id=None):
+    """Write one chunk of CSV rows to the positions table, returning their cruise ids."""
+    lon = parse_degrees([row.get('lon') for row in chunk])
+    lat = parse_degrees([row.get('lat') for row in chunk])
+    coordinates = encode_points(lon, lat)
+    cruise_ids = [cruise_id or row.get('cruise') or row.get('cruise_id') for row in chunk]
+
+    table = connection.ops.quote_name(Position._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(Position._meta.get_field(name).column) for name in COPY_FIELDS
+    )
+    with connection.cursor() as cursor:
+        with cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+            for i, row in enumerate(chunk):
+                copy.write_row((
+                    row.get('position_id') or uuid4(),
+                    cruise_ids[i],
+                    row['date'],
+                    row['time'],
+                    None if np.isnan(lat[i]) else f'{lat[i]:.6f}',
+                    None if np.isnan(lon[i]) else f'{lon[i]:.6f}',
+                    coordinates[i],
+                ))
+    return cruise_ids
+
+
+def ingest_positions(file, cruise=None, chunk_size=CHUNK_SIZE, clean=True):
+    """
+    Load positions from a CSV file object and rebuild the routes it touches.
+
+    The file needs ``date``, ``time``, ``lat`` and ``lon`` columns, plus a
+    ``cruise`` (or ``cruise_id``) column unless ``cruise`` is given. A
+    ``position_id`` column is used when present; any ``coordinates`` column is
+    ignored and recomputed from ``lat``/``lon``. Rows are filtered first
+    unless ``clean`` is false. Returns a :class:`Counter` of rows loaded per
+    cruise id and one of rows dropped per filter.
+    """
+    loaded, dropped = Counter(), Counter()
+    cruise_id = str(cruise.pk) if cruise is not None else None
+    with deferred_route_updates() as touched:
+        with transaction.atomic():
+            for chunk in read_chunks(csv.DictReader(file), chunk_size):
+                if clean:
+                    chunk, chunk_dropped = filter_rows(chunk, cruise_id)
+                    dropped.update(chunk_dropped)
+                loaded.update(copy_positions(chunk, cruise_id))
+                logger.debug("Copied %d positions", len(chunk))
+            invalidate_responses(Position, cruise_ids=loaded)  # COPY sends no post_save signals
+        touched.update(loaded)
+    return loaded, dropped
@@ -0,0 +1,347 @@
+"""
+Timing and counting of where the API spends its time.
+
+:class:`InstrumentationMiddleware` records, for every request, the number of
+database queries and the time they took, the time spent in named spans and
+the size of the response body. The timings are sent back in a
+``Server-Timing`` header, so they show in the browser's network panel, and are
+added to the process's metrics, which ``/metrics`` serves in the Prometheus
+text format.
+
+Spans time hot paths by name: ``route-rebuild`` around
+:meth:`cruises.models.Route.update_route`, ``antimeridian-split`` and
+``segment-insert`` inside it, ``serialize`` around working out a
+serializer's ``data`` for a whole response. A span opened inside another of the same name is only counted once.
+Within a request the time of each span is added up and observed once at the
+end; elsewhere, in a Celery task say, each span is observed as it closes.
+
+Recording costs a few clock reads and dictionary updates per request. Each
+process keeps its metrics in memory and copies them to the default cache in a
+slot of its own at most every ``METRICS_FLUSH_INTERVAL`` seconds. ``/metrics``
+adds up the copies in every slot. A slot not refreshed for
+``METRICS_SLOT_TIMEOUT`` seconds is retired: its totals are folded into ones
+kept under ``RETIRED_KEY`` and the slot is reused by the next process to
+start. The slots so stay as many as the processes running, while the counters
+of a worker that went away stay in the sums, which never go down. A process
+idle for half the timeout leaves its slot to be retired and carries on in a
+new one with what it added since. Queries the async ORM makes for async views
+run on another thread's connection and are not counted; those streamed
+through :mod:`cruises.asyncdb` are.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PROCESS_COUNT_KEY = 'metrics:processes'
+RETIRED_KEY = 'metrics:retired'
+RETIRE_LOCK_KEY = 'metrics:retiring'
+
+# Upper bounds, in seconds, of the buckets of every duration histogram.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Methods counted under their own name; anything else is counted as "other".
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by view, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Time taken to build the response, by view.'),
+    'http_request_db_queries_total': ('counter', 'Database queries made while serving requests, by view.'),
+    'http_request_db_seconds_total': ('counter', 'Time spent in database queries while serving requests, by view.'),
+    'http_response_bytes_total': ('counter', 'Size of response bodies, by view; streamed responses are left out.'),
+    'span_duration_seconds': ('histogram', 'Time spent in a named span, per request or per call outside requests.'),
+}
+
+
+def process_key(slot):
+    return f'metrics:process:{slot}'
+
+
+def add_snapshot(total, snapshot):
+    """Add the counters and histograms of ``snapshot`` to those of ``total``."""
+    for key, value in snapshot['counters'].items():
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for key, values in snapshot['histograms'].items():
+        current = total['histograms'].get(key)
+        total['histograms'][key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+
+
+class Metrics:
+    """Counters and histograms of one process, keyed by metric name and label pairs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.slot = None
+        self.owner = uuid4().hex
+        self.flushed_at = 0
+        # The snapshot last copied to the slot, and when by the wall clock.
+        self.stored = None
+        self.stored_at = 0
+        self.counters = defaultdict(float)
+        # A count per bucket, the last one unbounded, followed by the sum of the values.
+        self.histograms = {}
+
+    def add(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[name, labels] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(DURATION_BUCKETS, value)] += 1
+            histogram[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {key: list(values) for key, values in self.histograms.items()},
+            }
+
+    def flush(self, force=False):
+        """Copy the metrics to the cache if ``METRICS_FLUSH_INTERVAL`` has passed since the last copy."""
+        now = time.monotonic()
+        if not force and now < self.flushed_at + settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed_at = now
+        try:
+            if self.slot is not None and time.time() > self.stored_at + settings.METRICS_SLOT_TIMEOUT / 2:
+                self.leave_slot()
+            snapshot = {**self.snapshot(), 'owner': self.owner, 'at': time.time()}
+            if self.slot is not None:
+                stored = cache.get(process_key(self.slot))
+                if stored is None or stored.get('owner') != self.owner:
+                    self.slot = None  # Lost from the cache, and maybe taken by another process since.
+            if self.slot is None:
+                self.slot = self.claim_slot(snapshot)
+            else:
+                cache.set(process_key(self.slot), snapshot, None)
+            self.stored, self.stored_at = snapshot, snapshot['at']
+        except Exception as e:
+            logger.error(f"Could not store metrics: {e}")
+
+    def leave_slot(self):
+        """
+        Give up a slot idle for long enough that it may be retired, keeping what was added since its last copy.
+
+        The slot is left alone from here, so the retired totals take in its
+        copy whole, and the process starts a new slot under a new owner.
+        """
+        with self.lock:
+            for key, value in self.stored['counters'].items():
+                self.counters[key] -= value
+            for key, values in self.stored['histograms'].items():
+                self.histograms[key] = [a - b for a, b in zip(self.histograms[key], values)]
+        self.slot, self.owner = None, uuid4().hex
+
+    def claim_slot(self, snapshot):
+        """Store ``snapshot`` in the first free slot, counted in ``PROCESS_COUNT_KEY``, and return it."""
+        retire_idle_slots()
+        slot = 1
+        while not cache.add(process_key(slot), snapshot, None):
+            slot += 1
+        cache.add(PROCESS_COUNT_KEY, 0, None)
+        while cache.get(PROCESS_COUNT_KEY, 0) < slot:
+            cache.incr(PROCESS_COUNT_KEY)
+        return slot
+
+
+metrics = Metrics()
+# A forked child (a Celery worker, say) starts with metrics and a cache key of its own.
+os.register_at_fork(after_in_child=metrics.reset)
+
+
+class RequestRecord:
+    """What one request has spent so far."""
+    __slots__ = ('queries', 'query_time', 'spans')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.spans = defaultdict(float)
+
+    def time_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self, elapsed):
+        entries = [f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items()]
+        entries.append(f'total;dur={elapsed * 1000:.1f}')
+        return ', '.join(entries)
+
+
+current_request = ContextVar('current_request', default=None)
+open_spans = ContextVar('open_spans', default=frozenset())
+
+
+@contextmanager
+def span(name):
+    """Time the block (or, as a decorator, the function) as the span ``name``."""
+    opened = open_spans.get()
+    if name in opened:
+        yield
+        return
+    token = open_spans.set(opened | {name})
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        open_spans.reset(token)
+        record = current_request.get()
+        if record is not None:
+            record.spans[name] += elapsed
+        elif settings.METRICS_ENABLED:
+            metrics.observe('span_duration_seconds', (('span', name),), elapsed)
+            metrics.flush()
+
+
+class InstrumentationMiddleware:
+    """Record what each request spends, add ``Server-Timing`` and update the metrics."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        record = RequestRecord()
+        token = current_request.set(record)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(record.time_query):
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, record, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = current_request.set(record)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, record, time.perf_counter() - start)
+
+    def finish(self, request, response, record, elapsed):
+        match = request.resolver_match
+        view = (('view', match.view_name if match else 'unresolved'),)
+        method = request.method if request.method in METHODS else 'other'
+        metrics.add('http_requests_total', view + (('method', method), ('status', str(response.status_code))))
+        metrics.observe('http_request_duration_seconds', view, elapsed)
+        metrics.add('http_request_db_queries_total', view, record.queries)
+        metrics.add('http_request_db_seconds_total', view, record.query_time)
+        if not response.streaming:
+            metrics.add('http_response_bytes_total', view, len(response.content))
+        for name, seconds in record.spans.items():
+            metrics.observe('span_duration_seconds', (('span', name),), seconds)
+        response['Server-Timing'] = record.server_timing(elapsed)
+        metrics.flush()
+        return response
+
+
+def retire_idle_slots():
+    """
+    Fold the slots not refreshed for ``METRICS_SLOT_TIMEOUT`` seconds into the retired totals, and free them.
+
+    One process retires at a time; the others skip it until their next call.
+    The retired totals list the owners folded in, so a slot folded but not
+    yet freed is not counted twice.
+    """
+    if not cache.add(RETIRE_LOCK_KEY, 1, 60):
+        return
+    try:
+        snapshots = cache.get_many([process_key(slot) for slot in range(1, cache.get(PROCESS_COUNT_KEY, 0) + 1)])
+        retired = cache.get(RETIRED_KEY) or {'counters': {}, 'histograms': {}, 'owners': set()}
+        idle = [
+            snapshot for snapshot in snapshots.values()
+            if snapshot['at'] < time.time() - settings.METRICS_SLOT_TIMEOUT and snapshot['owner'] not in retired['owners']
+        ]
+        for snapshot in idle:
+            add_snapshot(retired, snapshot)
+        # Owners whose slots are gone need not be listed any more.
+        retired['owners'] = (retired['owners'] | {snapshot['owner'] for snapshot in idle}) & {
+            snapshot['owner'] for snapshot in snapshots.values()
+        }
+        if idle:
+            cache.set(RETIRED_KEY, retired, None)
+        cache.delete_many([key for key, snapshot in snapshots.items() if snapshot['owner'] in retired['owners']])
+    finally:
+        cache.delete(RETIRE_LOCK_KEY)
+
+
+def collected_metrics():
+    """Counters and histograms added up over the retired totals and the copies of every process."""
+    metrics.flush(force=True)
+    retire_idle_slots()
+    count = cache.get(PROCESS_COUNT_KEY, 0)
+    stored = cache.get_many([RETIRED_KEY] + [process_key(slot) for slot in range(1, count + 1)])
+    retired = stored.pop(RETIRED_KEY, {'counters': {}, 'histograms': {}, 'owners': set()})
+    total = {'counters': defaultdict(float), 'histograms': {}}
+    add_snapshot(total, retired)
+    for snapshot in stored.values():
+        if snapshot['owner'] not in retired['owners']:
+            add_snapshot(total, snapshot)
+    return total['counters'], total['histograms']
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def render_metrics(counters, histograms):
+    """The Prometheus text exposition of ``counters`` and ``histograms``."""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        values = counters if kind == 'counter' else histograms
+        series = sorted(labels for metric, labels in values if metric == name)
+        if not series:
+            continue
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels in series:
+            if kind == 'counter':
+                lines.append(f'{name}{label_text(labels)} {counters[name, labels]}')
+                continue
+            *buckets, total = histograms[name, labels]
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{label_text(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{label_text(labels)} {total}')
+            lines.append(f'{name}_count{label_text(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,104 @@
+"""
+Live updates of cruise tracks, pushed to browsers as Server-Sent Events.
+
+When new positions of a cruise or a change to its route commit, one message
+is published on the cruise's Redis channel, already formatted as an event.
+Each ``/api/cruises/<id>/live/`` stream subscribes to that channel and passes
+the messages straight through. However many viewers and workers there are, a
+change costs one publish instead of a poll per viewer.
+
+Events:
+
+``positions``
+    ``{"features": [...]}``: new positions, as GeoJSON features shaped like
+    those of the positions endpoint.
+``extend``
+    ``{"coordinates": [[lon, lat], [lon, lat]]}``: a piece added to the end of
+    the route.
+``route``
+    ``{"path": ...}``: the whole route as a GeoJSON MultiLineString (or
+    ``null``), after any other change. It is simplified to the finest stored
+    level of detail.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import date, time
+from functools import cache
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.db import transaction
+
+from .streaming import position_feature
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds browsers wait before reconnecting a dropped stream.
+LIVE_RETRY = 5000
+
+
+def channel(cruise_id):
+    return f'cruise-live:{cruise_id}'
+
+
+@cache
+def redis_client():
+    return redis.Redis.from_url(settings.LIVE_REDIS_URL)
+
+
+def publish(cruise_id, event, data):
+    """Send ``event`` to the viewers of ``cruise_id`` once the current transaction commits."""
+    if not settings.LIVE_REDIS_URL:
+        return
+    message = f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+    transaction.on_commit(lambda: _publish(cruise_id, message))
+
+
+def _publish(cruise_id, message):
+    try:
+        redis_client().publish(channel(cruise_id), message)
+    except Exception as e:
+        logger.error(f"Could not publish live update for cruise {cruise_id}: {e}")
+
+
+def publish_positions(cruise_id, features):
+    publish(cruise_id, 'positions', {'features': features})
+
+
+def publish_rows(rows):
+    """Publish positions loaded from rows shaped as :func:`cruises.ingest.copy_positions` reads them."""
+    features = defaultdict(list)
+    for row in rows:
+        features[row['cruise']].append(position_feature(
+            row['position_id'], date.fromisoformat(row['date']), time.fromisoformat(row['time']),
+            row.get('lat') or None, row.get('lon') or None,
+        ))
+    for cruise_id, cruise_features in features.items():
+        publish_positions(cruise_id, cruise_features)
+
+
+def publish_route(route, appended=None):
+    """Publish a saved route: just the piece ``appended`` to its end if given, else the whole path."""
+    if not settings.LIVE_REDIS_URL:
+        return
+    if appended is not None:
+        publish(route.cruise_id, 'extend', {'coordinates': [list(point) for point in appended]})
+        return
+    path = route.path_at(min(settings.ROUTE_SIMPLIFY_TOLERANCES, default=None))
+    publish(route.cruise_id, 'route', {'path': json.loads(path.geojson) if path else None})
+
+
+async def event_stream(cruise_id):
+    """The Server-Sent Events text for ``cruise_id``, with a comment line whenever it is idle."""
+    async with redis.asyncio.from_url(settings.LIVE_REDIS_URL) as client:
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(channel(cruise_id))
+            yield f'retry: {LIVE_RETRY}\n\n'
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=settings.LIVE_KEEPALIVE)
+                yield message['data'] if message is not None else b': keepalive\n\n'
+        finally:
+            await pubsub.aclose()
@@ -0,0 +1,33 @@
+from datetime import datetime, time, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from cruises.archive import archive_cruises, finished_cruises, restore_cruises
+
+
+class Command(BaseCommand):
+    help = 'Move the positions of finished cruises to the archive table, or back with --restore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cruise_ids', nargs='*', help='Cruises to archive or restore')
+        parser.add_argument('--ended-before', help='Archive every cruise whose track ended before this date (YYYY-MM-DD)')
+        parser.add_argument('--restore', action='store_true', help='Move archived positions back and rebuild their routes')
+
+    def handle(self, *args, **kwargs):
+        cruise_ids = list(kwargs['cruise_ids'])
+        if kwargs['ended_before']:
+            if kwargs['restore']:
+                raise CommandError('--ended-before only selects cruises to archive')
+            day = parse_date(kwargs['ended_before'])
+            if day is None:
+                raise CommandError(f"Invalid date {kwargs['ended_before']}")
+            ended_before = datetime.combine(day, time(), tzinfo=timezone.utc)
+            cruise_ids += finished_cruises(ended_before).values_list('pk', flat=True)
+        if not cruise_ids:
+            raise CommandError('Give cruise ids or --ended-before')
+
+        if kwargs['restore']:
+            moved = restore_cruises(cruise_ids)
+            self.stdout.write(self.style.SUCCESS(f'Restored {moved} positions of {len(cruise_ids)} cruises'))
+        else:
+            moved = archive_cruises(cruise_ids)
+            self.stdout.write(self.style.SUCCESS(f'Archived {moved} positions of {len(cruise_ids)} cruises'))
@@ -0,0 +1,144 @@
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import django
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+from cruises.caching import CachedResponseMixin
+from cruises.geo import bbox_polygon
+from cruises.ingest import ingest_positions
+from cruises.models import Cruise, CruiseStatus, Route, Vessel
+from cruises.search import search_cruises
+from cruises.synthetic import copy_fixes, synthetic_track, write_fixes_csv
+from cruises.views import CruiseViewSet
+
+CASES = ('update_route', 'list', 'detail', 'import_csv', 'search')
+
+
+class UncachedCruiseViewSet(CruiseViewSet):
+    """The cruise endpoints without the response cache, so every run queries and serializes."""
+
+    def dispatch(self, request, *args, **kwargs):
+        return super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Time route rebuilds, cruise list and detail responses, CSV imports and route search on synthetic '
+        'cruises of increasing size, and write the timings as JSON (all changes are rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Positions in the cruise under test')
+        parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES), help='Paths to time')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case and size')
+        parser.add_argument('--catalogue', type=int, default=50, help='Background cruises of 1000 positions, for the list and search')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic tracks')
+        parser.add_argument('--output', default='-', help='File to write the JSON results to (default: standard output)')
+
+    def handle(self, *args, **kwargs):
+        self.rng = np.random.default_rng(kwargs['seed'])
+        self.factory = APIRequestFactory()
+        self.repeat = kwargs['repeat']
+        results = []
+        started = datetime.now(timezone.utc)
+        # Routes are rebuilt inline, so imports are timed with their rebuild.
+        with override_settings(ROUTE_REBUILD_ASYNC=False), transaction.atomic():
+            self.user = User.objects.create_user(username='benchmark', password='password')
+            self.vessel = Vessel.objects.create(vessel_name='Benchmark Vessel', vessel_desc='', vessel_credit_url='https://example.org')
+            self.status, _ = CruiseStatus.objects.get_or_create(name='Completed')
+            for index in range(kwargs['catalogue']):
+                self.make_cruise(f'Catalogue {index}', 1000).update_route()
+            for size in kwargs['sizes']:
+                route = self.make_cruise(f'Benchmark {size}', size)
+                route.update_route()
+                for case in kwargs['cases']:
+                    timings = getattr(self, f'time_{case}')(route, size)
+                    results.append({
+                        'case': case, 'size': size, 'runs': timings,
+                        'best': min(timings), 'median': statistics.median(timings),
+                    })
+                    self.stderr.write(f'{case:<13} {size:>9} positions  {min(timings) * 1000:10.1f} ms')
+            transaction.set_rollback(True)
+
+        report = {
+            'commit': git_commit(),
+            'started': started.isoformat(),
+            'seed': kwargs['seed'],
+            'repeat': self.repeat,
+            'catalogue': kwargs['catalogue'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'postgres': connection.pg_version,
+            'results': results,
+        }
+        if kwargs['output'] == '-':
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        else:
+            with open(kwargs['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+    def make_cruise(self, name, size):
+        cruise = Cruise.objects.create(
+            vessel=self.vessel, user=self.user, iso2_country='FJ', cruise_name=name, cruise_desc='',
+            cruise_website_url='https://example.org', cruise_doi_url='https://example.org', cruise_ship_name='Benchmark',
+            cruise_ship_flag='FJ', cruise_ship_url='https://example.org', cruise_ship_phone_contact='', status=self.status,
+        )
+        if size:
+            copy_fixes([cruise.pk], np.zeros(size, dtype=np.intp), *synthetic_track(size, self.rng))
+        return Route.objects.get(cruise=cruise)
+
+    def timed(self, func, setup=tuple):
+        """Seconds taken by each of ``repeat`` calls of ``func``, on the arguments ``setup`` returns untimed."""
+        timings = []
+        for _ in range(self.repeat):
+            args = setup()
+            started = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def time_update_route(self, route, size):
+        return self.timed(route.update_route)
+
+    def time_list(self, route, size):
+        view = UncachedCruiseViewSet.as_view({'get': 'list'})
+        return self.timed(lambda: view(self.factory.get('/api/cruises/')).render())
+
+    def time_detail(self, route, size):
+        view = UncachedCruiseViewSet.as_view({'get': 'retrieve'})
+        return self.timed(lambda: view(self.factory.get(f'/api/cruises/{route.cruise_id}/'), pk=route.cruise_id).render())
+
+    def time_import_csv(self, route, size):
+        with tempfile.NamedTemporaryFile('w+', suffix='.csv') as file:
+            write_fixes_csv(file, *synthetic_track(size, self.rng))
+
+            def fresh_cruise():
+                file.seek(0)
+                return (self.make_cruise(f'Import {size}', 0).cruise,)
+
+            return self.timed(lambda cruise: ingest_positions(file, cruise=cruise), setup=fresh_cruise)
+
+    def time_search(self, route, size):
+        # A two-degree box around the middle of the cruise's path, which the catalogue tracks cross too.
+        middle = route.path.coords[0][len(route.path.coords[0]) // 2] if route.path else (180, -15)
+        area = bbox_polygon(max(middle[0] - 1, -180), middle[1] - 1, min(middle[0] + 1, 180), middle[1] + 1)
+        return self.timed(lambda: list(search_cruises(area)))
@@ -0,0 +1,78 @@
+import logging
+import timeit
+
+import numpy as np
+from django.contrib.gis.geos import LineString, MultiLineString
+from django.core.management.base import BaseCommand
+from cruises.geo import handle_antimeridian_crossing
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_handle_antimeridian_crossing(points, tolerance=1e-6):
+    """The pure-Python splitter used before the NumPy version, kept as a reference."""
+    if not points:
+        return MultiLineString()
+
+    linestrings = []
+    current_linestring = [points[0]]
+
+    for i in range(1, len(points)):
+        prev_point = points[i - 1]
+        current_point = points[i]
+
+        logger.debug(f"Processing segment: {prev_point} to {current_point}")
+
+        if abs(prev_point[0] - current_point[0]) > 180 - tolerance:
+            x1, y1 = prev_point
+            x2, y2 = current_point
+            x_split = 180 if x1 > 0 else -180
+            y_split = y1 + (y2 - y1) * (x_split - x1) / (x2 - x1)
+
+            current_linestring.append((x_split, y_split))
+            linestrings.append(LineString(current_linestring))
+            current_linestring = [(-x_split, y_split), current_point]
+        else:
+            current_linestring.append(current_point)
+
+    linestrings.append(LineString(current_linestring))
+    result = MultiLineString(linestrings)
+    logger.debug(f"Resulting MultiLineString: {result}")
+    return result
+
+
+def pacific_transect(size, rng):
+    """A random walk eastwards from 140E that wraps across the antimeridian."""
+    lon = (140 + np.cumsum(rng.uniform(0, 100 / size, size)) + 180) % 360 - 180
+    lat = np.clip(-15 + np.cumsum(rng.normal(0, 0.01, size)), -89, 89)
+    return list(zip(lon.tolist(), lat.tolist()))
+
+
+def coastal_track(size, rng):
+    """A short meandering track that stays within a degree of Suva."""
+    lon = 178.4 + np.cumsum(rng.normal(0, 1 / size, size))
+    lat = -18.1 + np.cumsum(rng.normal(0, 1 / size, size))
+    return list(zip(lon.tolist(), lat.tolist()))
+
+
+class Command(BaseCommand):
+    help = 'Time the route splitter on Pacific transects and coastal tracks against the previous pure-Python version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Points per track')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per size; the best is reported')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic tracks')
+
+    def handle(self, *args, **kwargs):
+        rng = np.random.default_rng(kwargs['seed'])
+        splitters = (
+            ('linear', handle_antimeridian_crossing),
+            ('geodesic', lambda points: handle_antimeridian_crossing(points, great_circle=True)),
+            ('legacy', legacy_handle_antimeridian_crossing),
+        )
+        for track, make_track in (('transect', pacific_transect), ('coastal', coastal_track)):
+            for size in kwargs['sizes']:
+                points = make_track(size, rng)
+                for label, func in splitters:
+                    seconds = min(timeit.repeat(lambda: func(points), number=1, repeat=kwargs['repeat']))
+                    self.stdout.write(f'{track:<8} {size:>9} points  {label:<8} {seconds * 1000:10.2f} ms')
@@ -0,0 +1,64 @@
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import LineString
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from cruises.geo import create_multilinestring_route
+from cruises.models import POSITION_ORDERING, Cruise, Route, Segment, Vessel
+from cruises.synthetic import copy_fixes, synthetic_track
+
+
+def legacy_update_route(route):
+    """The row-by-row rebuild used before segments were bulk inserted, kept for comparison."""
+    positions = route.cruise.positions.order_by(*POSITION_ORDERING)
+    points = [(float(pos.lon), float(pos.lat)) for pos in positions if pos.lon is not None and pos.lat is not None]
+    route.path = create_multilinestring_route(points)
+    route.save(update_fields=['path'])
+    route.segments.all().delete()
+    for i in range(len(points) - 1):
+        segment_path = LineString([points[i], points[i + 1]])
+        Segment.objects.create(route=route, path=segment_path, start_position=positions[i], end_position=positions[i + 1])
+
+
+class Command(BaseCommand):
+    help = 'Time Route.update_route() on synthetic cruises of increasing size (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Positions per cruise')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per size; the best is reported')
+        parser.add_argument('--legacy', action='store_true', help='Also time the previous row-by-row segment insert')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic tracks')
+
+    def handle(self, *args, **kwargs):
+        rng = np.random.default_rng(kwargs['seed'])
+        with transaction.atomic():
+            user = User.objects.create_user(username='benchmark-routes', password='password')
+            vessel = Vessel.objects.create(vessel_name='Benchmark Vessel', vessel_desc='', vessel_credit_url='https://example.org')
+            for size in kwargs['sizes']:
+                route = self.make_route(user, vessel, size, rng)
+                self.report(size, 'bulk', self.best_of(kwargs['repeat'], route.update_route))
+                if kwargs['legacy']:
+                    self.report(size, 'legacy', self.best_of(kwargs['repeat'], lambda: legacy_update_route(route)))
+            transaction.set_rollback(True)
+
+    def make_route(self, user, vessel, size, rng):
+        cruise = Cruise.objects.create(
+            vessel=vessel, user=user, iso2_country='FJ', cruise_name=f'Benchmark {size}', cruise_desc='',
+            cruise_website_url='https://example.org', cruise_doi_url='https://example.org', cruise_ship_name='Benchmark',
+            cruise_ship_flag='FJ', cruise_ship_url='https://example.org', cruise_ship_phone_contact='',
+        )
+        copy_fixes([cruise.pk], np.zeros(size, dtype=np.intp), *synthetic_track(size, rng))
+        return Route.objects.get(cruise=cruise)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def report(self, size, label, seconds):
+        self.stdout.write(f'{size:>9} positions  {label:<6} {seconds * 1000:10.1f} ms')
@@ -1,180 +1,244 @@
-import random
+import csv
+import logging
 import os
-import requests
+import time
+from datetime import datetime, timezone
 from io import BytesIO
-from django.core.files import File
-from django.core.management.base import BaseCommand
+from uuid import uuid4
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from faker import Faker
-from cruises.models import Vessel, Cruise, CruiseStatus, Position, Leg, Scientist, RefList
-import logging
-from uuid import uuid4
+from PIL import Image, ImageDraw
+from cruises.caching import invalidate_responses
+from cruises.models import Cruise, CruiseStatus, Leg, Position, RefList, Route, Scientist, Vessel, deferred_route_updates
+from cruises.synthetic import copy_fixes, synthetic_track, write_fixes_csv
+from cruises.tiles import invalidate_tiles
 
 logger = logging.getLogger(__name__)
 
+# Row counts of each preset; --users, --vessels, --cruises and --positions override them.
+SCALES = {
+    'small': {'users': 10, 'vessels': 5, 'cruises': 10, 'positions': 10000},
+    'staging': {'users': 50, 'vessels': 40, 'cruises': 400, 'positions': 2000000},
+    'large': {'users': 200, 'vessels': 150, 'cruises': 2000, 'positions': 10000000},
+}
+STATUSES = ['Scheduled', 'In Progress', 'Completed']
+# Hull colours of the placeholder pictures, shared by all vessels and cruises.
+PLACEHOLDER_COLOURS = [(178, 34, 34), (25, 25, 112), (255, 140, 0), (47, 79, 79), (240, 240, 240)]
+PLACEHOLDER_SIZE = (800, 600)
+# Columns of each CSV file; the rows of the positions file are written by write_fixes_csv.
+CSV_FIELDS = {
+    'users': ('username', 'email'),
+    'statuses': ('name',),
+    'vessels': ('vessel_id', 'vessel_name', 'vessel_desc', 'vessel_picture', 'vessel_credit_url'),
+    'cruises': (
+        'cruise_id', 'vessel', 'user', 'status', 'iso2_country', 'cruise_name', 'cruise_desc', 'cruise_website_url',
+        'cruise_doi_url', 'cruise_ship_name', 'cruise_ship_flag', 'cruise_ship_url', 'cruise_ship_phone_contact',
+        'cruise_ship_email_contact', 'is_multi', 'img_vessel_path',
+    ),
+    'legs': ('cruise', 'leg_number', 'departure_port', 'return_port', 'start_date', 'end_date'),
+    'scientists': ('cruise', 'first_name', 'last_name', 'is_chief_scientist', 'email_contact', 'phone_contact'),
+    'ref_lists': ('list_type', 'list_desc'),
+}
+
+
+def placeholder_image(colour):
+    """A PNG of a ship with a ``colour`` hull on a plain sea."""
+    width, height = PLACEHOLDER_SIZE
+    image = Image.new('RGB', PLACEHOLDER_SIZE, (200, 225, 240))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, height * 2 // 3, width, height], fill=(0, 105, 148))
+    draw.rectangle([width * 2 // 5, height * 2 // 5, width * 3 // 5, height * 3 // 5], fill=(245, 245, 245))
+    draw.polygon([(width // 5, height * 3 // 5), (width * 4 // 5, height * 3 // 5),
+                  (width * 7 // 10, height * 3 // 4), (width * 3 // 10, height * 3 // 4)], fill=colour)
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def without(row, *names):
+    """``row`` less the keys that CSV rows hold as foreign keys."""
+    return {name: value for name, value in row.items() if name not in names}
+
+
 class Command(BaseCommand):
-    help = 'Generate fake data for models'
+    help = (
+        'Generate a fake but consistent dataset: users, vessels, cruises with legs and scientists, and '
+        'continuous synthetic tracks, loaded into the database with COPY or written out as CSV files'
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument('--vessels', type=int, default=5, help='Number of vessels to create')
-        parser.add_argument('--cruises', type=int, default=10, help='Number of cruises to create')
-        parser.add_argument('--positions', type=int, default=100, help='Number of positions to create')
+        parser.add_argument('--scale', choices=SCALES, default='small', help='Preset row counts')
+        parser.add_argument('--users', type=int, help='Number of users to create')
+        parser.add_argument('--vessels', type=int, help='Number of vessels to create')
+        parser.add_argument('--cruises', type=int, help='Number of cruises to create')
+        parser.add_argument('--positions', type=int, help='Number of positions to create, shared out between the cruises')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the names, counts and tracks')
+        parser.add_argument('--csv', metavar='DIR', help='Write CSV files and pictures to DIR instead of the database')
 
     def handle(self, *args, **kwargs):
+        counts = {name: kwargs[name] if kwargs[name] is not None else count for name, count in SCALES[kwargs['scale']].items()}
+        if counts['cruises'] and not (counts['users'] and counts['vessels']):
+            raise CommandError("Cruises need at least one user and one vessel.")
         fake = Faker()
-
-        # Retrieve command-line arguments
-        num_vessels = kwargs['vessels']
-        num_cruises = kwargs['cruises']
-        num_positions = kwargs['positions']
+        fake.seed_instance(kwargs['seed'])
+        rng = np.random.default_rng(kwargs['seed'])
+        started = time.perf_counter()
 
         try:
-            # Wrapping the entire process in a transaction to ensure atomicity
-            with transaction.atomic():
-                # Generate fake users
-                users = []
-                for _ in range(10):
-                    user = User.objects.create_user(
-                        username=fake.unique.user_name(),
-                        email=fake.unique.email(),
-                        password='password'
-                    )
-                    users.append(user)
-
-                # Generate fake vessels with improved image handling
-                vessels = []
-                for _ in range(num_vessels):
-                    vessel = Vessel.objects.create(
-                        vessel_name=fake.unique.company(),
-                        vessel_desc=fake.text(),
-                        vessel_credit_url=fake.url()
-                    )
-
-                    # Handle image download and save
-                    try:
-                        image_url = fake.image_url(width=800, height=600)
-                        response = requests.get(image_url, timeout=10, verify=False)  # Added timeout
-                        response.raise_for_status()  # Will raise an HTTPError for bad responses
-
-                        # Validate and save the image file
-                        img_name = f"{uuid4()}.jpg"  # Ensure unique filename
-                        if response.headers['Content-Type'] in ['image/jpeg', 'image/png']:
-                            vessel.vessel_picture.save(img_name, File(BytesIO(response.content)), save=True)
-                        else:
-                            logger.warning(f"Skipped unsupported image format for URL: {image_url}")
-
-                    except (requests.exceptions.RequestException, ValidationError) as e:
-                        logger.error(f"Error downloading or saving image for vessel: {e}")
-
-                    vessels.append(vessel)
-
-                # Generate fake cruise statuses with get_or_create
-                statuses = []
-                for status_name in ['Scheduled', 'In Progress', 'Completed']:
-                    status, created = CruiseStatus.objects.get_or_create(name=status_name)
-                    statuses.append(status)
-
-                # Generate fake cruises
-                cruises = []
-                for _ in range(num_cruises):
-                    cruise = Cruise.objects.create(
-                        vessel=random.choice(vessels),
-                        user=random.choice(users),
-                        iso2_country=fake.country_code(),
-                        cruise_name=fake.unique.catch_phrase()[:200],
-                        cruise_desc=fake.text(),
-                        cruise_website_url=fake.url(),
-                        cruise_doi_url=fake.url(),
-                        cruise_ship_name=fake.word()[:100],
-                        cruise_ship_flag=fake.country_code(),
-                        cruise_ship_url=fake.url(),
-                        cruise_ship_phone_contact=fake.phone_number(),
-                        cruise_ship_email_contact=fake.email(),
-                        is_multi=fake.boolean(),
-                        status=random.choice(statuses)
-                    )
-
-                    # Handle image download and save with the same improvements
-                    try:
-                        image_url = fake.image_url(width=800, height=600)
-                        response = requests.get(image_url, timeout=10)
-                        response.raise_for_status()
-
-                        # Validate and save the image file
-                        img_name = f"{uuid4()}.jpg"  # Ensure unique filename
-                        if response.headers['Content-Type'] in ['image/jpeg', 'image/png']:
-                            cruise.img_vessel_path.save(img_name, File(BytesIO(response.content)), save=True)
-                        else:
-                            logger.warning(f"Skipped unsupported image format for URL: {image_url}")
-
-                    except (requests.exceptions.RequestException, ValidationError) as e:
-                        logger.error(f"Error downloading or saving image for cruise: {e}")
-
-                    cruises.append(cruise)
-
-                # Generate fake positions using bulk_create for better performance
-                positions = []
-                for cruise in cruises:
-                    for _ in range(num_positions // len(cruises)):
-                        positions.append(Position(
-                            cruise=cruise,
-                            date=fake.date_this_decade(),
-                            time=fake.time(),
-                            lat=fake.latitude(),
-                            lon=fake.longitude()
-                        ))
-                Position.objects.bulk_create(positions)
-
-                # Generate fake legs with date validation to prevent overlapping
-                legs = []
-                for cruise in cruises:
-                    previous_end_date = None
-                    for i in range(random.randint(1, 5)):
-                        if previous_end_date:
-                            start_date = fake.date_between(start_date=previous_end_date)
-                        else:
-                            start_date = fake.date_this_year()
-
-                        end_date = fake.date_between(start_date=start_date, end_date='now')
-                        previous_end_date = end_date
-
-                        legs.append(Leg(
-                            cruise=cruise,
-                            leg_number=i + 1,
-                            departure_port=fake.city(),
-                            return_port=fake.city(),
-                            start_date=start_date,
-                            end_date=end_date
-                        ))
-                Leg.objects.bulk_create(legs)
-
-                # Generate fake scientists using bulk_create, without enforcing unique names
-                scientists = []
-                for cruise in cruises:
-                    for _ in range(random.randint(1, 10)):
-                        scientists.append(Scientist(
-                            cruise=cruise,
-                            first_name=fake.first_name(),
-                            last_name=fake.last_name(),
-                            is_chief_scientist=fake.boolean(),
-                            email_contact=fake.unique.email(),  # Unique emails, but not names
-                            phone_contact=fake.phone_number()
-                        ))
-                Scientist.objects.bulk_create(scientists)
-
-                # Generate fake reference lists using bulk_create
-                ref_lists = []
-                for _ in range(10):
-                    ref_lists.append(RefList(
-                        list_type=fake.unique.word(),
-                        list_desc=fake.sentence()
-                    ))
-                RefList.objects.bulk_create(ref_lists)
-
+            data = self.build(fake, rng, counts)
+            if kwargs['csv']:
+                self.write_csv(kwargs['csv'], data)
+            else:
+                self.load(data)
         except Exception as e:
             logger.error(f"Error during fake data generation: {e}")
             self.stdout.write(self.style.ERROR(f'Error during fake data generation: {e}'))
-
-        self.stdout.write(self.style.SUCCESS('Fake data generated successfully!'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(data['cruises'])} cruises with {len(data['seconds'])} positions "
+            f"in {time.perf_counter() - started:.1f} s"
+        ))
+
+    def build(self, fake, rng, counts):
+        """Every row of the dataset as plain values, with the keys that join them."""
+        pictures = [f'placeholder-{index}.png' for index in range(len(PLACEHOLDER_COLOURS))]
+        users = [{'username': f'{fake.user_name()}{index}', 'email': fake.email()} for index in range(counts['users'])]
+        vessels = [
+            {
+                'vessel_id': uuid4(),
+                'vessel_name': fake.company()[:200],
+                'vessel_desc': fake.text(),
+                'vessel_picture': f'vessel_images/{pictures[index % len(pictures)]}',
+                'vessel_credit_url': fake.url(),
+            }
+            for index in range(counts['vessels'])
+        ]
+
+        # Track lengths vary from cruise to cruise but add up to the positions asked for.
+        if counts['cruises']:
+            sizes = rng.multinomial(counts['positions'], rng.dirichlet(np.full(counts['cruises'], 2.0)))
+        else:
+            sizes = np.zeros(0, dtype=np.int64)
+        starts = rng.integers(1420070400, 1735689600, counts['cruises'])  # 2015 to 2024
+        cruises, legs, scientists, tracks = [], [], [], []
+        for index, size in enumerate(sizes.tolist()):
+            seconds, lon, lat = synthetic_track(
+                max(size, 1), rng, start_lon=rng.uniform(140, 200), start_lat=rng.uniform(-30, 10),
+                start=datetime.fromtimestamp(starts[index], timezone.utc),
+            )
+            tracks.append((seconds[:size], lon[:size], lat[:size]))
+            cruise_id = uuid4()
+            # Legs split the track into stretches of about equal time.
+            leg_count = int(rng.integers(1, 6))
+            bounds = np.linspace(seconds[0], seconds[-1], leg_count + 1).astype(np.int64).astype('datetime64[s]')
+            bounds = bounds.astype('datetime64[D]').tolist()
+            legs += [
+                {
+                    'cruise': cruise_id, 'leg_number': number + 1, 'departure_port': fake.city()[:50],
+                    'return_port': fake.city()[:50], 'start_date': bounds[number], 'end_date': bounds[number + 1],
+                }
+                for number in range(leg_count)
+            ]
+            scientists += [
+                {
+                    'cruise': cruise_id, 'first_name': fake.first_name(), 'last_name': fake.last_name(),
+                    'is_chief_scientist': number == 0, 'email_contact': fake.email(), 'phone_contact': fake.phone_number(),
+                }
+                for number in range(int(rng.integers(1, 11)))
+            ]
+            cruises.append({
+                'cruise_id': cruise_id,
+                'vessel': vessels[int(rng.integers(len(vessels)))]['vessel_id'],
+                'user': users[int(rng.integers(len(users)))]['username'],
+                'status': STATUSES[int(rng.integers(len(STATUSES)))],
+                'iso2_country': fake.country_code(),
+                'cruise_name': fake.catch_phrase()[:200],
+                'cruise_desc': fake.text(),
+                'cruise_website_url': fake.url(),
+                'cruise_doi_url': fake.url(),
+                'cruise_ship_name': fake.word()[:100],
+                'cruise_ship_flag': fake.country_code(),
+                'cruise_ship_url': fake.url(),
+                'cruise_ship_phone_contact': fake.phone_number()[:50],
+                'cruise_ship_email_contact': fake.email(),
+                'is_multi': leg_count > 1,
+                'img_vessel_path': f'cruise_images/{pictures[index % len(pictures)]}',
+            })
+        ref_lists = [{'list_type': fake.unique.word()[:10], 'list_desc': fake.sentence()[:50]} for _ in range(10)]
+        if tracks:
+            seconds, lon, lat = (np.concatenate(column) for column in zip(*tracks))
+        else:
+            seconds, lon, lat = np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+        return {
+            'pictures': pictures, 'users': users, 'vessels': vessels, 'cruises': cruises, 'legs': legs,
+            'scientists': scientists, 'ref_lists': ref_lists,
+            'track': np.repeat(np.arange(len(sizes)), sizes),
+            'seconds': seconds, 'lon': lon, 'lat': lat,
+        }
+
+    def load(self, data):
+        for folder in ('vessel_images', 'cruise_images'):
+            for name, colour in zip(data['pictures'], PLACEHOLDER_COLOURS):
+                if not default_storage.exists(f'{folder}/{name}'):
+                    default_storage.save(f'{folder}/{name}', ContentFile(placeholder_image(colour)))
+
+        cruise_ids = [cruise['cruise_id'] for cruise in data['cruises']]
+        with deferred_route_updates() as touched:
+            with transaction.atomic():
+                # One hash for every user: hashing is deliberately slow.
+                password = make_password('password')
+                User.objects.bulk_create((User(password=password, **user) for user in data['users']), ignore_conflicts=True)
+                user_ids = dict(User.objects.filter(username__in=[user['username'] for user in data['users']]).values_list('username', 'pk'))
+                status_ids = {name: CruiseStatus.objects.get_or_create(name=name)[0].pk for name in STATUSES}
+
+                Vessel.objects.bulk_create(Vessel(**vessel) for vessel in data['vessels'])
+                Cruise.objects.bulk_create(
+                    Cruise(
+                        vessel_id=cruise['vessel'], user_id=user_ids[cruise['user']], status_id=status_ids[cruise['status']],
+                        **without(cruise, 'vessel', 'user', 'status'),
+                    )
+                    for cruise in data['cruises']
+                )
+                # bulk_create sends no post_save, so the routes the signal would add are created here.
+                Route.objects.bulk_create(Route(cruise_id=cruise_id) for cruise_id in cruise_ids)
+                Leg.objects.bulk_create(Leg(cruise_id=leg['cruise'], **without(leg, 'cruise')) for leg in data['legs'])
+                Scientist.objects.bulk_create(
+                    Scientist(cruise_id=scientist['cruise'], **without(scientist, 'cruise')) for scientist in data['scientists']
+                )
+                RefList.objects.bulk_create(RefList(**ref_list) for ref_list in data['ref_lists'])
+
+                copy_fixes(cruise_ids, data['track'], data['seconds'], data['lon'], data['lat'])
+                invalidate_responses(User, Vessel, CruiseStatus, Cruise, Route, Leg, Scientist, Position)
+                invalidate_tiles()
+            touched.update(cruise_ids)
+
+    def write_csv(self, directory, data):
+        for folder in ('vessel_images', 'cruise_images'):
+            os.makedirs(os.path.join(directory, 'media', folder), exist_ok=True)
+            for name, colour in zip(data['pictures'], PLACEHOLDER_COLOURS):
+                with open(os.path.join(directory, 'media', folder, name), 'wb') as file:
+                    file.write(placeholder_image(colour))
+
+        statuses = [{'name': name} for name in STATUSES]
+        for name, rows in (
+            ('users', data['users']), ('statuses', statuses), ('vessels', data['vessels']), ('cruises', data['cruises']),
+            ('legs', data['legs']), ('scientists', data['scientists']), ('ref_lists', data['ref_lists']),
+        ):
+            with open(os.path.join(directory, f'{name}.csv'), 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=CSV_FIELDS[name])
+                writer.writeheader()
+                writer.writerows(rows)
+        with open(os.path.join(directory, 'positions.csv'), 'w', newline='') as file:
+            write_fixes_csv(
+                file, data['seconds'], data['lon'], data['lat'],
+                cruise_ids=[cruise['cruise_id'] for cruise in data['cruises']], track=data['track'],
+            )
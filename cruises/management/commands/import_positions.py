@@ -0,0 +1,35 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from cruises.ingest import CHUNK_SIZE, ingest_positions
+from cruises.models import Cruise
+
+
+class Command(BaseCommand):
+    help = 'Bulk load positions from a track CSV and rebuild each touched route once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV with date, time, lat, lon and cruise columns')
+        parser.add_argument('--cruise', help='Cruise ID to load every row into, instead of a cruise column')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows written per COPY batch')
+        parser.add_argument('--no-filter', action='store_true', help='Store every row, skipping the duplicate, speed and thinning filters')
+
+    def handle(self, *args, **kwargs):
+        cruise = None
+        if kwargs['cruise']:
+            try:
+                cruise = Cruise.objects.get(pk=kwargs['cruise'])
+            except (Cruise.DoesNotExist, ValidationError):
+                raise CommandError(f"Cruise {kwargs['cruise']} does not exist")
+
+        with open(kwargs['csv_file'], newline='', encoding='utf-8-sig') as file:
+            loaded, dropped = ingest_positions(
+                file, cruise=cruise, chunk_size=kwargs['chunk_size'], clean=not kwargs['no_filter']
+            )
+
+        for cruise_id, count in loaded.items():
+            self.stdout.write(f'{cruise_id}: {count} positions')
+        for reason, count in dropped.items():
+            self.stdout.write(f'Dropped {count} rows ({reason})')
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {sum(loaded.values())} positions into {len(loaded)} cruises'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from cruises.models import Route
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored levels of detail and summary statistics of routes from their saved paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('cruise_ids', nargs='*', help='Cruises to refresh; every route when omitted')
+
+    def handle(self, *args, **kwargs):
+        routes = Route.objects.order_by('pk')
+        if kwargs['cruise_ids']:
+            routes = routes.filter(cruise_id__in=kwargs['cruise_ids'])
+        refreshed = 0
+        for route in routes.iterator():
+            with transaction.atomic():
+                route.save_path()
+            refreshed += 1
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} routes'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:21
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0008_alter_segment_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tolerance', models.FloatField(verbose_name='Tolerance (degrees)')),
+                ('path', django.contrib.gis.db.models.fields.MultiLineStringField(geography=True, srid=4326)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='levels', to='cruises.route')),
+            ],
+            options={
+                'verbose_name': 'Route level of detail',
+                'verbose_name_plural': 'Route levels of detail',
+                'ordering': ['route', 'tolerance'],
+                'unique_together': {('route', 'tolerance')},
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0009_routelevel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='crossings',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Antimeridian Crossings'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='east',
+            field=models.FloatField(blank=True, editable=False, help_text='Less than west when the track crosses the antimeridian', null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='end_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='End Time'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='length',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Length (km)'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='max_gap',
+            field=models.DurationField(blank=True, editable=False, null=True, verbose_name='Longest Gap Between Fixes'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='mean_speed',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Mean Speed (knots)'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='n_points',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Number of fixes'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='north',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='south',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='start_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Start Time'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='west',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
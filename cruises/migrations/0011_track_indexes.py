@@ -0,0 +1,44 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:33
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0010_route_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leg',
+            index=models.Index(fields=['cruise', 'start_date'], name='leg_cruise_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['cruise', 'date', 'time', 'position_id'], name='position_track_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['-date', '-time'], name='position_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=django.contrib.postgres.indexes.GistIndex(django.db.models.functions.comparison.Cast('coordinates', django.contrib.gis.db.models.fields.GeometryField(srid=4326)), name='position_geometry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=django.contrib.postgres.indexes.GistIndex(django.db.models.functions.comparison.Cast('path', django.contrib.gis.db.models.fields.GeometryField(srid=4326)), name='route_path_geometry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scientist',
+            index=models.Index(fields=['cruise', 'last_name', 'first_name'], name='scientist_cruise_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='segment',
+            index=django.contrib.postgres.indexes.GistIndex(django.db.models.functions.comparison.Cast('path', django.contrib.gis.db.models.fields.GeometryField(srid=4326)), name='segment_path_geometry_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:37
+
+import cruises.models
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0011_track_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPosition',
+            fields=[
+                ('position_id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('timestamp', models.DateTimeField()),
+                ('lat', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('lon', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('coordinates', django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, spatial_index=False, srid=4326)),
+            ],
+            options={
+                'verbose_name': 'Archived position',
+                'verbose_name_plural': 'Archived positions',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='position',
+            name='position_track_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='position',
+            name='position_recent_idx',
+        ),
+        migrations.AddField(
+            model_name='position',
+            name='timestamp',
+            field=models.GeneratedField(db_persist=True, expression=cruises.models.AtUTC(django.db.models.expressions.CombinedExpression(models.F('date'), '+', models.F('time'), output_field=models.DateTimeField())), output_field=models.DateTimeField()),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['cruise', 'timestamp', 'position_id'], name='position_track_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['-timestamp'], name='position_recent_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedposition',
+            name='cruise',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_positions', to='cruises.cruise'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:56
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0012_position_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Export',
+            fields=[
+                ('export_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('parquet', 'GeoParquet'), ('netcdf', 'NetCDF (CF trajectories)')], max_length=10, verbose_name='Format')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', editable=False, max_length=10)),
+                ('file', models.FileField(blank=True, editable=False, max_length=1000, upload_to='exports/')),
+                ('rows', models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='Positions')),
+                ('error', models.TextField(blank=True, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('cruises', models.ManyToManyField(blank=True, help_text='Every cruise when left empty', related_name='exports', to='cruises.cruise')),
+            ],
+            options={
+                'verbose_name': 'Export',
+                'verbose_name_plural': 'Exports',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
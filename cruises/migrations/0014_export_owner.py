@@ -0,0 +1,41 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:37
+
+import os
+import shutil
+
+import cruises.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_export_files(apps, schema_editor):
+    # Files written before exports had their own root were public under MEDIA_ROOT.
+    Export = apps.get_model('cruises', 'Export')
+    for name in Export.objects.exclude(file='').values_list('file', flat=True):
+        old, new = os.path.join(settings.MEDIA_ROOT, name), os.path.join(settings.EXPORT_ROOT, name)
+        if os.path.exists(old):
+            os.makedirs(os.path.dirname(new), exist_ok=True)
+            shutil.move(old, new)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0013_export'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='user',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exports', to=settings.AUTH_USER_MODEL, verbose_name='Started by'),
+        ),
+        migrations.AlterField(
+            model_name='export',
+            name='file',
+            field=models.FileField(blank=True, editable=False, max_length=1000, storage=cruises.models.ExportStorage(), upload_to='exports/'),
+        ),
+        migrations.RunPython(move_export_files, migrations.RunPython.noop),
+    ]
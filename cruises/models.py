@@ -1,62 +1,37 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models as gis_models
-from django.contrib.gis.geos import Point, MultiLineString, LineString
-from django.db import models, transaction  # Added import for transaction
+from django.contrib.gis.geos import Point, LineString
+from django.db import connection, models, transaction  # Added import for transaction
+from django.contrib.postgres.indexes import GistIndex
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F, Func, Q, QuerySet
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import Cast
 from django_countries.fields import CountryField
+from django.utils.deconstruct import deconstructible
 from django.utils.html import mark_safe
 from uuid import uuid4
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from typing import List, Tuple
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
 import logging
+import os
+import threading
+from .geo import create_multilinestring_route, extend_route_path, simplify_path, track_bounds
+from .instrumentation import span
 
 logger = logging.getLogger(__name__)
 
-def handle_antimeridian_crossing(points: List[Tuple[float, float]], tolerance: float = 1e-6) -> MultiLineString:
-    if not points:
-        return MultiLineString()
+# Positions are ordered along a track by time; the primary key breaks ties so
+# incremental updates and full rebuilds always agree on the sequence.
+POSITION_ORDERING = ('timestamp', 'position_id')
 
-    def wrap_longitude(lon):
-        if lon > 180:
-            return lon - 360
-        elif lon < -180:
-            return lon + 360
-        return lon
+# Rows per INSERT when a route's segments are recreated.
+SEGMENT_BATCH_SIZE = 2000
 
-    linestrings = []
-    current_linestring = [points[0]]
-
-    for i in range(1, len(points)):
-        prev_point = points[i - 1]
-        current_point = points[i]
-
-        logger.debug(f"Processing segment: {prev_point} to {current_point}")
-
-        if abs(prev_point[0] - current_point[0]) > 180 - tolerance:  # Check for antimeridian crossing
-            x1, y1 = prev_point
-            x2, y2 = current_point
-            x_split = 180 if x1 > 0 else -180  # Determine which side of the antimeridian the split occurs
-
-            # Calculate y (latitude) of the split point using interpolation
-            y_split = y1 + (y2 - y1) * (x_split - x1) / (x2 - x1)  
-
-            current_linestring.append((x_split, y_split))  # Add the split point
-            linestrings.append(LineString(current_linestring))
-
-            # Start a new linestring segment with the other split point
-            current_linestring = [(-x_split, y_split), current_point]  
-        else:
-            current_linestring.append(current_point)
-
-    linestrings.append(LineString(current_linestring))
-    result = MultiLineString(linestrings)
-    logger.debug(f"Resulting MultiLineString: {result}")
-    return result
-
-def create_multilinestring_route(points: List[Tuple[float, float]]) -> MultiLineString:
-    if len(points) < 2:
-        return MultiLineString()
-    return handle_antimeridian_crossing(points)
+METRES_PER_NAUTICAL_MILE = 1852
 
 class Vessel(models.Model):
     vessel_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
@@ -127,22 +102,54 @@ def create_route_for_cruise(sender, instance, created, **kwargs):
     if created and not Route.objects.filter(cruise=instance).exists():
         Route.objects.create(cruise=instance)
 
+class AtUTC(Func):
+    """A timestamp without time zone read as UTC; immutable, so usable in generated columns."""
+    template = "(%(expressions)s) AT TIME ZONE 'UTC'"
+    output_field = models.DateTimeField()
+
 class Position(models.Model):
     position_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     cruise = models.ForeignKey(Cruise, on_delete=models.CASCADE, related_name='positions')
     date = models.DateField()
     time = models.TimeField()
+    # Computed by the database, so rows written with COPY or bulk_create get it too.
+    timestamp = models.GeneratedField(
+        expression=AtUTC(CombinedExpression(F('date'), '+', F('time'), output_field=models.DateTimeField())),
+        output_field=models.DateTimeField(),
+        db_persist=True,
+    )
     lat = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     lon = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     coordinates = gis_models.PointField(geography=True, blank=True, null=True, spatial_index=True)
 
+    class Meta:
+        indexes = [
+            # Track order within a cruise (POSITION_ORDERING), for route rebuilds and the positions endpoint.
+            models.Index(fields=['cruise', 'timestamp', 'position_id'], name='position_track_idx'),
+            # Time ranges across all cruises, and newest first as the admin lists them.
+            models.Index(fields=['-timestamp'], name='position_recent_idx'),
+            # Vector tiles select on the coordinates as geometry, which the geography index cannot serve.
+            GistIndex(Cast('coordinates', gis_models.GeometryField(srid=4326)), name='position_geometry_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.lon is not None and self.lat is not None:
             self.coordinates = Point(float(self.lon), float(self.lat), srid=4326)
         else:
             self.coordinates = None
+        # An UPDATE does not read generated columns back, so keep this copy current here.
+        self.timestamp = fix_timestamp(self.date, self.time)
         super().save(*args, **kwargs)
 
+    @property
+    def on_track(self):
+        """Whether the position has coordinates and so belongs to the route."""
+        return self.lat is not None and self.lon is not None
+
+    @property
+    def point(self):
+        return (float(self.lon), float(self.lat))
+
     @property
     def coordinates_changed(self):
         """Check if coordinates have been modified since the last save."""
@@ -151,12 +158,160 @@ class Position(models.Model):
         original = Position.objects.get(pk=self.pk)
         return original.coordinates != self.coordinates
 
+class ArchivedPosition(models.Model):
+    """
+    A position of a finished cruise moved out of the live positions table.
+
+    Rows are moved here and back whole by :mod:`cruises.archive`; the columns
+    match :class:`Position` one for one.
+    """
+    position_id = models.UUIDField(primary_key=True, editable=False)
+    cruise = models.ForeignKey(Cruise, on_delete=models.CASCADE, related_name='archived_positions')
+    date = models.DateField()
+    time = models.TimeField()
+    timestamp = models.DateTimeField()
+    lat = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    lon = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    coordinates = gis_models.PointField(geography=True, blank=True, null=True, spatial_index=False)
+
+    class Meta:
+        verbose_name = "Archived position"
+        verbose_name_plural = "Archived positions"
+
+def fix_timestamp(day, moment):
+    """The UTC timestamp of a position's ``date`` and ``time``, as stored in ``timestamp``."""
+    day = Position._meta.get_field('date').to_python(day)
+    moment = Position._meta.get_field('time').to_python(moment)
+    if day is None or moment is None:
+        return None
+    return datetime.combine(day, moment, tzinfo=dt_timezone.utc)
+
+def precedes(position):
+    """Filter for positions that come before ``position`` in track order."""
+    return Q(timestamp__lt=position.timestamp) | Q(timestamp=position.timestamp, position_id__lt=position.pk)
+
+def follows(position):
+    """Filter for positions that come after ``position`` in track order."""
+    return Q(timestamp__gt=position.timestamp) | Q(timestamp=position.timestamp, position_id__gt=position.pk)
+
+def at_or_after(moment, prefix=''):
+    """
+    Filter for positions recorded at or after the aware datetime ``moment``.
+
+    ``prefix`` is the lookup path to the position from the filtered model.
+    """
+    return Q(**{f'{prefix}timestamp__gte': moment})
+
+def at_or_before(moment, prefix=''):
+    """Filter for positions recorded at or before the aware datetime ``moment``; see :func:`at_or_after`."""
+    return Q(**{f'{prefix}timestamp__lte': moment})
+
+_deferred = threading.local()
+
+@contextmanager
+def deferred_route_updates():
+    """
+    Hold back route updates triggered by position changes inside the block.
+
+    Every cruise whose positions are saved or deleted is collected instead, and
+    its route is updated exactly once when the block exits cleanly (queued in
+    the background when ``ROUTE_REBUILD_ASYNC`` is on). The yielded
+    set can also be fed cruise ids directly by loaders that bypass the signals;
+    such loaders only ever add positions. Routes of cruises that only gained
+    positions are extended with :meth:`Route.append_positions` when it can,
+    and rebuilt otherwise.
+    """
+    if getattr(_deferred, 'cruise_ids', None) is not None:
+        yield _deferred.cruise_ids  # Nested blocks share the outermost one.
+        return
+    _deferred.cruise_ids = cruise_ids = set()
+    _deferred.changed = changed = set()
+    try:
+        yield cruise_ids
+    finally:
+        _deferred.cruise_ids = _deferred.changed = None
+    from .tasks import queue_route_rebuild  # tasks imports this module
+    for cruise_id in Cruise.objects.filter(pk__in=cruise_ids).values_list('pk', flat=True):
+        full = str(cruise_id) in changed
+        if settings.ROUTE_REBUILD_ASYNC:
+            queue_route_rebuild(cruise_id, full=full)
+        else:
+            route, _ = Route.objects.get_or_create(cruise_id=cruise_id)
+            if full or not route.append_positions():
+                route.update_route()
+
+def route_updates_inline():
+    """Whether position signals update routes themselves, on the calling thread."""
+    return getattr(_deferred, 'cruise_ids', None) is None and not settings.ROUTE_REBUILD_ASYNC
+
+def route_update_deferred(cruise_id, added=False):
+    """
+    Hand the route update for ``cruise_id`` off instead of doing it inline.
+
+    Inside :func:`deferred_route_updates` the cruise is recorded for the rebuild
+    at the end of the block; otherwise, with ``ROUTE_REBUILD_ASYNC`` on, a
+    coalesced background rebuild is queued. ``added`` tells that the change
+    only added a position, which the update may append to the route.
+    """
+    cruise_ids = getattr(_deferred, 'cruise_ids', None)
+    if cruise_ids is not None:
+        cruise_ids.add(cruise_id)
+        if not added:
+            _deferred.changed.add(str(cruise_id))
+        return True
+    if settings.ROUTE_REBUILD_ASYNC:
+        from .tasks import queue_route_rebuild  # tasks imports this module
+        queue_route_rebuild(cruise_id, full=not added)
+        return True
+    return False
+
 @receiver(post_save, sender=Position)
-def update_route_on_position_save(sender, instance, created, **kwargs):
-    cruise = instance.cruise
-    if not Route.objects.filter(cruise=cruise).exists():
-        Route.objects.create(cruise=cruise)
-    cruise.route.update_route()
+def update_route_on_position_save(sender, instance, created, raw=False, **kwargs):
+    if raw or route_update_deferred(instance.cruise_id, added=created):
+        return
+    route, _ = Route.objects.get_or_create(cruise_id=instance.cruise_id)
+    route.apply_position(instance)
+
+@receiver(post_save, sender=Position)
+def publish_new_position(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    from .live import publish_positions  # live is loaded lazily, as tasks is
+    from .streaming import position_feature
+    day, moment = (Position._meta.get_field(name).to_python(getattr(instance, name)) for name in ('date', 'time'))
+    publish_positions(instance.cruise_id, [position_feature(instance.pk, day, moment, instance.lat, instance.lon)])
+
+@receiver(pre_delete, sender=Position)
+def remember_route_neighbours(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, Position) or not route_updates_inline():
+        return
+    # The segments around the position cascade away with it, so note its
+    # neighbours now to be able to join them once it is gone.
+    instance._route_neighbours = (
+        next((s.start_position for s in instance.end_segments.select_related('start_position')), None),
+        next((s.end_position for s in instance.start_segments.select_related('end_position')), None),
+    )
+
+@receiver(post_delete, sender=Position)
+def update_route_on_position_delete(sender, instance, origin=None, **kwargs):
+    bulk = isinstance(origin, QuerySet) and origin.model is Position
+    if not (bulk or isinstance(origin, Position)):
+        return  # The whole cruise is being deleted along with its route.
+    if route_update_deferred(instance.cruise_id):
+        return
+    if bulk:
+        # Neighbours may be deleted in the same batch; rebuild each cruise once.
+        rebuilt = origin.__dict__.setdefault('_rebuilt_cruise_ids', set())
+        if instance.cruise_id in rebuilt:
+            return
+        rebuilt.add(instance.cruise_id)
+    route = Route.objects.filter(cruise_id=instance.cruise_id).first()
+    if route is None:
+        return
+    if bulk:
+        route.update_route()
+    else:
+        route.remove_position(*instance._route_neighbours)
 
 class Leg(models.Model):
     leg_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
@@ -169,6 +324,7 @@ class Leg(models.Model):
 
     class Meta:
         ordering = ['start_date']
+        indexes = [models.Index(fields=['cruise', 'start_date'], name='leg_cruise_start_idx')]
         verbose_name = "Leg"
         verbose_name_plural = "Legs"
 
@@ -178,44 +334,283 @@ class Leg(models.Model):
 class Route(models.Model):
     cruise = models.OneToOneField(Cruise, on_delete=models.CASCADE, related_name="route")
     path = gis_models.MultiLineStringField(geography=True, blank=True, null=True)
-
+    # Summary of the track, kept up to date whenever the path is saved.
+    length = models.FloatField(null=True, blank=True, editable=False, verbose_name="Length (km)")
+    n_points = models.PositiveIntegerField(default=0, editable=False, verbose_name="Number of fixes")
+    start_time = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Start Time")
+    end_time = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="End Time")
+    max_gap = models.DurationField(null=True, blank=True, editable=False, verbose_name="Longest Gap Between Fixes")
+    mean_speed = models.FloatField(null=True, blank=True, editable=False, verbose_name="Mean Speed (knots)")
+    crossings = models.PositiveIntegerField(default=0, editable=False, verbose_name="Antimeridian Crossings")
+    west = models.FloatField(null=True, blank=True, editable=False)
+    south = models.FloatField(null=True, blank=True, editable=False)
+    east = models.FloatField(null=True, blank=True, editable=False, help_text="Less than west when the track crosses the antimeridian")
+    north = models.FloatField(null=True, blank=True, editable=False)
+
+    def track_positions(self):
+        """Positions of the cruise that carry coordinates, in track order."""
+        return Position.objects.filter(
+            cruise_id=self.cruise_id, lat__isnull=False, lon__isnull=False
+        ).order_by(*POSITION_ORDERING)
+
+    @span('route-rebuild')
     def update_route(self):
+        """Rebuild the path and every segment from all positions of the cruise."""
         try:
-            positions = self.cruise.positions.order_by('date', 'time')
-            points = [(float(pos.lon), float(pos.lat)) for pos in positions if pos.lon is not None and pos.lat is not None]
-
-            if not points:
-                logger.warning(f"No valid positions found for cruise {self.cruise}")
-                return
-
-            self.path = create_multilinestring_route(points)
-            self.save(update_fields=['path'])  # Save only the path field to avoid recursion
-
-            self.segments.all().delete()  # Clear existing segments
-
-            # Create segments
-            for i in range(len(points) - 1):
-                start_position = positions[i]
-                end_position = positions[i + 1]
-                segment_path = LineString([points[i], points[i + 1]])
-                Segment.objects.create(route=self, path=segment_path, start_position=start_position, end_position=end_position)
+            positions = list(self.track_positions().only('position_id', 'lat', 'lon'))
+            points = [pos.point for pos in positions]
+
+            with transaction.atomic():
+                if not points:
+                    logger.warning(f"No valid positions found for cruise {self.cruise}")
+                    self.path = None
+                    self.save_path()
+                    self.segments.all().delete()
+                    return
+
+                with span('antimeridian-split'):
+                    self.path = create_multilinestring_route(points)
+                self.save_path()
+
+                self.segments.all().delete()  # Clear existing segments in a single DELETE
+
+                # Create segments from one pass over consecutive positions
+                with span('segment-insert'):
+                    Segment.objects.bulk_create(
+                        (
+                            Segment(route=self, path=LineString([start_point, end_point]), start_position=start_position, end_position=end_position)
+                            for start_position, end_position, start_point, end_point
+                            in zip(positions, positions[1:], points, points[1:])
+                        ),
+                        batch_size=SEGMENT_BATCH_SIZE,
+                    )
 
         except Exception as e:
             logger.error(f"Error updating route for cruise {self.cruise}: {e}")
 
+    def save_path(self, appended=None):
+        """
+        Save the path alone, along with its simplified levels of detail.
+
+        ``appended`` is the last point the path had followed by the points
+        added after it, when that is all that changed, and is what live viewers
+        are sent. The path,
+        levels and summary are written in one transaction, so cached responses
+        and tiles are only invalidated once all of them are in place.
+        """
+        from .live import publish_route
+        from .tiles import invalidate_tiles
+
+        if appended is not None:
+            changed = [track_bounds([LineString(appended)])]
+        else:
+            changed = [(self.west, self.south, self.east, self.north) if self.west is not None else None, track_bounds(self.path)]
+        with transaction.atomic():
+            self.save(update_fields=['path'])  # Save only the path field to avoid recursion
+            invalidate_tiles(*changed)
+            self.levels.all().delete()
+            if self.path:
+                RouteLevel.objects.bulk_create(
+                    RouteLevel(route=self, tolerance=tolerance, path=simplify_path(self.path, tolerance))
+                    for tolerance in settings.ROUTE_SIMPLIFY_TOLERANCES
+                )
+            self.refresh_summary()
+        publish_route(self, appended)
+
+    def refresh_summary(self):
+        """
+        Recompute the summary columns from the saved path and the track positions.
+
+        The bounding box and crossings come from the path in memory; the length
+        (``ST_Length`` on the geography) and the time statistics are worked out
+        and stored by the database in a single ``UPDATE``.
+        """
+        self.west, self.south, self.east, self.north = track_bounds(self.path) or (None,) * 4
+        self.crossings = len(self.path) - 1 if self.path else 0
+        table = connection.ops.quote_name(Route._meta.db_table)
+        positions = connection.ops.quote_name(Position._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                WITH track AS (
+                    SELECT "timestamp" AS fixed_at,
+                           LAG("timestamp") OVER (ORDER BY "timestamp", position_id) AS previous_at
+                    FROM {positions}
+                    WHERE cruise_id = %(cruise)s AND lat IS NOT NULL AND lon IS NOT NULL
+                ), summary AS (
+                    SELECT COUNT(*) AS n_points, MIN(fixed_at) AS start_time, MAX(fixed_at) AS end_time,
+                           MAX(fixed_at - previous_at) AS max_gap
+                    FROM track
+                )
+                UPDATE {table} SET
+                    length = ST_Length(path) / 1000,
+                    n_points = summary.n_points,
+                    start_time = summary.start_time,
+                    end_time = summary.end_time,
+                    max_gap = summary.max_gap,
+                    mean_speed = ST_Length(path) / {METRES_PER_NAUTICAL_MILE}
+                        / NULLIF(EXTRACT(EPOCH FROM summary.end_time - summary.start_time) / 3600, 0),
+                    crossings = %(crossings)s,
+                    west = %(west)s, south = %(south)s, east = %(east)s, north = %(north)s
+                FROM summary
+                WHERE id = %(route)s
+                RETURNING length, {table}.n_points, {table}.start_time, {table}.end_time, {table}.max_gap, mean_speed
+            """, {
+                'cruise': self.cruise_id, 'route': self.pk, 'crossings': self.crossings,
+                'west': self.west, 'south': self.south, 'east': self.east, 'north': self.north,
+            })
+            (self.length, self.n_points, self.start_time, self.end_time, self.max_gap, self.mean_speed) = cursor.fetchone()
+
+    def path_at(self, tolerance=None):
+        """
+        The route path simplified to at most ``tolerance`` degrees.
+
+        Returns the coarsest stored level within the tolerance, or the full path
+        when no level is fine enough. Prefetch ``levels`` when serializing many.
+        """
+        levels = [level for level in self.levels.all() if tolerance and level.tolerance <= tolerance]
+        if not levels:
+            return self.path
+        return max(levels, key=lambda level: level.tolerance).path
+
+    def refresh_path(self):
+        """Recompute only the path, leaving the segments untouched."""
+        points = [(float(lon), float(lat)) for lon, lat in self.track_positions().values_list('lon', 'lat')]
+        with span('antimeridian-split'):
+            self.path = create_multilinestring_route(points) if points else None
+        self.save_path()
+
+    def link_positions(self, start_position, end_position):
+        """Create the segment joining two consecutive positions of the track."""
+        if start_position is None or end_position is None:
+            return None
+        segment_path = LineString([start_position.point, end_position.point])
+        return Segment.objects.create(route=self, path=segment_path, start_position=start_position, end_position=end_position)
+
+    def apply_position(self, position):
+        """
+        Splice a saved position into the route, touching only its neighbour segments.
+
+        Appending a fix after the last one extends the path in place. Inserting,
+        moving or dropping a fix replaces the one or two segments around it and
+        recomputes the path. A save that changes the order of the track, or finds
+        the stored segments out of step with the positions, falls back to a full
+        :meth:`update_route`.
+        """
+        touching = Segment.objects.filter(
+            Q(start_position=position) | Q(end_position=position)
+        ).select_related('start_position', 'end_position')
+        old_previous = old_next = None
+        for segment in touching:
+            if segment.route_id != self.pk:
+                # The position was moved to another cruise.
+                segment.route.update_route()
+                return self.update_route()
+            if segment.end_position_id == position.pk:
+                old_previous = segment.start_position
+            else:
+                old_next = segment.end_position
+        was_linked = old_previous is not None or old_next is not None
+
+        if not position.on_track:
+            if was_linked:
+                touching.delete()
+                self.link_positions(old_previous, old_next)
+            self.refresh_path()
+            return
+
+        track = self.track_positions()
+        previous = track.filter(precedes(position)).last()
+        following = track.filter(follows(position)).first()
+
+        if was_linked:
+            if (old_previous, old_next) != (previous, following):
+                return self.update_route()
+            ends = [s.path[-1] if s.end_position_id == position.pk else s.path[0] for s in touching if s.path]
+            if len(ends) == len(touching) and all(end == position.point for end in ends):
+                # Saved without moving, though its time may have changed.
+                from .caching import invalidate_responses  # caching is loaded lazily, as tasks is
+                self.refresh_summary()
+                invalidate_responses(Route, cruise_ids=[self.cruise_id])  # The summary is updated with raw SQL.
+                return
+            touching.delete()
+        elif previous is not None and following is not None:
+            deleted, _ = self.segments.filter(start_position=previous, end_position=following).delete()
+            if not deleted:
+                return self.update_route()
+        elif previous is not None and (
+            self.path[-1][-1] == previous.point if self.path else not track.filter(precedes(previous)).exists()
+        ):
+            self.link_positions(previous, position)
+            self.path = extend_route_path(self.path, previous.point, position.point)
+            self.save_path(appended=(previous.point, position.point))
+            return
+
+        self.link_positions(previous, position)
+        self.link_positions(position, following)
+        self.refresh_path()
+
+    @span('route-append')
+    def append_positions(self):
+        """
+        Extend the route with the positions recorded after its last one, without reloading the track.
+
+        Returns whether it could. It cannot when the route has no segments yet
+        or no longer ends at its last linked position, or when positions were
+        added anywhere but after the end of the track; the route is then left
+        for :meth:`update_route`. Positions that were moved or deleted go
+        unnoticed, so this is only for updates that follow additions.
+        """
+        track = self.track_positions().only('position_id', 'timestamp', 'lat', 'lon')
+        last = track.filter(end_segments__route=self).last()
+        if last is None or not self.path or self.path[-1][-1] != last.point:
+            return False
+        positions = list(track.filter(follows(last)))
+        if self.n_points + len(positions) != track.count():
+            return False
+        if not positions:
+            return True
+        points = [position.point for position in positions]
+        with transaction.atomic():
+            Segment.objects.bulk_create(
+                (
+                    Segment(route=self, path=LineString([start_point, end_point]), start_position=start_position, end_position=end_position)
+                    for start_position, end_position, start_point, end_point
+                    in zip([last, *positions], positions, [last.point, *points], points)
+                ),
+                batch_size=SEGMENT_BATCH_SIZE,
+            )
+            with span('antimeridian-split'):
+                self.path = extend_route_path(self.path, last.point, *points)
+            self.save_path(appended=(last.point, *points))
+        return True
+
+    def remove_position(self, previous, following):
+        """Close the gap left by a deleted position between its two neighbours."""
+        self.link_positions(previous, following)
+        self.refresh_path()
+
     class Meta:
         ordering = ['cruise']
+        indexes = [GistIndex(Cast('path', gis_models.GeometryField(srid=4326)), name='route_path_geometry_idx')]
         verbose_name = "Route"
         verbose_name_plural = "Routes"
 
     def __str__(self):
         return f"Route for {self.cruise.cruise_name}"
 
-@receiver(post_save, sender=Position)
-def update_route_on_position_save(sender, instance, created, **kwargs):
-    cruise = instance.cruise
-    route = cruise.route
-    route.update_route()
+class RouteLevel(models.Model):
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='levels')
+    tolerance = models.FloatField(verbose_name="Tolerance (degrees)")
+    path = gis_models.MultiLineStringField(geography=True)
+
+    class Meta:
+        ordering = ['route', 'tolerance']
+        unique_together = ['route', 'tolerance']
+        verbose_name = "Route level of detail"
+        verbose_name_plural = "Route levels of detail"
+
+    def __str__(self):
+        return f"{self.route} simplified to {self.tolerance} degrees"
 
 class Segment(models.Model):
     segment_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
@@ -227,6 +622,7 @@ class Segment(models.Model):
 
     class Meta:
         ordering = ['segment_id']
+        indexes = [GistIndex(Cast('path', gis_models.GeometryField(srid=4326)), name='segment_path_geometry_idx')]
 
     def __str__(self):
         return f"Segment from {self.start_position} to {self.end_position}"
@@ -236,6 +632,17 @@ class Segment(models.Model):
             self.path = LineString([self.start_position.coordinates, self.end_position.coordinates])
         super().save(*args, **kwargs)
 
+@receiver([post_save, post_delete])
+def invalidate_cached_responses(sender, instance, raw=False, **kwargs):
+    if raw or sender not in (Vessel, CruiseStatus, Cruise, Position, Leg, Route, Scientist):
+        return
+    from .caching import invalidate_responses  # caching is loaded lazily, as tasks is
+    if sender in (Vessel, CruiseStatus):
+        invalidate_responses(sender)  # Shared by any number of cruises.
+    else:
+        invalidate_responses(sender, cruise_ids=[instance.pk if sender is Cruise else instance.cruise_id])
+
+
 class Scientist(models.Model):
     scientist_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     cruise = models.ForeignKey(Cruise, on_delete=models.CASCADE, related_name='scientists', verbose_name="Associated Cruise")
@@ -247,6 +654,7 @@ class Scientist(models.Model):
 
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [models.Index(fields=['cruise', 'last_name', 'first_name'], name='scientist_cruise_name_idx')]
         verbose_name = "Scientist"
         verbose_name_plural = "Scientists"
 
@@ -265,3 +673,59 @@ class RefList(models.Model):
 
     def __str__(self):
         return f"{self.list_type} - {self.list_desc}"
+
+@deconstructible
+class ExportStorage(FileSystemStorage):
+    """
+    Export files, kept under ``EXPORT_ROOT`` rather than ``MEDIA_ROOT``.
+
+    They have no public URL; the export's download view serves them to the
+    user who started it.
+    """
+
+    @property
+    def base_location(self):
+        return settings.EXPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+class Export(models.Model):
+    """A file of positions written by :mod:`cruises.export`, in the background for large requests."""
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('parquet', 'GeoParquet'),
+        ('netcdf', 'NetCDF (CF trajectories)'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    export_id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, verbose_name="Format")
+    cruises = models.ManyToManyField(Cruise, blank=True, related_name='exports', help_text="Every cruise when left empty")
+    user = models.ForeignKey(
+        User, null=True, blank=True, on_delete=models.SET_NULL, related_name='exports', editable=False, verbose_name="Started by",
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', editable=False)
+    file = models.FileField(upload_to='exports/', storage=ExportStorage(), blank=True, editable=False, max_length=1000)
+    rows = models.PositiveBigIntegerField(null=True, blank=True, editable=False, verbose_name="Positions")
+    error = models.TextField(blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Export"
+        verbose_name_plural = "Exports"
+
+    def __str__(self):
+        return f"{self.get_format_display()} export of {self.created_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,79 @@
+from base64 import b64decode, b64encode
+from datetime import datetime
+from uuid import UUID
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import POSITION_ORDERING, Position, follows
+
+
+class CruiseCursorPagination(CursorPagination):
+    """Stable, cursor-based pages of cruises ordered by name."""
+    ordering = ('cruise_name', 'cruise_id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class PositionKeysetPagination(BasePagination):
+    """
+    Pages of positions in track order, keyed on (timestamp, position_id).
+
+    The cursor holds the key of the last position served, so each page is a
+    range scan from there however deep into the track it is.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 1000
+    page_size_query_param = 'page_size'
+    max_page_size = 10000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def page_queryset(self, queryset, request):
+        """The positions of the requested page, plus one to tell whether another follows."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(follows(self.decode_cursor(cursor)))
+        return queryset.order_by(*POSITION_ORDERING)[:self.page_size + 1]
+
+    def set_page(self, page):
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([position async for position in self.page_queryset(queryset, request)])
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, position):
+        key = f'{position.timestamp.isoformat()}|{position.pk}'
+        return b64encode(key.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            moment, pk = b64decode(cursor.encode(), validate=True).decode().split('|')
+            return Position(timestamp=datetime.fromisoformat(moment), position_id=UUID(pk))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
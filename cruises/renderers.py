@@ -0,0 +1,15 @@
+import msgpack
+from rest_framework.renderers import BaseRenderer
+
+from .tracks import TRACK_MEDIA_TYPE
+
+
+class TrackRenderer(BaseRenderer):
+    """msgpack for the binary track format of :mod:`cruises.tracks`."""
+    media_type = TRACK_MEDIA_TYPE
+    format = 'track'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return msgpack.packb(data, use_bin_type=True)
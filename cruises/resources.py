@@ -1,5 +1,5 @@
 from import_export import resources
-from .models import Vessel, CruiseStatus, Cruise, Position, Leg, Scientist
+from .models import Vessel, CruiseStatus, Cruise, Position, Leg, Scientist, deferred_route_updates
 
 class VesselResource(resources.ModelResource):
     class Meta:
@@ -19,6 +19,14 @@ class PositionResource(resources.ModelResource):
         import_id_fields = ['position_id']
         fields = ('position_id', 'cruise', 'date', 'time', 'lat', 'lon', 'coordinates')
 
+    def import_data(self, dataset, dry_run=False, *args, **kwargs):
+        # Rebuild each imported cruise's route once, not once per row.
+        with deferred_route_updates() as cruise_ids:
+            result = super().import_data(dataset, dry_run, *args, **kwargs)
+            if dry_run:
+                cruise_ids.clear()
+        return result
+
 class LegResource(resources.ModelResource):
     class Meta:
         model = Leg
@@ -0,0 +1,68 @@
+"""
+Spatial and temporal search over cruise tracks.
+
+A search area is matched against the stored routes first, so only cruises
+whose whole path comes near it are looked at, and then against their
+segments, which carry the times of the two positions they join. Both path
+columns are geography with GiST indexes, so each step is an index scan.
+Cruises are ranked by how long their track spent in the area.
+"""
+from django.contrib.gis.measure import D
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Min, Sum
+
+from .models import Route, Segment, at_or_after, at_or_before
+
+SEARCH_LIMIT = 100
+SEARCH_MAX_LIMIT = 1000
+
+
+def near(area, distance=None):
+    """Lookup keyword arguments matching paths within ``distance`` metres of ``area``."""
+    if distance:
+        return {'path__dwithin': (area, D(m=distance))}
+    return {'path__intersects': area}
+
+
+def search_cruises(area, distance=None, start=None, end=None, country=None, status=None, limit=SEARCH_LIMIT):
+    """
+    Cruises whose track passed through ``area`` (within ``distance`` metres, if
+    given) between the aware datetimes ``start`` and ``end``.
+
+    Returns one dict per cruise, most time in the area first, with the first
+    and last time the track was there and how many segments matched.
+    """
+    routes = Route.objects.filter(**near(area, distance))
+    if country:
+        routes = routes.filter(cruise__iso2_country=country.upper())
+    if status:
+        routes = routes.filter(cruise__status__name__iexact=status)
+
+    segments = Segment.objects.filter(route__in=routes.values('pk'), **near(area, distance))
+    if start is not None:
+        segments = segments.filter(at_or_after(start, prefix='end_position__'))
+    if end is not None:
+        segments = segments.filter(at_or_before(end, prefix='start_position__'))
+
+    matches = (
+        segments.values('route__cruise_id', 'route__cruise__cruise_name')
+        .annotate(
+            entered=Min('start_position__timestamp'),
+            left=Max('end_position__timestamp'),
+            time_inside=Sum(
+                ExpressionWrapper(F('end_position__timestamp') - F('start_position__timestamp'), output_field=DurationField())
+            ),
+            segments=Count('pk'),
+        )
+        .order_by(F('time_inside').desc(nulls_last=True), 'route__cruise__cruise_name')[:limit]
+    )
+    return [
+        {
+            'cruise_id': match['route__cruise_id'],
+            'cruise_name': match['route__cruise__cruise_name'],
+            'first_seen': match['entered'],
+            'last_seen': match['left'],
+            'hours_inside': match['time_inside'].total_seconds() / 3600 if match['time_inside'] is not None else None,
+            'segments': match['segments'],
+        }
+        for match in matches
+    ]
@@ -1,6 +1,60 @@
-from rest_framework_gis.serializers import GeoFeatureModelSerializer
+from rest_framework_gis.fields import GeometrySerializerMethodField
+from rest_framework_gis.serializers import GeoFeatureModelListSerializer, GeoFeatureModelSerializer
 from rest_framework import serializers
-from .models import Cruise, Leg, Scientist, Vessel, CruiseStatus, Position, Route
+from rest_framework.reverse import reverse
+from .instrumentation import span
+from .models import Cruise, Export, Leg, Scientist, Vessel, CruiseStatus, Position, Route
+
+def split_param(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+class DynamicFieldsMixin:
+    """
+    Let clients choose a serializer's fields from the query string.
+
+    ``?fields=a,b`` keeps only the named fields. Fields listed in
+    ``Meta.expandable_fields`` are heavy and left out unless requested through
+    ``?expand=`` or ``?fields=``, or by the view through an ``expand`` entry in
+    the serializer context.
+    """
+
+    @classmethod
+    def selected_fields(cls, field_names, query_params, expand=()):
+        fields = split_param(query_params.get('fields'))
+        expand = set(expand) | split_param(query_params.get('expand'))
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))
+        selected = [name for name in field_names if name not in expandable or name in expand | fields]
+        if fields:
+            selected = [name for name in selected if name in fields | expand]
+        return selected
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        query_params = request.query_params if request is not None else {}
+        selected = self.selected_fields(list(self.fields), query_params, self.context.get('expand', ()))
+        for name in set(self.fields) - set(selected):
+            self.fields.pop(name)
+
+class TimedSerializerMixin:
+    """
+    Count the time spent working out ``data`` as the ``serialize`` span.
+
+    Only the serializer a view reads ``data`` from is timed, once for the whole
+    page, not every instance and nested serializer in it; serializers used with
+    ``many=True`` need a timed ``list_serializer_class`` for that.
+    """
+
+    @property
+    def data(self):
+        with span('serialize'):
+            return super().data
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+class TimedGeoFeatureListSerializer(TimedSerializerMixin, GeoFeatureModelListSerializer):
+    pass
 
 class VesselSerializer(serializers.ModelSerializer):
     vessel_picture_url = serializers.SerializerMethodField()
@@ -20,42 +74,77 @@ class LegSerializer(serializers.ModelSerializer):
         model = Leg
         fields = ['leg_number', 'departure_port', 'return_port', 'start_date', 'end_date']
 
-class ScientistSerializer(serializers.ModelSerializer):
+class ScientistSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Scientist
+        list_serializer_class = TimedListSerializer
         fields = ['first_name', 'last_name']
 
-class PositionSerializer(GeoFeatureModelSerializer):
+class PositionSerializer(TimedSerializerMixin, GeoFeatureModelSerializer):
     class Meta:
         model = Position
+        list_serializer_class = TimedGeoFeatureListSerializer
         geo_field = "coordinates"
         fields = ('position_id', 'date', 'time', 'lat', 'lon', 'coordinates')
 
-class RouteSerializer(GeoFeatureModelSerializer):
+class RouteSerializer(TimedSerializerMixin, GeoFeatureModelSerializer):
+    # Simplified to the ``simplify`` tolerance in the context, if the view set one.
+    path = GeometrySerializerMethodField()
+
     class Meta:
         model = Route
+        list_serializer_class = TimedGeoFeatureListSerializer
         geo_field = "path"
-        fields = ('path',)
+        fields = ('cruise', 'path')
+
+    def get_path(self, obj):
+        return obj.path_at(self.context.get('simplify'))
+
+class RouteSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Route
+        list_serializer_class = TimedListSerializer
+        fields = (
+            'length', 'n_points', 'start_time', 'end_time', 'max_gap', 'mean_speed', 'crossings',
+            'west', 'south', 'east', 'north',
+        )
 
-class CruiseSerializer(serializers.ModelSerializer):
+class CruiseSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     legs = LegSerializer(many=True, read_only=True)
     scientists = ScientistSerializer(many=True, read_only=True)
     positions = PositionSerializer(many=True, read_only=True)
     route = RouteSerializer(read_only=True)
+    track_summary = RouteSummarySerializer(source='route', read_only=True)
     status_name = serializers.SerializerMethodField()
     vessel_details = VesselSerializer(source='vessel', read_only=True)
 
     class Meta:
         model = Cruise
+        list_serializer_class = TimedListSerializer
         fields = [
             'cruise_id', 'iso2_country', 'cruise_name', 'legs', 'scientists',
-            'status_name', 'vessel_details', 'positions', 'route'
+            'status_name', 'vessel_details', 'track_summary', 'positions', 'route'
         ]
+        expandable_fields = ['positions', 'route']
 
     def get_status_name(self, obj):
         return obj.status.name if obj.status else None
 
-class CruiseStatusSerializer(serializers.ModelSerializer):
+class CruiseStatusSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CruiseStatus
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name']
+
+class ExportSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Export
+        fields = ['export_id', 'format', 'cruises', 'status', 'rows', 'error', 'created_at', 'finished_at', 'download_url']
+
+    def get_download_url(self, obj):
+        request = self.context.get('request')
+        if obj.status == 'done' and obj.file:
+            return reverse('export-download', args=[obj.pk], request=request)
+        return None
@@ -0,0 +1,123 @@
+"""
+Streamed position exports.
+
+Positions are read through a server-side cursor and written out as they
+arrive, either as one GeoJSON FeatureCollection or as newline-delimited
+GeoJSON features, so a track of any length passes through a worker a chunk at
+a time. Features match what :class:`~cruises.serializers.PositionSerializer`
+produces.
+
+:func:`astream_positions` does the same for views served under ASGI, reading
+the rows on the event loop through :func:`cruises.asyncdb.stream_rows`. Under
+ASGI Django would read a plain iterator into memory before sending any of it.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+
+from .asyncdb import stream_rows
+from .models import POSITION_ORDERING
+
+STREAM_CHUNK_SIZE = 2000
+
+STREAM_FORMATS = {
+    'geojson': 'application/geo+json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def position_feature(position_id, day, moment, lat, lon):
+    """The GeoJSON feature of one position, given its column values."""
+    on_track = lat is not None and lon is not None
+    return {
+        'id': str(position_id),
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [float(lon), float(lat)]} if on_track else None,
+        'properties': {
+            'date': day.isoformat(),
+            'time': moment.isoformat(),
+            'lat': str(lat) if lat is not None else None,
+            'lon': str(lon) if lon is not None else None,
+        },
+    }
+
+
+def position_rows(queryset):
+    """The column values :func:`position_feature` takes, for each position of ``queryset`` in track order."""
+    return queryset.order_by(*POSITION_ORDERING).values_list('position_id', 'date', 'time', 'lat', 'lon')
+
+
+def position_features(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """GeoJSON feature text for each position of ``queryset``, in track order."""
+    for row in position_rows(queryset).iterator(chunk_size=chunk_size):
+        yield json.dumps(position_feature(*row), separators=(',', ':'))
+
+
+def batched(items, separator='', size=STREAM_CHUNK_SIZE):
+    """Join items into larger writes, so the response is not sent a feature at a time."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield separator.join(batch)
+            batch = []
+    if batch:
+        yield separator.join(batch)
+
+
+def geojson_stream(queryset):
+    yield '{"type":"FeatureCollection","features":['
+    separator = ''
+    for batch in batched(position_features(queryset), separator=','):
+        yield separator + batch
+        separator = ','
+    yield ']}'
+
+
+def ndjson_stream(queryset):
+    yield from batched(feature + '\n' for feature in position_features(queryset))
+
+
+def streaming_response(content, stream_format, filename=None):
+    response = StreamingHttpResponse(content, content_type=STREAM_FORMATS[stream_format])
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{stream_format}"'
+    return response
+
+
+def stream_positions(queryset, stream_format, filename=None):
+    """A streaming response of ``queryset`` in one of :data:`STREAM_FORMATS`."""
+    stream = geojson_stream if stream_format == 'geojson' else ndjson_stream
+    return streaming_response(stream(queryset), stream_format, filename)
+
+
+async def abatched(items, separator='', size=STREAM_CHUNK_SIZE):
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield separator.join(batch)
+            batch = []
+    if batch:
+        yield separator.join(batch)
+
+
+async def ageojson_stream(rows):
+    yield '{"type":"FeatureCollection","features":['
+    separator = ''
+    async for batch in abatched((json.dumps(position_feature(*row), separators=(',', ':')) async for row in rows), ','):
+        yield separator + batch
+        separator = ','
+    yield ']}'
+
+
+async def andjson_stream(rows):
+    async for batch in abatched(json.dumps(position_feature(*row), separators=(',', ':')) + '\n' async for row in rows):
+        yield batch
+
+
+async def astream_positions(queryset, stream_format, filename=None):
+    """:func:`stream_positions` for async views; raises :class:`~cruises.asyncdb.PoolExhausted` before responding."""
+    rows = await stream_rows(position_rows(queryset))
+    stream = ageojson_stream if stream_format == 'geojson' else andjson_stream
+    return streaming_response(stream(rows), stream_format, filename)
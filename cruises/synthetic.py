@@ -0,0 +1,166 @@
+"""
+Synthetic cruise tracks for benchmarks and test databases.
+
+Tracks are dead-reckoned in whole NumPy arrays from a seeded random generator,
+so the same seed always gives the same tracks. A ship sails east at a steady
+speed with its heading swinging slowly either side, its speed wandering a
+little and a few metres of GPS noise on every fix. Unless told where to start,
+a track is placed with its middle on the antimeridian, so every track crosses
+it at least once and long ones cross many times.
+
+:func:`copy_fixes` writes generated fixes to the positions table without
+building a Python object per row: the rows are packed into a NumPy structured
+array in PostgreSQL's binary ``COPY`` format, streamed into a temporary table,
+and moved across with one ``INSERT ... SELECT`` that rounds the coordinates
+the way :meth:`cruises.models.Position.save` stores them.
+"""
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from django.db import connection, transaction
+
+from .filters import EARTH_RADIUS, KNOT
+from .models import Position
+
+TRACK_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Tracks fold back from these latitudes rather than sailing over a pole.
+LATITUDE_LIMIT = 70
+# Standard deviation of the GPS noise added to each fix, in metres.
+GPS_NOISE = 5
+
+# Rows packed per write while copying.
+COPY_CHUNK = 100000
+
+# One row of the binary COPY into the staging table: its field count, then the
+# length and big-endian value of each field.
+STAGED_ROW = np.dtype([
+    ('fields', '>i2'),
+    ('position_id_length', '>i4'), ('position_id', 'u1', 16),
+    ('cruise_length', '>i4'), ('cruise', 'u1', 16),
+    ('date_length', '>i4'), ('date', '>i4'),
+    ('time_length', '>i4'), ('time', '>i8'),
+    ('lon_length', '>i4'), ('lon', '>f8'),
+    ('lat_length', '>i4'), ('lat', '>f8'),
+])
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + bytes(8)
+COPY_TRAILER = b'\xff\xff'
+# PostgreSQL counts dates in days from 2000-01-01.
+POSTGRES_EPOCH_DAYS = 10957
+
+
+def fold(values, limit):
+    """Reflect ``values`` back into -limit..limit, as a ball bouncing between two walls."""
+    folded = (values + limit) % (4 * limit)
+    return np.where(folded > 2 * limit, 4 * limit - folded, folded) - limit
+
+
+def synthetic_track(size, rng, interval=60, speed=10, start_lon=None, start_lat=-15, start=TRACK_START):
+    """
+    ``size`` fixes of a ship reporting every ``interval`` seconds at about ``speed`` knots.
+
+    Returns the fix times in epoch seconds and the longitudes and latitudes,
+    rounded to the six decimals positions store.
+    """
+    steps = np.arange(size)
+    # Swings of about 35 degrees either side of east, over a few hundred to a few thousand fixes.
+    phase = 2 * np.pi * steps / rng.uniform(500, 5000) + rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.01, size))
+    heading = np.radians(90 + 35 * np.sin(phase) + rng.normal(0, 3, size))
+    distance = speed * KNOT * interval * rng.uniform(0.9, 1.1, size)
+    distance[0] = 0
+    lat = fold(start_lat + np.degrees(np.cumsum(distance * np.cos(heading)) / EARTH_RADIUS), LATITUDE_LIMIT)
+    lon = np.cumsum(np.degrees(distance * np.sin(heading) / (EARTH_RADIUS * np.cos(np.radians(lat)))))
+    lon += 180 - lon[-1] / 2 if start_lon is None else start_lon
+
+    noise = np.degrees(rng.normal(0, GPS_NOISE, (2, size)) / EARTH_RADIUS)
+    lat = np.clip(lat + noise[1], -90, 90)
+    lon = (lon + noise[0] / np.cos(np.radians(lat)) + 180) % 360 - 180
+    seconds = int(start.timestamp()) + steps * interval
+    return seconds, np.round(lon, 6), np.round(lat, 6)
+
+
+def random_uuids(count):
+    """``count`` random version 4 UUIDs, as rows of 16 bytes."""
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = raw[:, 6] & 0x0F | 0x40
+    raw[:, 8] = raw[:, 8] & 0x3F | 0x80
+    return raw
+
+
+def staged_rows(position_ids, cruises, seconds, lon, lat):
+    rows = np.empty(len(seconds), dtype=STAGED_ROW)
+    rows['fields'] = 6
+    rows['position_id_length'] = rows['cruise_length'] = 16
+    rows['date_length'] = 4
+    rows['time_length'] = rows['lon_length'] = rows['lat_length'] = 8
+    rows['position_id'] = position_ids
+    rows['cruise'] = cruises
+    rows['date'] = seconds // 86400 - POSTGRES_EPOCH_DAYS
+    rows['time'] = seconds % 86400 * 1000000
+    rows['lon'] = lon
+    rows['lat'] = lat
+    return rows
+
+
+def copy_fixes(cruise_ids, track, seconds, lon, lat, chunk_size=COPY_CHUNK):
+    """
+    Write fixes to the positions table; returns the number of rows written.
+
+    ``track`` gives the index into ``cruise_ids`` of the cruise each fix
+    belongs to. Position ids are random rather than seeded, so the same
+    tracks can be loaded twice. Like every ``COPY`` loader this sends no
+    signals, so the caller rebuilds the routes and drops cached responses.
+    """
+    cruises = np.frombuffer(b''.join(cruise_id.bytes for cruise_id in cruise_ids), dtype=np.uint8).reshape(-1, 16)
+    seconds = np.asarray(seconds, dtype=np.int64)
+    table = connection.ops.quote_name(Position._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE synthetic_positions '
+            '(position_id uuid, cruise_id uuid, date date, time time, lon float8, lat float8)'
+        )
+        with cursor.copy('COPY synthetic_positions FROM STDIN (FORMAT BINARY)') as copy:
+            copy.write(COPY_HEADER)
+            for start in range(0, len(seconds), chunk_size):
+                end = start + chunk_size
+                copy.write(staged_rows(
+                    random_uuids(len(seconds[start:end])), cruises[track[start:end]],
+                    seconds[start:end], lon[start:end], lat[start:end],
+                ).tobytes())
+            copy.write(COPY_TRAILER)
+        cursor.execute(f"""
+            INSERT INTO {table} (position_id, cruise_id, date, time, lat, lon, coordinates)
+            SELECT position_id, cruise_id, date, time, lat, lon,
+                   ST_SetSRID(ST_MakePoint(lon::float8, lat::float8), 4326)::geography
+            FROM (
+                SELECT position_id, cruise_id, date, time, round(lat::numeric, 6) AS lat, round(lon::numeric, 6) AS lon
+                FROM synthetic_positions
+            ) AS staged
+        """)
+        written = cursor.rowcount
+        cursor.execute('DROP TABLE synthetic_positions')
+    return written
+
+
+def write_fixes_csv(file, seconds, lon, lat, cruise_ids=None, track=None, chunk_size=COPY_CHUNK):
+    """
+    Write fixes as a track CSV that ``import_positions`` reads.
+
+    The columns are date, time, lat and lon, plus cruise when ``cruise_ids``
+    and ``track`` say which cruise each fix belongs to.
+    """
+    moments = np.datetime_as_string(np.asarray(seconds, dtype='datetime64[s]'))
+    cruises = np.array([str(cruise_id) for cruise_id in cruise_ids]) if cruise_ids is not None else None
+    file.write('date,time,lat,lon,cruise\n' if cruises is not None else 'date,time,lat,lon\n')
+    for start in range(0, len(moments), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        columns = [moments[chunk].tolist(), lat[chunk].tolist(), lon[chunk].tolist()]
+        if cruises is None:
+            file.writelines(f'{moment[:10]},{moment[11:]},{y:.6f},{x:.6f}\n' for moment, y, x in zip(*columns))
+        else:
+            file.writelines(
+                f'{moment[:10]},{moment[11:]},{y:.6f},{x:.6f},{cruise}\n'
+                for moment, y, x, cruise in zip(*columns, cruises[track[chunk]].tolist())
+            )
+    file.flush()
@@ -1,5 +1,85 @@
+import logging
 from celery import shared_task
-from .models import Cruise
+from celery.signals import worker_ready
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .export import run_export
+from .models import Cruise, Export, Route
+from .underway import flush_buffer
+
+logger = logging.getLogger(__name__)
+
+# How long a pending flag may outlive a rebuild task that never ran.
+ROUTE_REBUILD_PENDING_TIMEOUT = 600
+
+
+def route_rebuild_pending_key(cruise_id):
+    return f'route-rebuild-pending:{cruise_id}'
+
+
+def route_rebuild_full_key(cruise_id):
+    return f'route-rebuild-full:{cruise_id}'
+
+
+def queue_route_rebuild(cruise_id, full=True):
+    """
+    Rebuild a cruise's route in the background once the current transaction commits.
+
+    Saves arriving while a rebuild is already queued for the same cruise are
+    coalesced into it: the first one sets a pending flag in the cache and
+    enqueues :func:`rebuild_route` after ``ROUTE_REBUILD_DELAY`` seconds; the
+    rest find the flag set and do nothing. Pass ``full=False`` when the
+    change only added positions: unless another change since asked for a full
+    rebuild, the route is then extended by :meth:`Route.append_positions`.
+    """
+    transaction.on_commit(lambda: _enqueue_route_rebuild(str(cruise_id), full))
+
+
+def _enqueue_route_rebuild(cruise_id, full=True):
+    if full:
+        cache.set(route_rebuild_full_key(cruise_id), 1, None)
+    key = route_rebuild_pending_key(cruise_id)
+    if not cache.add(key, 1, timeout=ROUTE_REBUILD_PENDING_TIMEOUT):
+        return
+    try:
+        rebuild_route.apply_async((cruise_id,), countdown=settings.ROUTE_REBUILD_DELAY)
+    except Exception as e:
+        cache.delete(key)
+        logger.error(f"Could not queue route rebuild for cruise {cruise_id}, rebuilding inline: {e}")
+        rebuild_route(cruise_id)
+
+
+@shared_task(ignore_result=True)
+def rebuild_route(cruise_id):
+    # Clear the flag first so saves made during the rebuild queue another one.
+    cache.delete(route_rebuild_pending_key(cruise_id))
+    with cache.lock(f'route-rebuild-lock:{cruise_id}', timeout=ROUTE_REBUILD_PENDING_TIMEOUT):
+        full = cache.delete(route_rebuild_full_key(cruise_id))
+        if not Cruise.objects.filter(pk=cruise_id).exists():
+            return
+        route, _ = Route.objects.get_or_create(cruise_id=cruise_id)
+        if full or not route.append_positions():
+            route.update_route()
+
+
+@shared_task(ignore_result=True)
+def flush_underway_buffer():
+    flush_buffer()
+
+
+@worker_ready.connect
+def recover_underway_buffer(**kwargs):
+    # Load any batch a worker left half-flushed when it died, and what buffered up behind it.
+    flush_underway_buffer.delay()
+
+
+@shared_task(ignore_result=True)
+def export_positions(export_id):
+    export = Export.objects.filter(pk=export_id, status='pending').first()
+    if export is not None:
+        run_export(export)
+
 
 @shared_task
 def process_cruise_data():
@@ -1,3 +1,1226 @@
-from django.test import TestCase
+import contextlib
+import csv
+import io
+import json
+import random
+import re
+import struct
+import tempfile
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from uuid import UUID, uuid4
 
-# Create your tests here.
+import msgpack
+import netCDF4
+import numpy as np
+import pyarrow.parquet as pq
+import redis
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+
+from .filters import filter_track, haversine
+from .geo import (
+    bbox_polygon, create_multilinestring_route, extend_route_path, handle_antimeridian_crossing, simplify_path,
+    tolerance_for_zoom, track_bounds,
+)
+from .archive import archive_cruises, restore_cruises
+from .export import WKB_POINT, run_export, wkb_points
+from .ingest import copy_positions, ingest_positions
+from .instrumentation import (
+    PROCESS_COUNT_KEY, Metrics, RequestRecord, collected_metrics, current_request, process_key, render_metrics, span,
+)
+from .live import publish_rows
+from .management.commands.benchmark_antimeridian import legacy_handle_antimeridian_crossing
+from .management.commands.generate_fake_data import CSV_FIELDS
+from .models import (
+    ArchivedPosition, Cruise, CruiseStatus, Export, Leg, Position, Route, Scientist, Segment, Vessel, at_or_after,
+    deferred_route_updates, fix_timestamp,
+)
+from .renderers import TrackRenderer
+from .serializers import CruiseSerializer, RouteSummarySerializer, ScientistSerializer
+from .streaming import ageojson_stream, andjson_stream, geojson_stream, ndjson_stream
+from .synthetic import copy_fixes, synthetic_track
+from .tasks import rebuild_route
+from .tiles import tile_sql
+from .tracks import TRACK_ARRAYS, TRACK_MEDIA_TYPE, copied_track, decode_track, delta_encode
+from .underway import (
+    BUFFER_KEY, DEAD_LETTER_KEY, FLUSH_PENDING_KEY, PROCESSING_KEY, FixError, buffer_fixes, fix_row, flush_buffer, parse_batch,
+    sequence_key,
+)
+from .views import async_cruise_detail, async_cruise_list, async_cruise_positions, bbox_filter, ingest_authorized
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_cruise(name='Test Cruise'):
+    user = User.objects.create_user(username=f'{name}-user', password='password')
+    vessel = Vessel.objects.create(
+        vessel_name=f'{name} Vessel',
+        vessel_desc='Research vessel',
+        vessel_credit_url='https://example.org/vessel',
+    )
+    return Cruise.objects.create(
+        vessel=vessel,
+        user=user,
+        iso2_country='FJ',
+        cruise_name=name,
+        cruise_desc='Test cruise',
+        cruise_website_url='https://example.org/cruise',
+        cruise_doi_url='https://doi.org/10.0000/cruise',
+        cruise_ship_name='Vessel',
+        cruise_ship_flag='FJ',
+        cruise_ship_url='https://example.org/ship',
+        cruise_ship_phone_contact='+679 000 0000',
+    )
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False)
+class IncrementalRouteTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+
+    def add_position(self, day, lon, lat, hour=0):
+        return Position.objects.create(
+            cruise=self.cruise,
+            date=date(2024, 1, day),
+            time=time(hour),
+            lon=Decimal(str(lon)),
+            lat=Decimal(str(lat)),
+        )
+
+    def snapshot(self):
+        route = Route.objects.get(cruise=self.cruise)
+        segments = sorted(
+            (s.start_position_id, s.end_position_id, s.path.coords)
+            for s in route.segments.all()
+        )
+        summary = [getattr(route, name) for name in RouteSummarySerializer.Meta.fields]
+        return (route.path.coords if route.path else None), segments, summary
+
+    def assertMatchesFullRebuild(self):
+        incremental = self.snapshot()
+        Route.objects.get(cruise=self.cruise).update_route()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_append_extends_route_without_rebuild(self):
+        self.add_position(1, 170, -10)
+        self.add_position(2, 175, -12)
+        with mock.patch.object(Route, 'update_route') as update_route:
+            self.add_position(3, 178, -14)
+        update_route.assert_not_called()
+        self.assertMatchesFullRebuild()
+
+    def test_append_across_antimeridian(self):
+        self.add_position(1, 170, -10)
+        self.add_position(2, 179, -12)
+        self.add_position(3, -178, -14)
+        self.add_position(4, -175, -15)
+        self.assertEqual(len(Route.objects.get(cruise=self.cruise).path), 2)
+        self.assertMatchesFullRebuild()
+
+    def test_backfilled_position_is_spliced_between_neighbours(self):
+        self.add_position(1, 170, -10)
+        self.add_position(3, 175, -12)
+        self.add_position(4, 178, -14)
+        self.add_position(2, 172, -11)
+        self.assertMatchesFullRebuild()
+
+    def test_moving_position_in_place(self):
+        self.add_position(1, 170, -10)
+        middle = self.add_position(2, 172, -11)
+        self.add_position(3, 175, -12)
+        middle.lat = Decimal('-11.5')
+        middle.time = time(6)
+        with mock.patch.object(Route, 'update_route') as update_route:
+            middle.save()
+        update_route.assert_not_called()
+        self.assertMatchesFullRebuild()
+
+    def test_reordering_position_falls_back_to_full_rebuild(self):
+        first = self.add_position(1, 170, -10)
+        self.add_position(2, 172, -11)
+        self.add_position(3, 175, -12)
+        first.date = date(2024, 1, 4)
+        first.save()
+        self.assertMatchesFullRebuild()
+
+    def test_clearing_coordinates_drops_position_from_route(self):
+        self.add_position(1, 170, -10)
+        middle = self.add_position(2, 172, -11)
+        self.add_position(3, 175, -12)
+        middle.lat = middle.lon = None
+        middle.save()
+        self.assertEqual(len(self.snapshot()[1]), 1)
+        self.assertMatchesFullRebuild()
+
+    def test_deleting_position_joins_its_neighbours(self):
+        self.add_position(1, 170, -10)
+        middle = self.add_position(2, 179, -11)
+        self.add_position(3, -178, -12)
+        middle.delete()
+        self.assertMatchesFullRebuild()
+
+    def test_summary_statistics(self):
+        self.add_position(1, 179, -10)
+        self.add_position(1, -179, -10, hour=6)
+        self.add_position(3, -178, -12)
+        route = Route.objects.get(cruise=self.cruise)
+        self.assertEqual(route.n_points, 3)
+        self.assertEqual(route.crossings, 1)
+        self.assertEqual((route.west, route.south, route.east, route.north), (179, -12, -178, -10))
+        self.assertEqual(route.end_time - route.start_time, timedelta(days=2))
+        self.assertEqual(route.max_gap, timedelta(hours=42))
+        self.assertAlmostEqual(route.length, 219 + 246, delta=5)
+        self.assertAlmostEqual(route.mean_speed, route.length / 1.852 / 48, places=6)
+
+    def test_deleting_positions_in_bulk(self):
+        for day in range(1, 7):
+            self.add_position(day, 170 + day, -10 - day)
+        Position.objects.filter(date__in=[date(2024, 1, 2), date(2024, 1, 3)]).delete()
+        self.assertEqual(len(self.snapshot()[1]), 3)
+        self.assertMatchesFullRebuild()
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False)
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+
+    def test_ingest_rebuilds_route_once(self):
+        track = io.StringIO(
+            "cruise,date,time,lat,lon\n"
+            f"{self.cruise.pk},2024-01-01,00:00:00,-10.0,179.5\n"
+            f"{self.cruise.pk},2024-01-02,00:00:00,-11.0,-179.5\n"
+            f"{self.cruise.pk},2024-01-03,00:00:00,,\n"
+            f"{self.cruise.pk},2024-01-04,00:00:00,-12.1234567,-178.0\n"
+        )
+        with mock.patch.object(Route, 'update_route', autospec=True, side_effect=Route.update_route) as update_route:
+            loaded, dropped = ingest_positions(track, chunk_size=2)
+        self.assertEqual(loaded, {str(self.cruise.pk): 4})
+        self.assertEqual(dropped, {})
+        update_route.assert_called_once()
+
+        fix = Position.objects.get(date=date(2024, 1, 4))
+        self.assertEqual(fix.lat, Decimal('-12.123457'))
+        self.assertEqual(fix.coordinates.coords, (-178.0, -12.123457))
+        self.assertIsNone(Position.objects.get(date=date(2024, 1, 3)).coordinates)
+        self.assertEqual(Route.objects.get(cruise=self.cruise).segments.count(), 2)
+
+    def test_filters_carry_on_across_chunks(self):
+        track = io.StringIO(
+            "date,time,lat,lon\n"
+            "2024-01-01,00:00:00,-17.0,178.0\n"
+            "2024-01-01,00:00:10,-17.0,178.0001\n"  # 10 m on, 10 s later
+            "2024-01-01,00:00:00,-17.0,178.0002\n"  # At the time of the fix stored from the first chunk
+            "2024-01-01,00:01:00,-17.0,178.0\n"
+            "2024-01-01,00:01:10,-16.0,178.0\n"  # 60 nautical miles in 10 s
+            "2024-01-01,00:02:00,-17.0,178.001\n"
+        )
+        loaded, dropped = ingest_positions(track, cruise=self.cruise, chunk_size=2)
+        self.assertEqual(loaded, {str(self.cruise.pk): 3})
+        self.assertEqual(dropped, {'thinned': 1, 'duplicate': 1, 'speed': 1})
+
+    def test_ingest_after_the_track_extends_route(self):
+        for day, lon in ((1, 178), (2, 179.5)):
+            Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(0), lat=-17, lon=lon)
+        track = io.StringIO(
+            "date,time,lat,lon\n"
+            "2024-01-03,00:00:00,-17.5,-179.5\n"
+            "2024-01-04,00:00:00,-18.0,-178.0\n"
+        )
+        with mock.patch.object(Route, 'update_route') as update_route:
+            ingest_positions(track, cruise=self.cruise, clean=False)
+        update_route.assert_not_called()
+        route = Route.objects.get(cruise=self.cruise)
+        incremental = (route.path.coords, route.segments.count(), route.n_points)
+        route.update_route()
+        self.assertEqual(incremental, (route.path.coords, route.segments.count(), route.n_points))
+
+    def test_backfilled_ingest_rebuilds_route(self):
+        for day in (1, 3):
+            Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(0), lat=-17, lon=170 + day)
+        track = io.StringIO("date,time,lat,lon\n2024-01-02,00:00:00,-17.5,172\n")
+        with mock.patch.object(Route, 'update_route') as update_route:
+            ingest_positions(track, cruise=self.cruise, clean=False)
+        update_route.assert_called_once()
+
+    def test_deferred_saves_rebuild_route_once(self):
+        with mock.patch.object(Route, 'update_route', autospec=True) as update_route:
+            with deferred_route_updates():
+                for day in range(1, 4):
+                    Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(0), lat=-10, lon=170)
+        update_route.assert_called_once()
+
+
+@override_settings(
+    ROUTE_REBUILD_ASYNC=True,
+    ROUTE_REBUILD_DELAY=5,
+    CACHES=LOCMEM_CACHES,
+)
+class RouteRebuildQueueTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+
+    def test_burst_of_saves_queues_one_rebuild(self):
+        with mock.patch('cruises.tasks.rebuild_route.apply_async') as apply_async, \
+                mock.patch.object(Route, 'update_route') as update_route:
+            with self.captureOnCommitCallbacks(execute=True):
+                for day in range(1, 4):
+                    Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(0), lat=-10, lon=170)
+        apply_async.assert_called_once_with((str(self.cruise.pk),), countdown=5)
+        update_route.assert_not_called()
+
+    def test_background_rebuild_appends_new_positions(self):
+        # The locmem cache has no locks; rebuilds run one at a time here anyway.
+        with mock.patch('cruises.tasks.rebuild_route.apply_async'), \
+                mock.patch.object(cache, 'lock', lambda *args, **kwargs: contextlib.nullcontext(), create=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                for day in range(1, 3):
+                    Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(0), lat=-10, lon=170 + day)
+            rebuild_route(str(self.cruise.pk))
+            with self.captureOnCommitCallbacks(execute=True):
+                added = Position.objects.create(cruise=self.cruise, date=date(2024, 1, 3), time=time(0), lat=-11, lon=174)
+            with mock.patch.object(Route, 'update_route') as update_route:
+                rebuild_route(str(self.cruise.pk))
+            update_route.assert_not_called()
+            self.assertEqual(Route.objects.get(cruise=self.cruise).path.coords, (((171, -10), (172, -10), (174, -11)),))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                added.lat = -12
+                added.save()
+            with mock.patch.object(Route, 'update_route') as update_route:
+                rebuild_route(str(self.cruise.pk))
+            update_route.assert_called_once()
+
+
+class AntimeridianSplitTests(SimpleTestCase):
+    def random_track(self, rng, on_antimeridian=True):
+        longitudes = [
+            lambda: rng.uniform(-180, 180),
+            lambda: rng.uniform(175, 180),
+            lambda: rng.uniform(-180, -175),
+        ]
+        if on_antimeridian:
+            longitudes.append(lambda: rng.choice([180.0, -180.0]))
+        return [(rng.choice(longitudes)(), rng.uniform(-90, 90)) for _ in range(rng.randint(2, 50))]
+
+    def test_splits_where_previous_implementation_did(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            points = self.random_track(rng, on_antimeridian=False)
+            route = handle_antimeridian_crossing(points)
+            legacy = legacy_handle_antimeridian_crossing(points)
+            with self.subTest(points=points):
+                self.assertEqual(len(route), len(legacy))
+                for line, legacy_line in zip(route, legacy):
+                    self.assertEqual(len(line), len(legacy_line))
+                    self.assertEqual([x for x, _ in line], [x for x, _ in legacy_line])
+
+    def test_split_latitude_lies_between_the_step_ends(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            (x1, y1), (x2, y2) = (rng.uniform(90, 180), rng.uniform(-90, 90)), (rng.uniform(-180, -90), rng.uniform(-90, 90))
+            for great_circle in (False, True):
+                route = handle_antimeridian_crossing([(x1, y1), (x2, y2)], great_circle=great_circle)
+                split = route[0][-1][1]
+                with self.subTest(points=[(x1, y1), (x2, y2)], great_circle=great_circle):
+                    if not great_circle:
+                        self.assertLessEqual(min(y1, y2), split)
+                        self.assertLessEqual(split, max(y1, y2))
+                    self.assertEqual(route[1][0], (-180, split))
+
+    def test_split_points_sit_on_either_side_of_the_antimeridian(self):
+        route = handle_antimeridian_crossing([(170, -10), (179, -11), (-179, -12), (-170, -13)])
+        self.assertEqual(len(route), 2)
+        self.assertEqual(route[0][-1], (180, -11.5))
+        self.assertEqual(route[1][0], (-180, -11.5))
+
+    def test_great_circle_split_bulges_towards_the_pole(self):
+        route = handle_antimeridian_crossing([(170, 40), (-170, 40)], great_circle=True)
+        self.assertGreater(route[0][-1][1], 40)
+
+    def test_points_on_the_antimeridian_are_not_duplicated(self):
+        route = handle_antimeridian_crossing([(170, -10), (180, -11), (-180, -11), (-170, -12)])
+        self.assertEqual(route.coords, (((170, -10), (180, -11)), ((-180, -11), (-170, -12))))
+
+    def test_extending_matches_full_split(self):
+        rng = random.Random(2)
+        for _ in range(200):
+            points = self.random_track(rng)
+            path = create_multilinestring_route(points[:2])
+            for previous, point in zip(points[1:], points[2:]):
+                path = extend_route_path(path, previous, point)
+            with self.subTest(points=points):
+                self.assertEqual(path.coords, create_multilinestring_route(points).coords)
+
+    def test_bounds_go_the_short_way_round(self):
+        self.assertEqual(track_bounds(create_multilinestring_route([(170, -10), (-170, -13)])), (170, -13, -170, -10))
+        self.assertEqual(track_bounds(create_multilinestring_route([(10, -10), (20, 5), (-30, -12)])), (-30, -12, 20, 5))
+        self.assertIsNone(track_bounds(create_multilinestring_route([])))
+
+    def test_empty_track(self):
+        self.assertTrue(handle_antimeridian_crossing([]).empty)
+
+
+class SimplifyTests(SimpleTestCase):
+    def test_simplify_keeps_line_ends_and_antimeridian_split(self):
+        points = [(170 + i * 0.1, (-1) ** i * 0.001) for i in range(200)]
+        path = create_multilinestring_route(points)
+        simplified = simplify_path(path, 0.01)
+        self.assertEqual(len(simplified), len(path))
+        self.assertLess(simplified.num_coords, path.num_coords)
+        for line, simplified_line in zip(path, simplified):
+            self.assertEqual((line[0], line[-1]), (simplified_line[0], simplified_line[-1]))
+
+    def test_tolerance_halves_with_each_zoom_level(self):
+        self.assertEqual(tolerance_for_zoom(0), 360 / 256)
+        self.assertEqual(tolerance_for_zoom(4), tolerance_for_zoom(3) / 2)
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, ROUTE_SIMPLIFY_TOLERANCES=[0.01, 0.1])
+class RouteLevelTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+        Position.objects.bulk_create(
+            Position(cruise=self.cruise, date=date(2024, 1, 1 + i // 24), time=time(i % 24), lat=(-1) ** i * 0.05, lon=170 + i * 0.1)
+            for i in range(100)
+        )
+        self.route = Route.objects.get(cruise=self.cruise)
+        self.route.update_route()
+
+    def test_rebuild_stores_a_level_per_tolerance(self):
+        self.assertEqual(list(self.route.levels.values_list('tolerance', flat=True)), [0.01, 0.1])
+
+    def test_path_at_picks_coarsest_level_within_tolerance(self):
+        self.assertEqual(self.route.path_at(None), self.route.path)
+        self.assertEqual(self.route.path_at(0.001), self.route.path)
+        self.assertEqual(self.route.path_at(0.05), self.route.levels.get(tolerance=0.01).path)
+        self.assertEqual(self.route.path_at(1), self.route.levels.get(tolerance=0.1).path)
+
+    def test_route_endpoint_simplifies_by_zoom(self):
+        full = self.client.get(f'/api/routes/{self.route.pk}/').json()
+        coarse = self.client.get(f'/api/routes/{self.route.pk}/', {'zoom': 3}).json()
+        self.assertLess(len(coarse['geometry']['coordinates'][0]), len(full['geometry']['coordinates'][0]))
+        self.assertEqual(self.client.get('/api/routes/', {'simplify': 'x'}).status_code, 400)
+
+
+@override_settings(
+    ROUTE_REBUILD_ASYNC=False,
+    CACHES=LOCMEM_CACHES,
+)
+class TileTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+        for day, lon in enumerate((178, 179.5, -179.5, -178), start=1):
+            Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(0), lat=-17, lon=lon)
+
+    def test_tiles_are_served_and_cached(self):
+        for layer, z, x, y in (('routes', 2, 3, 2), ('segments', 2, 3, 2), ('positions', 8, 254, 140)):
+            response = self.client.get(f'/api/tiles/{layer}/{z}/{x}/{y}.mvt')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+            self.assertTrue(response.content)
+        with self.assertNumQueries(0):
+            self.client.get('/api/tiles/routes/2/3/2.mvt')
+        # Columns beyond the grid wrap onto the same tile.
+        with self.assertNumQueries(0):
+            self.client.get('/api/tiles/routes/2/7/2.mvt')
+
+    def test_route_rebuild_invalidates_tiles(self):
+        self.client.get('/api/tiles/routes/2/3/2.mvt')
+        self.client.get('/api/tiles/routes/2/0/0.mvt')
+        with self.captureOnCommitCallbacks(execute=True):
+            Route.objects.get(cruise=self.cruise).update_route()
+        with self.assertNumQueries(1):
+            self.client.get('/api/tiles/routes/2/3/2.mvt')
+        # Tiles away from the route stay cached.
+        with self.assertNumQueries(0):
+            self.client.get('/api/tiles/routes/2/0/0.mvt')
+
+    def test_positions_are_left_out_of_wide_tiles(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tiles/positions/2/3/2.mvt')
+        self.assertEqual(response.content, b'')
+
+    def test_unknown_tiles_are_not_found(self):
+        self.assertEqual(self.client.get('/api/tiles/vessels/2/3/2.mvt').status_code, 404)
+        self.assertEqual(self.client.get('/api/tiles/routes/2/3/4.mvt').status_code, 404)
+
+
+class TrackFormatTests(SimpleTestCase):
+    def test_delta_encoding_round_trips(self):
+        track = np.array([[1704110400, 179999999, -17000000], [1704110460, -179999999, -17000100], [1704110400, 0, 90000000]])
+        envelope = msgpack.unpackb(TrackRenderer().render({
+            'start': track[0].tolist(), **{name: memoryview(delta_encode(column)) for name, column in zip(TRACK_ARRAYS, track.T)},
+        }))
+        self.assertEqual(len(envelope['lon']), 3 * 4)
+        self.assertEqual(decode_track(envelope).tolist(), track.tolist())
+
+    def test_binary_copy_is_read_into_columns(self):
+        fixes = [(1704110400, 179999999, -17000000), (1704110460, -179999999, -17000100)]
+        buffer = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+        for fix in fixes:
+            buffer += struct.pack('>hiqiiii', 3, 8, fix[0], 4, fix[1], 4, fix[2])
+        buffer += struct.pack('>h', -1)
+        self.assertEqual(copied_track(buffer).tolist(), [list(fix) for fix in fixes])
+        self.assertEqual(copied_track(buffer[:19] + buffer[-2:]).shape, (0, 3))
+
+
+class CruiseFieldSelectionTests(SimpleTestCase):
+    def select(self, context_expand=(), **params):
+        return CruiseSerializer.selected_fields(CruiseSerializer.Meta.fields, params, context_expand)
+
+    def test_heavy_fields_are_left_out_by_default(self):
+        selected = self.select()
+        self.assertIn('legs', selected)
+        self.assertNotIn('positions', selected)
+        self.assertNotIn('route', selected)
+
+    def test_expand_adds_heavy_fields(self):
+        self.assertIn('route', self.select(expand='route'))
+        self.assertIn('positions', self.select(context_expand=('positions',)))
+
+    def test_fields_narrows_selection(self):
+        self.assertEqual(self.select(fields='cruise_id, cruise_name,route'), ['cruise_id', 'cruise_name', 'route'])
+        self.assertEqual(self.select(fields='cruise_name', expand='route'), ['cruise_name', 'route'])
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class CruiseApiTests(TestCase):
+    def setUp(self):
+        self.cruises = [make_cruise(f'Cruise {i}') for i in range(3)]
+
+    def test_list_is_paginated_without_positions(self):
+        response = self.client.get('/api/cruises/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNotNone(data['next'])
+        self.assertNotIn('positions', data['results'][0])
+        self.assertEqual(len(self.client.get(data['next']).json()['results']), 1)
+
+    def test_list_filters_by_name_and_status(self):
+        self.cruises[1].status = CruiseStatus.objects.create(name='Planned')
+        self.cruises[1].save()
+
+        def names(**params):
+            return [cruise['cruise_name'] for cruise in self.client.get('/api/cruises/', params).json()['results']]
+
+        self.assertEqual(names(name='ruise 2'), ['Cruise 2'])
+        self.assertEqual(names(status='planned'), ['Cruise 1'])
+        self.assertEqual(names(name='cruise', status='Planned', page_size=1), ['Cruise 1'])
+
+    def test_detail_includes_positions_and_route(self):
+        cruise = self.cruises[0]
+        data = self.client.get(f'/api/cruises/{cruise.pk}/').json()
+        self.assertIn('positions', data)
+        self.assertIn('route', data)
+        data = self.client.get(f'/api/cruises/{cruise.pk}/', {'fields': 'cruise_name'}).json()
+        self.assertEqual(data, {'cruise_name': cruise.cruise_name})
+
+    def test_query_count_does_not_grow_with_cruises(self):
+        status = CruiseStatus.objects.create(name='Planned')
+        for i, cruise in enumerate(self.cruises):
+            cruise.status = status
+            cruise.save()
+            Leg.objects.create(
+                cruise=cruise, leg_number=1, departure_port='Suva', return_port='Apia',
+                start_date=date(2024, 1, 1), end_date=date(2024, 1, 9),
+            )
+            Position.objects.create(cruise=cruise, date=date(2024, 1, 1), time=time(0), lat=-17, lon=178 + i)
+        # Cruises, legs and scientists; the route adds its levels.
+        with self.assertNumQueries(3):
+            self.client.get('/api/cruises/')
+        with self.assertNumQueries(4):
+            self.client.get('/api/cruises/', {'expand': 'route'})
+        for i in range(3, 10):
+            make_cruise(f'Cruise {i}')
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.client.get('/api/cruises/').json()['results']), 10)
+        with self.assertNumQueries(4):
+            self.client.get('/api/cruises/', {'expand': 'route'})
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class CruisePositionsApiTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+        with deferred_route_updates():
+            for day, lon in enumerate((176, 178, 179.5, -179.5, -178, -176), start=1):
+                Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(12), lat=-17, lon=lon)
+        self.url = f'/api/cruises/{self.cruise.pk}/positions/'
+
+    def dates(self, features):
+        return [feature['properties']['date'] for feature in features]
+
+    def test_pages_follow_track_order(self):
+        data = self.client.get(self.url, {'page_size': 4}).json()
+        self.assertEqual(self.dates(data['results']['features']), ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual(self.dates(data['results']['features']), ['2024-01-05', '2024-01-06'])
+        self.assertIsNone(data['next'])
+
+    def test_time_window(self):
+        data = self.client.get(self.url, {'start': '2024-01-02T12:00:00', 'end': '2024-01-04'}).json()
+        self.assertEqual(self.dates(data['results']['features']), ['2024-01-02', '2024-01-03'])
+        self.assertEqual(self.client.get(self.url, {'start': 'yesterday'}).status_code, 400)
+
+    def test_bbox_across_antimeridian(self):
+        data = self.client.get(self.url, {'bbox': '179,-18,-179,-16'}).json()
+        self.assertEqual(self.dates(data['results']['features']), ['2024-01-03', '2024-01-04'])
+
+    def test_streams_ndjson_and_geojson(self):
+        response = self.client.get(self.url, {'stream': 'ndjson', 'start': '2024-01-05'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(self.dates(json.loads(line) for line in lines), ['2024-01-05', '2024-01-06'])
+        response = self.client.get(self.url, {'stream': 'geojson'})
+        collection = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(collection['features'][2]['geometry'], {'type': 'Point', 'coordinates': [179.5, -17.0]})
+        self.assertEqual(len(collection['features']), 6)
+
+    def test_packed_track(self):
+        response = self.client.get(self.url, {'format': 'track', 'end': '2024-01-03T12:00:00'})
+        self.assertEqual(response['Content-Type'], TRACK_MEDIA_TYPE)
+        envelope = msgpack.unpackb(response.content)
+        self.assertEqual(envelope['count'], 3)
+        self.assertEqual(decode_track(envelope).tolist(), [
+            [1704110400, 176000000, -17000000],
+            [1704196800, 178000000, -17000000],
+            [1704283200, 179500000, -17000000],
+        ])
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class AsyncReadTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+        with deferred_route_updates():
+            for day, lon in enumerate((176, 178, 179.5, -179.5, -178, -176), start=1):
+                Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(12), lat=-17, lon=lon)
+        self.url = f'/api/cruises/{self.cruise.pk}/'
+
+    def read(self, view, path, params=None, **kwargs):
+        cache.clear()
+        return async_to_sync(view)(AsyncRequestFactory().get(path, params), **kwargs)
+
+    def test_reads_match_the_viewset(self):
+        for view, path, params in (
+            (async_cruise_list, '/api/cruises/', {}),
+            (async_cruise_list, '/api/cruises/', {'expand': 'positions,route', 'page_size': 1}),
+            (async_cruise_detail, self.url, {}),
+            (async_cruise_detail, self.url, {'fields': 'cruise_name,vessel_details,track_summary', 'expand': 'route'}),
+            (async_cruise_positions, f'{self.url}positions/', {'page_size': 4, 'bbox': '179,-18,-179,-16'}),
+        ):
+            with self.subTest(path=path, params=params):
+                cache.clear()
+                expected = self.client.get(path, params)
+                kwargs = {'pk': self.cruise.pk} if view is not async_cruise_list else {}
+                response = self.read(view, path, params, **kwargs)
+                self.assertEqual((response.status_code, response.content), (200, expected.content))
+
+    def test_errors(self):
+        self.assertEqual(self.read(async_cruise_detail, f'/api/cruises/{uuid4()}/', pk=uuid4()).status_code, 404)
+        response = self.read(async_cruise_positions, f'{self.url}positions/', {'start': 'yesterday'}, pk=self.cruise.pk)
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_renderers_go_to_the_viewset(self):
+        response = self.read(async_cruise_positions, f'{self.url}positions/', {'format': 'track'}, pk=self.cruise.pk)
+        self.assertEqual(response['Content-Type'], TRACK_MEDIA_TYPE)
+        self.assertEqual(msgpack.unpackb(response.content)['count'], 6)
+
+
+class AsyncStreamTests(SimpleTestCase):
+    rows = [
+        (UUID('6f1c2a64-4f1e-4c57-9d2b-6a0f4cf3d5a1'), date(2024, 1, 1), time(12), Decimal('-17.000000'), Decimal('179.500000')),
+        (UUID('0b9f3c1e-5d2a-4e8b-a7c6-2f1d0e9b8a7c'), date(2024, 1, 1), time(12, 1), None, None),
+    ]
+
+    async def collect(self, stream):
+        async def rows():
+            for row in self.rows:
+                yield row
+        return ''.join([part async for part in stream(rows())])
+
+    def test_async_streams_match_the_sync_ones(self):
+        for sync_stream, async_stream in ((geojson_stream, ageojson_stream), (ndjson_stream, andjson_stream)):
+            with mock.patch('cruises.streaming.position_rows') as position_rows:
+                position_rows.return_value.iterator.return_value = iter(self.rows)
+                expected = ''.join(sync_stream(None))
+            self.assertEqual(async_to_sync(self.collect)(async_stream), expected)
+        self.assertEqual(len(json.loads(expected.splitlines()[0])['properties']), 4)
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class CruiseSearchTests(TestCase):
+    def setUp(self):
+        self.fiji = make_cruise('Fiji')
+        self.samoa = make_cruise('Samoa')
+        for cruise, track in ((self.fiji, [(176, -17), (178, -18), (-179, -17)]), (self.samoa, [(-173, -14), (-171, -13)])):
+            for day, (lon, lat) in enumerate(track, start=1):
+                Position.objects.create(cruise=cruise, date=date(2024, 3, day), time=time(0), lat=lat, lon=lon)
+
+    def search(self, **params):
+        response = self.client.get('/api/cruises/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_bbox_across_antimeridian(self):
+        results = self.search(bbox='179,-19,-178,-16')
+        self.assertEqual([r['cruise_name'] for r in results], ['Fiji'])
+        self.assertEqual(results[0]['segments'], 1)
+        self.assertEqual(results[0]['hours_inside'], 24)
+
+    def test_polygon_and_time_window(self):
+        area = 'POLYGON((-180 -20, -170 -20, -170 -10, -180 -10, -180 -20))'
+        self.assertEqual({r['cruise_name'] for r in self.search(geometry=area)}, {'Fiji', 'Samoa'})
+        self.assertEqual([r['cruise_name'] for r in self.search(geometry=area, start='2024-03-02T12:00:00')], ['Fiji'])
+        self.assertEqual(self.search(geometry=area, end='2024-02-01'), [])
+
+    def test_distance_widens_the_area(self):
+        self.assertEqual(self.search(geometry='POINT(-172 -12)'), [])
+        self.assertEqual([r['cruise_name'] for r in self.search(geometry='POINT(-172 -12)', distance=200000)], ['Samoa'])
+
+    def test_area_is_required(self):
+        self.assertEqual(self.client.get('/api/cruises/search/').status_code, 400)
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+
+    def test_repeat_requests_are_served_from_cache(self):
+        first = self.client.get('/api/cruises/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/cruises/')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.client.get('/api/cache-stats/').json()['cruises'], {'hits': 1, 'misses': 1})
+
+    def test_requests_report_server_timing(self):
+        timing = self.client.get('/api/cruises/')['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="[1-9]\d* queries", ')
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('http_requests_total{view="cruise-list",method="GET",status="200"}', self.client.get('/metrics').content.decode())
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get('/api/cruises/')['ETag']
+        self.assertEqual(self.client.get('/api/cruises/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_saving_a_related_model_invalidates(self):
+        self.client.get('/api/cruises/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Leg.objects.create(
+                cruise=self.cruise, leg_number=1, departure_port='Suva', return_port='Apia',
+                start_date=date(2024, 1, 1), end_date=date(2024, 1, 9),
+            )
+        response = self.client.get('/api/cruises/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['legs'][0]['departure_port'], 'Suva')
+
+    def test_saving_a_position_invalidates_only_its_cruise(self):
+        other = make_cruise('Other Cruise')
+        self.client.get(f'/api/cruises/{other.pk}/')
+        self.client.get(f'/api/cruises/{self.cruise.pk}/')
+        self.client.get('/api/cruises/?fields=cruise_id,cruise_name')
+        with self.captureOnCommitCallbacks(execute=True):
+            Position.objects.create(cruise=self.cruise, date=date(2024, 1, 1), time=time(0), lat=-17, lon=178)
+        self.assertEqual(self.client.get(f'/api/cruises/{other.pk}/')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/cruises/?fields=cruise_id,cruise_name')['X-Cache'], 'HIT')
+        response = self.client.get(f'/api/cruises/{self.cruise.pk}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()['positions']['features']), 1)
+
+    def test_retiming_a_position_invalidates_the_track_summary(self):
+        url = '/api/cruises/?fields=cruise_id,track_summary'
+        with self.captureOnCommitCallbacks(execute=True):
+            for hour in range(3):
+                last = Position.objects.create(cruise=self.cruise, date=date(2024, 1, 1), time=time(hour), lat=-17, lon=178 + hour / 10)
+        self.client.get(url)
+        last.time = time(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            last.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['track_summary']['end_time'], '2024-01-01T05:00:00Z')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InstrumentationTests(SimpleTestCase):
+    def test_spans_add_up_per_request(self):
+        record = RequestRecord()
+        token = current_request.set(record)
+        try:
+            for _ in range(3):
+                with span('serialize'), span('serialize'):
+                    pass
+        finally:
+            current_request.reset(token)
+        self.assertEqual(list(record.spans), ['serialize'])
+        header = record.server_timing(0.0123)
+        self.assertTrue(header.startswith('db;dur=0.0;desc="0 queries", serialize;dur='))
+        self.assertTrue(header.endswith('total;dur=12.3'))
+
+    def test_serialization_is_timed_once_per_response(self):
+        scientists = [Scientist(first_name='Ana', last_name=f'Tui {i}') for i in range(3)]
+        with mock.patch('cruises.serializers.span', wraps=span) as timed:
+            data = ScientistSerializer(scientists, many=True).data
+        self.assertEqual(len(data), 3)
+        timed.assert_called_once_with('serialize')
+
+    def test_exposition_format(self):
+        metrics = Metrics()
+        metrics.add('http_requests_total', (('view', 'cruise-list'), ('method', 'GET'), ('status', '200')), 2)
+        metrics.observe('span_duration_seconds', (('span', 'route-rebuild'),), 0.3)
+        snapshot = metrics.snapshot()
+        lines = render_metrics(snapshot['counters'], snapshot['histograms']).splitlines()
+        self.assertIn('# TYPE http_requests_total counter', lines)
+        self.assertIn('http_requests_total{view="cruise-list",method="GET",status="200"} 2.0', lines)
+        self.assertIn('span_duration_seconds_bucket{span="route-rebuild",le="0.25"} 0', lines)
+        self.assertIn('span_duration_seconds_bucket{span="route-rebuild",le="0.5"} 1', lines)
+        self.assertIn('span_duration_seconds_bucket{span="route-rebuild",le="+Inf"} 1', lines)
+        self.assertIn('span_duration_seconds_count{span="route-rebuild"} 1', lines)
+
+    def test_processes_are_added_up(self):
+        cache.clear()
+        labels = (('view', 'tile'),)
+        with mock.patch('cruises.instrumentation.metrics', Metrics()) as current:
+            for value in (1, 2):
+                process = Metrics()
+                process.add('http_response_bytes_total', labels, value)
+                process.flush(force=True)
+            current.add('http_response_bytes_total', labels, 4)
+            counters, _ = collected_metrics()
+        self.assertEqual(counters['http_response_bytes_total', labels], 7)
+
+    def test_idle_slots_are_retired_and_reused(self):
+        cache.clear()
+        labels = (('view', 'tile'),)
+        idle, started = Metrics(), Metrics()
+        idle.add('http_response_bytes_total', labels, 1)
+        idle.flush(force=True)
+        # As if it had gone without a request for longer than the slot timeout.
+        idle.stored_at = 0
+        cache.set(process_key(idle.slot), {**cache.get(process_key(idle.slot)), 'at': 0}, None)
+        started.add('http_response_bytes_total', labels, 2)
+        started.flush(force=True)
+        self.assertEqual(started.slot, 1)
+        with mock.patch('cruises.instrumentation.metrics', started):
+            counters, _ = collected_metrics()
+        self.assertEqual(counters['http_response_bytes_total', labels], 3)
+        idle.add('http_response_bytes_total', labels, 4)
+        idle.flush(force=True)
+        self.assertEqual((idle.slot, cache.get(PROCESS_COUNT_KEY)), (2, 2))
+        with mock.patch('cruises.instrumentation.metrics', started):
+            counters, _ = collected_metrics()
+        self.assertEqual(counters['http_response_bytes_total', labels], 7)
+
+
+class SyntheticTrackTests(SimpleTestCase):
+    def test_tracks_are_seeded_and_continuous(self):
+        seconds, lon, lat = synthetic_track(2000, np.random.default_rng(7))
+        again = synthetic_track(2000, np.random.default_rng(7))
+        self.assertTrue(all(np.array_equal(a, b) for a, b in zip((seconds, lon, lat), again)))
+        self.assertTrue((np.diff(seconds) == 60).all())
+        steps = haversine(lon[:-1], lat[:-1], lon[1:], lat[1:])
+        # About 10 knots for a minute, give or take the speed wander and GPS noise.
+        self.assertTrue(((steps > 250) & (steps < 370)).all())
+        self.assertEqual((np.abs(np.diff(lon)) > 180).sum(), 1)
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class FakeDataTests(TestCase):
+    def test_database_and_csv_share_keys(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch('cruises.management.commands.generate_fake_data.default_storage'):
+            call_command('generate_fake_data', cruises=3, positions=300, seed=1, stdout=io.StringIO())
+            call_command('generate_fake_data', cruises=3, positions=300, seed=1, csv=directory, stdout=io.StringIO())
+            with open(f'{directory}/positions.csv') as file:
+                rows = list(csv.DictReader(file))
+            with open(f'{directory}/cruises.csv') as file:
+                cruise_ids = {row['cruise_id'] for row in csv.DictReader(file)}
+        self.assertEqual(Position.objects.count(), 300)
+        self.assertEqual(len(rows), 300)
+        self.assertTrue({row['cruise'] for row in rows} <= cruise_ids)
+        for cruise in Cruise.objects.all():
+            self.assertEqual(cruise.route.n_points, cruise.positions.count())
+            self.assertTrue(cruise.legs.exists() and cruise.scientists.exists())
+
+
+class FakeDataCsvTests(SimpleTestCase):
+    def test_empty_tables_get_headers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_fake_data', users=0, cruises=0, positions=0, csv=directory, stdout=io.StringIO())
+            with open(f'{directory}/cruises.csv') as file:
+                self.assertEqual(file.read().splitlines(), [','.join(CSV_FIELDS['cruises'])])
+            with open(f'{directory}/positions.csv') as file:
+                self.assertEqual(file.read().splitlines(), ['date,time,lat,lon,cruise'])
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False)
+class SyntheticCopyTests(TestCase):
+    def test_copied_fixes_match_saved_positions(self):
+        cruises = [make_cruise('First'), make_cruise('Second')]
+        rng = np.random.default_rng(3)
+        seconds, lon, lat = synthetic_track(10, rng)
+        track = np.repeat([0, 1], 5)
+        self.assertEqual(copy_fixes([cruise.pk for cruise in cruises], track, seconds, lon, lat), 10)
+        positions = list(Position.objects.filter(cruise=cruises[1]).order_by('timestamp'))
+        self.assertEqual(len(positions), 5)
+        first = positions[0]
+        self.assertEqual(first.timestamp, datetime.fromtimestamp(seconds[5], dt_timezone.utc))
+        self.assertEqual(first.lon, Decimal(f'{lon[5]:.6f}'))
+        self.assertEqual((first.coordinates.x, first.coordinates.y), (float(first.lon), float(first.lat)))
+
+
+class WKBPointTests(SimpleTestCase):
+    def test_points_are_iso_wkb_with_nulls_for_missing_coordinates(self):
+        points = wkb_points(np.array([178.5, np.nan, -179.25]), np.array([-17.0, -17.5, np.nan]))
+        self.assertEqual(points.null_count, 2)
+        self.assertEqual(points[0].as_py(), bytes.fromhex('0101000000') + np.array([178.5, -17.0], dtype='<f8').tobytes())
+        self.assertEqual(len(points[0].as_py()), WKB_POINT.itemsize)
+        self.assertIsNone(points[1].as_py())
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, EXPORT_CHUNK_SIZE=4, CACHES=LOCMEM_CACHES)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.enterContext(override_settings(EXPORT_ROOT=self.root.name))
+        self.addCleanup(self.root.cleanup)
+        self.cruises = [make_cruise('First'), make_cruise('Second')]
+        seconds, lon, lat = synthetic_track(10, np.random.default_rng(5))
+        copy_fixes([cruise.pk for cruise in self.cruises], np.repeat([0, 1], [7, 3]), seconds, lon, lat)
+
+    def export(self, format):
+        export = Export.objects.create(format=format)
+        export.cruises.set(self.cruises)
+        return run_export(export)
+
+    def test_csv_loads_back(self):
+        export = self.export('csv')
+        self.assertEqual((export.status, export.rows), ('done', 10))
+        expected = sorted(Position.objects.values_list('cruise_id', 'timestamp', 'lat', 'lon'))
+        Position.objects.all().delete()
+        with export.file.open('r') as file:
+            ingest_positions(io.StringIO(file.read()), clean=False)
+        self.assertEqual(sorted(Position.objects.values_list('cruise_id', 'timestamp', 'lat', 'lon')), expected)
+
+    def test_netcdf_trajectories(self):
+        export = self.export('netcdf')
+        with netCDF4.Dataset(export.file.path) as dataset:
+            self.assertEqual(dataset.featureType, 'trajectory')
+            trajectories = list(dataset['trajectory'][:])
+            sizes = dict(zip(trajectories, dataset['rowSize'][:].tolist()))
+            self.assertEqual(sizes, {str(self.cruises[0].pk): 7, str(self.cruises[1].pk): 3})
+            self.assertTrue((np.diff(dataset['time'][:7]) == 60).all())
+
+    def test_parquet_geo_metadata(self):
+        export = self.export('parquet')
+        table = pq.read_table(export.file.path)
+        self.assertEqual(table.num_rows, 10)
+        geo = json.loads(table.schema.metadata[b'geo'])
+        self.assertEqual(geo['primary_column'], 'geometry')
+        self.assertEqual(len(geo['columns']['geometry']['bbox']), 4)
+
+    def test_exports_need_a_user_and_staff_for_every_cruise(self):
+        body = {'format': 'csv', 'cruises': [str(self.cruises[0].pk)]}
+        self.assertEqual(self.client.post('/api/exports/', body).status_code, 403)
+        self.client.force_login(User.objects.create_user(username='analyst', password='password'))
+        self.assertEqual(self.client.post('/api/exports/', {'format': 'csv'}).status_code, 403)
+        response = self.client.post('/api/exports/', body)
+        self.assertEqual((response.status_code, response.json()['rows']), (201, 7))
+        self.assertFalse(Export.objects.filter(cruises__isnull=True).exists())
+
+    def test_only_the_owner_downloads(self):
+        owner = User.objects.create_user(username='analyst', password='password')
+        self.client.force_login(owner)
+        export = self.client.post('/api/exports/', {'format': 'csv', 'cruises': [str(self.cruises[0].pk)]}).json()
+        self.assertEqual(Export.objects.get().user, owner)
+        self.assertTrue(export['download_url'].endswith(f"/api/exports/{export['export_id']}/download/"))
+        response = self.client.get(export['download_url'])
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1 + 7)
+        with override_settings(EXPORT_ACCEL_REDIRECT='/protected/'):
+            response = self.client.get(export['download_url'])
+        self.assertEqual(response['X-Accel-Redirect'], f"/protected/exports/{export['export_id']}.csv")
+        self.client.force_login(User.objects.create_user(username='other', password='password'))
+        self.assertEqual(self.client.get(export['download_url']).status_code, 404)
+        self.assertEqual(self.client.get(f"/api/exports/{export['export_id']}/").status_code, 404)
+
+
+class PositionTimestampTests(SimpleTestCase):
+    def test_date_and_time_read_as_utc(self):
+        self.assertEqual(fix_timestamp('2024-01-02', '13:45:10'), datetime(2024, 1, 2, 13, 45, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(fix_timestamp(date(2024, 1, 2), time(0)), datetime(2024, 1, 2, tzinfo=dt_timezone.utc))
+        self.assertIsNone(fix_timestamp(None, time(0)))
+
+
+class TrackFilterTests(SimpleTestCase):
+    def run_filter(self, seconds, lon, lat, stored=None, cruises=None, **limits):
+        seconds = np.array(seconds, dtype=float)
+        return filter_track(
+            np.array(cruises or ['a'] * len(seconds)), seconds, np.array(lon, dtype=float), np.array(lat, dtype=float),
+            np.array(stored or [False] * len(seconds)), **limits,
+        )
+
+    def test_duplicates_keep_the_first_fix(self):
+        keep, dropped = self.run_filter([0, 10, 0, 10], [178, 178.1, 179, 178.2], [-17] * 4, cruises=['a', 'a', 'a', 'b'])
+        self.assertEqual(keep.tolist(), [True, True, False, True])
+        self.assertEqual(dropped, {'duplicate': 1})
+
+    def test_speed_gate_drops_spikes(self):
+        keep, dropped = self.run_filter([0, 60, 120, 180], [178, 178.001, 179, 178.003], [-17] * 4, max_speed=20)
+        self.assertEqual(keep.tolist(), [True, True, False, True])
+        self.assertEqual(dropped, {'speed': 1})
+
+    def test_thinning_keeps_one_fix_per_interval_on_station(self):
+        seconds = list(range(0, 300, 5))
+        jitter = [178 + (i % 3) * 0.00005 for i in range(len(seconds))]
+        keep, dropped = self.run_filter(seconds, jitter, [-17] * len(seconds), min_distance=25, min_interval=60)
+        self.assertEqual(np.flatnonzero(keep).tolist(), [0, 12, 24, 36, 48])
+        self.assertEqual(dropped, {'thinned': len(seconds) - 5})
+
+    def test_stored_fixes_are_never_dropped(self):
+        keep, dropped = self.run_filter(
+            [0, 5, 5, 10], [178, 178, 178, 178], [-17] * 4, stored=[False, True, False, False], min_interval=60,
+        )
+        self.assertEqual(keep.tolist(), [True, True, False, False])
+        self.assertEqual(dropped, {'duplicate': 1, 'thinned': 1})
+
+    def test_fixes_without_coordinates_are_only_deduplicated(self):
+        keep, dropped = self.run_filter([0, 1, 2], [178, np.nan, 178], [-17, np.nan, -17], min_interval=60)
+        self.assertEqual(keep.tolist(), [True, True, False])
+
+
+class UnderwayParsingTests(SimpleTestCase):
+    cruise_id = '6f1c2a64-4f1e-4c57-9d2b-6a0f4cf3d5a1'
+
+    def test_nmea_batch(self):
+        body = (
+            b'$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A\r\n'
+            b'$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47\r\n'
+            b'$GPRMC,123520,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*00\r\n'
+            b'$GPRMC,123521.50,V,1710.000,S,17830.000,W,,,230394,,\r\n'
+            b'$GPRMC,123522.25,A,1710.000,S,17830.000,W,,,230394,,\r\n'
+        )
+        sequence, entries = parse_batch(self.cruise_id, body, 'text/plain', sequence=7)
+        self.assertEqual(sequence, 7)
+        first, other, bad_checksum, void, last = entries
+        self.assertEqual((first['date'], first['time'], first['lat'], first['lon']), ('1994-03-23', '12:35:19', '48.117300', '11.516667'))
+        self.assertIsNone(other)
+        self.assertIsInstance(bad_checksum, FixError)
+        self.assertIsInstance(void, FixError)
+        self.assertEqual((last['time'], last['lat'], last['lon']), ('12:35:22.250000', '-17.166667', '-178.500000'))
+
+    def test_malformed_checksum_rejects_only_its_fix(self):
+        body = (
+            b'$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*ZZ\r\n'
+            b'$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A\r\n'
+        )
+        _, (malformed, fix) = parse_batch(self.cruise_id, body, 'text/plain', sequence=1)
+        self.assertIsInstance(malformed, FixError)
+        self.assertEqual(str(malformed), "Malformed checksum.")
+        self.assertEqual(fix['lat'], '48.117300')
+
+    def test_json_batch(self):
+        body = json.dumps({'sequence': 1, 'fixes': [
+            {'timestamp': '2024-01-02T10:00:00+10:00', 'lat': -17.5, 'lon': 178.25},
+            {'timestamp': '2024-01-02T01:00:00', 'lat': -95, 'lon': 178.25},
+            {'lat': -17.5},
+        ]})
+        _, (fix, out_of_range, incomplete) = parse_batch(self.cruise_id, body.encode(), 'application/json')
+        self.assertEqual((fix['cruise'], fix['date'], fix['time']), (self.cruise_id, '2024-01-02', '00:00:00'))
+        self.assertIsInstance(out_of_range, FixError)
+        self.assertIsInstance(incomplete, FixError)
+
+    def test_sequence_is_required(self):
+        with self.assertRaises(FixError):
+            parse_batch(self.cruise_id, b'{"fixes": []}', 'application/json')
+        with self.assertRaises(FixError):
+            parse_batch(self.cruise_id, b'$GPRMC', 'text/plain', sequence=0)
+
+
+@override_settings(INGEST_REDIS_URL='redis://localhost:6379/0', ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class UnderwayFlushTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+        self.redis = redis.Redis.from_url(settings.INGEST_REDIS_URL)
+        keys = [BUFFER_KEY, PROCESSING_KEY, DEAD_LETTER_KEY, FLUSH_PENDING_KEY, sequence_key(self.cruise.pk)]
+        self.redis.delete(*keys)
+        self.addCleanup(self.redis.delete, *keys)
+
+    def fix(self, hour):
+        return fix_row(self.cruise.pk, datetime(2024, 1, 2, hour, tzinfo=dt_timezone.utc), -17.5, 178 + hour / 10)
+
+    def test_interrupted_batch_is_reloaded_once(self):
+        committed, left = self.fix(0), self.fix(1)
+        copy_positions([committed])
+        # A flush died after committing part of what it had taken off the buffer.
+        self.redis.rpush(PROCESSING_KEY, json.dumps(committed), json.dumps(left))
+        self.redis.rpush(BUFFER_KEY, json.dumps(self.fix(2)))
+        self.assertEqual(flush_buffer(), Counter({str(self.cruise.pk): 2}))
+        self.assertEqual(self.cruise.positions.count(), 3)
+        self.assertEqual(self.redis.exists(BUFFER_KEY, PROCESSING_KEY), 0)
+
+    @override_settings(INGEST_FLUSH_SIZE=1)
+    def test_full_buffer_queues_one_flush(self):
+        first = async_to_sync(buffer_fixes)(self.cruise.pk, 1, [self.fix(0)])
+        second = async_to_sync(buffer_fixes)(self.cruise.pk, 2, [self.fix(1)])
+        self.assertEqual((first, second), ((1, 1, 0), (2, 1, None)))
+
+
+class IngestAuthorizationTests(SimpleTestCase):
+    def authorized(self, **headers):
+        return ingest_authorized(RequestFactory().post('/api/ingest/', headers=headers))
+
+    def test_ingestion_fails_closed_without_a_token(self):
+        with override_settings(INGEST_TOKEN='', DEBUG=False):
+            self.assertFalse(self.authorized())
+        with override_settings(INGEST_TOKEN='', DEBUG=True):
+            self.assertTrue(self.authorized())
+
+    def test_bearer_token(self):
+        with override_settings(INGEST_TOKEN='s3cret', DEBUG=True):
+            self.assertTrue(self.authorized(Authorization='Bearer s3cret'))
+            self.assertFalse(self.authorized(Authorization='Bearer guess'))
+            self.assertFalse(self.authorized())
+
+
+class NginxRoutingTests(SimpleTestCase):
+    """Requests sent to uvicorn by the regex locations of nginx.conf reach the API, not the React app."""
+    CRUISE_ID = '0b6c7f0e-4a4e-4f7e-9a43-5d1c7a4ad0f1'
+
+    def asgi_locations(self):
+        conf = (settings.BASE_DIR / 'nginx.conf').read_text()
+        blocks = re.findall(r'location ~ (\S+) \{(.*?)\}', conf, re.S)
+        return [(pattern, re.search(r'proxy_pass (\S+);', body).group(1)) for pattern, body in blocks if 'http://asgi' in body]
+
+    def upstream_path(self, request_path):
+        uri = re.sub('/{2,}', '/', request_path)  # merge_slashes, on by default
+        for pattern, proxy_pass in self.asgi_locations():
+            if re.search(pattern, uri):
+                self.assertEqual(proxy_pass, 'http://asgi$uri$is_args$args', pattern)
+                return uri
+        self.fail(f"No asgi location matches {request_path}")
+
+    def test_reads_reach_the_api(self):
+        for request_path in ['/api/cruises/', f'/api//cruises/{self.CRUISE_ID}/', f'/api/cruises/{self.CRUISE_ID}/positions/']:
+            with self.subTest(request_path):
+                self.assertNotEqual(resolve(self.upstream_path(request_path)).url_name, 'home')
+
+    def test_live_events_reach_the_api(self):
+        match = resolve(self.upstream_path(f'/api//cruises/{self.CRUISE_ID}/live/'))
+        self.assertEqual(match.url_name, 'cruise-live')
+
+
+@override_settings(LIVE_REDIS_URL='redis://localhost:6379/0')
+class LiveEventTests(TestCase):
+    def test_loaded_rows_are_one_event_per_cruise(self):
+        cruise_id = '6f1c2a64-4f1e-4c57-9d2b-6a0f4cf3d5a1'
+        rows = [
+            {'position_id': f'0000000{i}-0000-0000-0000-000000000000', 'cruise': cruise_id,
+             'date': '2024-01-02', 'time': f'0{i}:00:00', 'lat': '-17.500000', 'lon': '178.250000'}
+            for i in range(2)
+        ]
+        with mock.patch('cruises.live.redis_client') as client, self.captureOnCommitCallbacks(execute=True):
+            publish_rows(rows)
+        channel, message = client.return_value.publish.call_args.args
+        self.assertEqual(channel, f'cruise-live:{cruise_id}')
+        self.assertTrue(message.startswith('event: positions\ndata: ') and message.endswith('\n\n'))
+        features = json.loads(message.split('data: ', 1)[1])['features']
+        self.assertEqual([f['properties']['time'] for f in features], ['00:00:00', '01:00:00'])
+        self.assertEqual(features[0]['geometry'], {'type': 'Point', 'coordinates': [178.25, -17.5]})
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False, CACHES=LOCMEM_CACHES)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.cruise = make_cruise()
+        with deferred_route_updates():
+            for day in range(1, 4):
+                Position.objects.create(cruise=self.cruise, date=date(2024, 1, day), time=time(6), lat=-17, lon=176 + day)
+        self.route = Route.objects.get(cruise=self.cruise)
+
+    def test_archive_keeps_the_route(self):
+        self.assertEqual(archive_cruises([self.cruise.pk]), 3)
+        self.assertFalse(Position.objects.filter(cruise=self.cruise).exists())
+        self.assertFalse(self.route.segments.exists())
+        archived = ArchivedPosition.objects.filter(cruise=self.cruise).order_by('timestamp')
+        self.assertEqual(archived[0].timestamp, datetime(2024, 1, 1, 6, tzinfo=dt_timezone.utc))
+        route = Route.objects.get(pk=self.route.pk)
+        self.assertEqual(route.n_points, 3)
+        self.assertEqual(route.path.coords, self.route.path.coords)
+
+    def test_restore_rebuilds_segments(self):
+        archive_cruises([self.cruise.pk])
+        self.assertEqual(restore_cruises([self.cruise.pk]), 3)
+        self.assertFalse(ArchivedPosition.objects.exists())
+        self.assertEqual(list(Position.objects.filter(cruise=self.cruise).order_by('timestamp').values_list('date', flat=True)),
+                         [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)])
+        self.assertEqual(self.route.segments.count(), 2)
+
+
+@override_settings(ROUTE_REBUILD_ASYNC=False)
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the hot queries with sequential scans priced out.
+
+    The planner then only falls back to one when no index can serve the
+    query, so a ``Seq Scan`` in the plan means an index has gone missing.
+    """
+
+    def setUp(self):
+        self.cruise = make_cruise()
+        Position.objects.create(cruise=self.cruise, date=date(2024, 1, 1), time=time(0), lat=-17, lon=178)
+        Position.objects.create(cruise=self.cruise, date=date(2024, 1, 2), time=time(0), lat=-17, lon=179)
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN {sql}', params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute('RESET enable_seqscan')
+
+    def assertUsesIndex(self, queryset_or_sql, index=None, params=()):
+        if isinstance(queryset_or_sql, str):
+            plan = self.explain(queryset_or_sql, params)
+        else:
+            plan = self.explain(*queryset_or_sql.query.sql_with_params())
+        self.assertNotIn('Seq Scan', plan)
+        if index is not None:
+            self.assertIn(index, plan)
+
+    def test_track_order(self):
+        self.assertUsesIndex(Route.objects.get(cruise=self.cruise).track_positions(), 'position_track_idx')
+        self.assertUsesIndex(Position.objects.order_by('-timestamp')[:100], 'position_recent_idx')
+
+    def test_time_range(self):
+        moment = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        self.assertUsesIndex(Position.objects.filter(at_or_after(moment)), 'position_recent_idx')
+
+    def test_cruise_children(self):
+        self.assertUsesIndex(Leg.objects.filter(cruise=self.cruise), 'leg_cruise_start_idx')
+        self.assertUsesIndex(Scientist.objects.filter(cruise=self.cruise), 'scientist_cruise_name_idx')
+
+    def test_spatial_lookups(self):
+        self.assertUsesIndex(Segment.objects.filter(path__intersects=bbox_polygon(170, -20, 180, -10)))
+        self.assertUsesIndex(Position.objects.filter(bbox_filter(170, -20, 180, -10)))
+
+    def test_vector_tiles(self):
+        params = {'z': 2, 'x': 3, 'y': 2, 'layer': 'routes', 'extent': 4096, 'buffer': 64, 'margin': 1 / 64, 'max_lat': 85, 'limit': 10000}
+        for layer, index in (('routes', 'route_path_geometry_idx'), ('segments', 'segment_path_geometry_idx'), ('positions', 'position_geometry_idx')):
+            with self.subTest(layer=layer):
+                self.assertUsesIndex(tile_sql(layer), index, params)
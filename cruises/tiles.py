@@ -0,0 +1,175 @@
+"""
+Mapbox Vector Tiles for the route, segment and position layers.
+
+Tiles are rendered by PostGIS with ``ST_AsMVT`` and cached. Routes are stored
+already split at the antimeridian, so each piece projects cleanly into Web
+Mercator; column numbers outside the grid are wrapped back onto it, so maps
+showing copies of the world either side of the dateline get the same tiles.
+
+Cached tiles are keyed by generation counters kept for every tile down to
+``TILE_INVALIDATION_ZOOM``; deeper tiles share the counter of their ancestor
+at that zoom. Saving a route path bumps the counters of the tiles its old and
+new bounding boxes touch, so only the cached tiles around that cruise are
+dropped. A global counter drops every tile at once, for changes with no
+bounding box at hand.
+
+The positions layer is left empty below ``TILE_POSITIONS_MIN_ZOOM``, where a
+tile would cover most of the ocean, and holds at most ``TILE_POSITIONS_LIMIT``
+positions.
+"""
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Cruise, Position, Route, Segment
+
+logger = logging.getLogger(__name__)
+
+LAYERS = ('routes', 'segments', 'positions')
+
+TILE_GENERATION_KEY = 'tiles:generation'
+
+# Web Mercator stops short of the poles; geometry beyond this is clipped off.
+MERCATOR_MAX_LATITUDE = 85.0511287798066
+
+
+def quoted(model, field=None):
+    name = model._meta.db_table if field is None else model._meta.get_field(field).column
+    return connection.ops.quote_name(name)
+
+
+def layer_sources():
+    """The FROM clause, geography column and properties of each layer."""
+    route, cruise, segment, position = (quoted(m) for m in (Route, Cruise, Segment, Position))
+    return {
+        'routes': (
+            f'{route} t JOIN {cruise} c ON c.{quoted(Cruise, "cruise_id")} = t.{quoted(Route, "cruise")}',
+            f't.{quoted(Route, "path")}',
+            f't.{quoted(Route, "cruise")}::text AS cruise_id, c.{quoted(Cruise, "cruise_name")} AS cruise_name',
+        ),
+        'segments': (
+            f'{segment} t JOIN {route} r ON r.{quoted(Route, "id")} = t.{quoted(Segment, "route")}',
+            f't.{quoted(Segment, "path")}',
+            f'r.{quoted(Route, "cruise")}::text AS cruise_id',
+        ),
+        'positions': (
+            f'{position} t',
+            f't.{quoted(Position, "coordinates")}',
+            f't.{quoted(Position, "cruise")}::text AS cruise_id, t.{quoted(Position, "date")}::text AS date, '
+            f't.{quoted(Position, "time")}::text AS time',
+        ),
+    }
+
+
+def tile_sql(layer):
+    source, geography, properties = layer_sources()[layer]
+    # Cast exactly as the geometry indexes on these columns are defined.
+    geometry = f'{geography}::geometry(GEOMETRY,4326)'
+    return f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+                   ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), 4326) AS area
+        ),
+        features AS (
+            SELECT ST_AsMVTGeom(
+                       ST_Transform(ST_ClipByBox2D({geometry}, ST_MakeEnvelope(-180, -%(max_lat)s, 180, %(max_lat)s, 4326)), 3857),
+                       bounds.tile, %(extent)s, %(buffer)s
+                   ) AS geom,
+                   {properties}
+            FROM {source}, bounds
+            WHERE {geometry} && bounds.area
+            {'LIMIT %(limit)s' if layer == 'positions' else ''}
+        )
+        SELECT ST_AsMVT(features, %(layer)s, %(extent)s, 'geom') FROM features WHERE geom IS NOT NULL
+    """
+
+
+def generation_key(z, x, y):
+    return f'{TILE_GENERATION_KEY}:{z}/{x}/{y}'
+
+
+def tile_key(layer, z, x, y):
+    shift = max(z - settings.TILE_INVALIDATION_ZOOM, 0)
+    region = generation_key(z - shift, x >> shift, y >> shift)
+    generations = cache.get_many([TILE_GENERATION_KEY, region])
+    return f'tiles:{generations.get(TILE_GENERATION_KEY, 0)}.{generations.get(region, 0)}:{layer}:{z}/{x}/{y}'
+
+
+def render_tile(layer, z, x, y):
+    """The MVT bytes for one tile of ``layer``, from the cache when possible."""
+    if layer == 'positions' and z < settings.TILE_POSITIONS_MIN_ZOOM:
+        return b''
+    x %= 2 ** z
+    key = tile_key(layer, z, x, y)
+    tile = cache.get(key)
+    if tile is not None:
+        return tile
+    params = {
+        'z': z, 'x': x, 'y': y, 'layer': layer,
+        'extent': settings.TILE_EXTENT, 'buffer': settings.TILE_BUFFER,
+        'margin': settings.TILE_BUFFER / settings.TILE_EXTENT, 'max_lat': MERCATOR_MAX_LATITUDE,
+        'limit': settings.TILE_POSITIONS_LIMIT,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(tile_sql(layer), params)
+        tile = bytes(cursor.fetchone()[0] or b'')
+    cache.set(key, tile, settings.TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def tile_column(lon, z):
+    return (lon + 180) / 360 * 2 ** z
+
+
+def tile_row(lat, z):
+    lat = math.radians(max(-MERCATOR_MAX_LATITUDE, min(MERCATOR_MAX_LATITUDE, lat)))
+    return (1 - math.asinh(math.tan(lat)) / math.pi) / 2 * 2 ** z
+
+
+def covering_tiles(bounds, z):
+    """
+    The tiles at zoom ``z`` a (west, south, east, north) box shows up in, their buffers included.
+
+    A box with ``west`` greater than ``east`` runs across the antimeridian.
+    """
+    west, south, east, north = bounds
+    margin = settings.TILE_BUFFER / settings.TILE_EXTENT
+    size = 2 ** z
+    first = math.floor(tile_column(west, z) - margin)
+    last = math.floor(tile_column(east, z) + margin)
+    if west > east:
+        last += size
+    columns = range(first, last + 1) if last - first < size else range(size)
+    rows = range(max(math.floor(tile_row(north, z) - margin), 0), min(math.floor(tile_row(south, z) + margin), size - 1) + 1)
+    return {(x % size, y) for x in columns for y in rows}
+
+
+def invalidate_tiles(*bounds):
+    """
+    Drop the cached tiles touching any of the ``bounds`` boxes once the current transaction commits.
+
+    ``None`` entries are skipped; with no boxes at all, every cached tile is dropped.
+    """
+    if not bounds:
+        keys = [TILE_GENERATION_KEY]
+    else:
+        keys = [
+            generation_key(z, x, y)
+            for z in range(settings.TILE_INVALIDATION_ZOOM + 1)
+            for x, y in set().union(*(covering_tiles(box, z) for box in bounds if box is not None))
+        ]
+    transaction.on_commit(lambda: _bump_tile_generations(keys))
+
+
+def _bump_tile_generations(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+        except Exception as e:
+            logger.error(f"Could not invalidate cached tiles under {key}: {e}")
+            return
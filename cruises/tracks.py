@@ -0,0 +1,114 @@
+"""
+Compact binary tracks.
+
+A track is sent as a msgpack map instead of GeoJSON, for clients that only
+need the fixes themselves:
+
+``version``
+    Format version, currently 1.
+``cruise_id``
+    The cruise the track belongs to.
+``count``
+    Number of fixes.
+``start``
+    ``[time, lon, lat]`` of the first fix, as plain integers.
+``time``, ``lon``, ``lat``
+    msgpack ``bin`` values, each ``count`` little-endian int32s holding the
+    change from the previous fix (0 for the first), so ``start`` plus a
+    running sum restores them. ``time`` is in seconds since the Unix epoch
+    (UTC), ``lon`` and ``lat`` in microdegrees.
+
+Only positions with coordinates are included, in track order. Consecutive
+fixes are seconds and a few hundred microdegrees apart, so the deltas are
+small numbers that compress well if the response is gzipped as well.
+"""
+import numpy as np
+from django.db import connections
+from django.db.models import BigIntegerField, Func, IntegerField
+
+from .models import POSITION_ORDERING
+
+TRACK_VERSION = 1
+TRACK_MEDIA_TYPE = 'application/vnd.pacific-cruises.track+msgpack'
+TRACK_ARRAYS = ('time', 'lon', 'lat')
+TRACK_DTYPE = np.dtype('<i4')
+
+# A row of a binary COPY of (bigint, integer, integer): the field count, then each field's length and value.
+COPY_ROW = np.dtype([
+    ('fields', '>i2'),
+    ('time_size', '>i4'), ('time', '>i8'),
+    ('lon_size', '>i4'), ('lon', '>i4'),
+    ('lat_size', '>i4'), ('lat', '>i4'),
+])
+# The signature, flags and (empty) extension ahead of the rows, and the -1 field count after them.
+COPY_HEADER_SIZE = 19
+COPY_TRAILER_SIZE = 2
+
+
+class EpochSeconds(Func):
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)::bigint'
+    output_field = BigIntegerField()
+
+
+class Microdegrees(Func):
+    template = 'ROUND(%(expressions)s * 1000000)::integer'
+    output_field = IntegerField()
+
+
+def track_array(queryset):
+    """
+    An (n, 3) int64 array of epoch seconds, lon and lat microdegrees, in track order.
+
+    The fixes are read with a binary ``COPY`` into one buffer of 30 bytes a
+    fix, and the array is filled from it column by column.
+    """
+    rows = (
+        queryset.filter(lat__isnull=False, lon__isnull=False)
+        .order_by(*POSITION_ORDERING)
+        .values_list(EpochSeconds('timestamp'), Microdegrees('lon'), Microdegrees('lat'))
+    )
+    sql, params = rows.query.get_compiler(using=rows.db).as_sql()
+    buffer = bytearray()
+    with connections[rows.db].cursor() as cursor:
+        with cursor.copy(f'COPY ({sql}) TO STDOUT (FORMAT BINARY)', params) as copy:
+            for chunk in copy:
+                buffer += chunk
+    return copied_track(buffer)
+
+
+def copied_track(buffer):
+    """The (n, 3) int64 array held in the output of a binary ``COPY`` of ``track_array``'s columns."""
+    count = (len(buffer) - COPY_HEADER_SIZE - COPY_TRAILER_SIZE) // COPY_ROW.itemsize
+    rows = np.frombuffer(buffer, dtype=COPY_ROW, count=count, offset=COPY_HEADER_SIZE)
+    track = np.empty((count, 3), dtype=np.int64)
+    for i, name in enumerate(TRACK_ARRAYS):
+        track[:, i] = rows[name]
+    return track
+
+
+def delta_encode(values):
+    return np.diff(values, prepend=values[:1]).astype(TRACK_DTYPE)
+
+
+def delta_decode(start, buffer):
+    return start + np.cumsum(np.frombuffer(buffer, dtype=TRACK_DTYPE), dtype=np.int64)
+
+
+def encode_track(queryset, cruise_id):
+    """The msgpack-ready map for the positions of ``queryset``."""
+    track = track_array(queryset)
+    envelope = {
+        'version': TRACK_VERSION,
+        'cruise_id': str(cruise_id),
+        'count': len(track),
+        'start': track[0].tolist() if len(track) else [0, 0, 0],
+    }
+    for name, column in zip(TRACK_ARRAYS, track.T):
+        envelope[name] = memoryview(delta_encode(column))
+    return envelope
+
+
+def decode_track(envelope):
+    """The (n, 3) array of epoch seconds and microdegrees held in a decoded track map."""
+    columns = [delta_decode(start, envelope[name]) for start, name in zip(envelope['start'], TRACK_ARRAYS)]
+    return np.column_stack(columns).reshape(-1, 3)
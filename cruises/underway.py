@@ -0,0 +1,300 @@
+"""
+Live position fixes streamed from ships underway.
+
+Ships post batches of fixes to ``/api/ingest/<cruise_id>/``, either as JSON
+or as raw NMEA ``RMC`` sentences. Every fix a ship sends carries a sequence
+number, counting up from 1 per cruise: a JSON batch gives the number of its
+first fix, an NMEA batch passes it as ``?sequence=``, and the fixes (or
+sentence lines) that follow are numbered on from it. Fixes are parsed and
+checked in plain Python, then appended to a buffer list in Redis. The same
+step records the highest sequence number received, which is sent back as the
+acknowledgement. After a dropped link a ship asks for that number and resends
+from the fix after it. Fixes the server already has are ignored, and a batch
+that would leave a gap is refused.
+
+The buffer is written to the positions table with ``COPY`` by a Celery task.
+The first fix to reach an empty buffer queues the task ``INGEST_FLUSH_INTERVAL``
+seconds out, and a batch that brings ``INGEST_FLUSH_SIZE`` fixes or more
+queues it at once, unless a flush is already pending. Flushes take a lock, so
+one runs at a time. Each batch is moved to a processing list and only removed
+once its positions are committed, so fixes the server has acknowledged are not
+lost if a worker dies mid-flush: the next flush loads them first.
+"""
+import asyncio
+import json
+import logging
+import math
+import weakref
+from collections import Counter
+from datetime import datetime, timezone
+from functools import reduce
+from operator import xor
+from uuid import uuid4
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.db import transaction
+
+from .caching import invalidate_responses
+from .ingest import copy_positions, filter_rows
+from .live import publish_rows
+from .models import Cruise, Position, deferred_route_updates
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = 'underway:buffer'
+# Batches that failed to load, kept for inspection and replay instead of blocking the buffer.
+DEAD_LETTER_KEY = 'underway:dead-letter'
+FLUSH_PENDING_KEY = 'underway:flush-pending'
+# The batch being loaded, kept until its positions are committed.
+PROCESSING_KEY = 'underway:processing'
+FLUSH_LOCK_KEY = 'underway:flush-lock'
+# How long a flush lock outlives a worker that died holding it; renewed after every batch.
+FLUSH_LOCK_TIMEOUT = 600
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def sequence_key(cruise_id):
+    return f'underway:sequence:{cruise_id}'
+
+
+# Append the fixes of one batch that come after the acknowledged sequence
+# number, and move the acknowledgement past them, in a single step. Returns the
+# acknowledgement, the number of fixes buffered (-1 for a gap) and the buffer length.
+ACCEPT_SCRIPT = """
+local acked = tonumber(redis.call('GET', KEYS[1]) or '0')
+local first = tonumber(ARGV[1])
+if first > acked + 1 then
+    return {acked, -1, redis.call('LLEN', KEYS[2])}
+end
+local buffered = 0
+for i = 2, #ARGV do
+    if first + i - 2 > acked and ARGV[i] ~= '' then
+        redis.call('RPUSH', KEYS[2], ARGV[i])
+        buffered = buffered + 1
+    end
+end
+local last = first + #ARGV - 2
+if last > acked then
+    redis.call('SET', KEYS[1], last)
+    acked = last
+end
+return {acked, buffered, redis.call('LLEN', KEYS[2])}
+"""
+
+# The batch left in the processing list by a flush that died, flagged 1, or
+# else up to ARGV[1] fixes moved there from the front of the buffer, flagged 0.
+TAKE_SCRIPT = """
+local left = redis.call('LRANGE', KEYS[2], 0, -1)
+if #left > 0 then
+    return {1, left}
+end
+local batch = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #batch > 0 then
+    redis.call('LTRIM', KEYS[1], #batch, -1)
+    for i = 1, #batch, 1000 do
+        redis.call('RPUSH', KEYS[2], unpack(batch, i, math.min(i + 999, #batch)))
+    end
+end
+return {0, batch}
+"""
+
+
+class FixError(ValueError):
+    pass
+
+
+def fix_row(cruise_id, moment, lat, lon):
+    """A buffered fix, in the shape :func:`cruises.ingest.copy_positions` reads."""
+    if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+        raise FixError("Latitude must lie in -90..90 and longitude in -180..180.")
+    moment = moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+    return {
+        'position_id': str(uuid4()),
+        'cruise': str(cruise_id),
+        'date': moment.date().isoformat(),
+        'time': moment.time().isoformat(),
+        'lat': f'{lat:.6f}',
+        'lon': f'{lon:.6f}',
+    }
+
+
+def parse_json_fix(cruise_id, fix):
+    """``{"timestamp": ISO 8601, "lat": degrees, "lon": degrees}``; a naive timestamp is UTC."""
+    try:
+        moment = datetime.fromisoformat(fix['timestamp'])
+        lat, lon = float(fix['lat']), float(fix['lon'])
+    except (KeyError, TypeError, ValueError):
+        raise FixError("Expected timestamp, lat and lon.")
+    return fix_row(cruise_id, moment, lat, lon)
+
+
+def nmea_degrees(value, hemisphere, width):
+    """Degrees from NMEA ``[d]ddmm.mmmm`` and its hemisphere letter."""
+    degrees = int(value[:width]) + float(value[width:]) / 60
+    return -degrees if hemisphere in ('S', 'W') else degrees
+
+
+def parse_nmea_sentence(cruise_id, sentence):
+    """
+    The fix in one NMEA sentence, or ``None`` for sentences other than ``RMC``.
+
+    Sentences with a checksum must match it; ``RMC`` sentences flagged void
+    (no fix) are rejected.
+    """
+    if not sentence.startswith('$'):
+        raise FixError("Not an NMEA sentence.")
+    body, _, checksum = sentence[1:].partition('*')
+    if checksum:
+        try:
+            expected = int(checksum[:2], 16)
+        except ValueError:
+            raise FixError("Malformed checksum.")
+        if expected != reduce(xor, body.encode(), 0):
+            raise FixError("Checksum mismatch.")
+    fields = body.split(',')
+    if not fields[0].endswith('RMC'):
+        return None
+    try:
+        if fields[2] != 'A':
+            raise FixError("Receiver reports no fix.")
+        clock, _, fraction = fields[1].partition('.')
+        moment = datetime.strptime(fields[9] + clock, '%d%m%y%H%M%S')
+        moment = moment.replace(microsecond=int(fraction.ljust(6, '0')[:6] or 0))
+        return fix_row(cruise_id, moment, nmea_degrees(fields[3], fields[4], 2), nmea_degrees(fields[5], fields[6], 3))
+    except FixError:
+        raise
+    except (IndexError, ValueError):
+        raise FixError("Malformed RMC sentence.")
+
+
+def parse_batch(cruise_id, body, content_type, sequence=None):
+    """
+    The first sequence number of a batch and one entry per fix it numbers.
+
+    Each entry is a buffered row, ``None`` for an NMEA sentence that carries
+    no position, or the :class:`FixError` that rejected it.
+    """
+    if content_type == 'application/json':
+        try:
+            batch = json.loads(body)
+            sequence, fixes = batch['sequence'], batch['fixes']
+        except (ValueError, TypeError, KeyError):
+            raise FixError("Expected a JSON object with sequence and fixes.")
+        parse, items = parse_json_fix, fixes if isinstance(fixes, list) else None
+    else:
+        parse, items = parse_nmea_sentence, [line.strip() for line in body.decode(errors='replace').splitlines() if line.strip()]
+    if items is None or not isinstance(sequence, int) or isinstance(sequence, bool) or sequence < 1:
+        raise FixError("The sequence number must be a positive integer and fixes a list.")
+    if len(items) > settings.INGEST_MAX_BATCH:
+        raise FixError(f"At most {settings.INGEST_MAX_BATCH} fixes per batch.")
+    entries = []
+    for item in items:
+        try:
+            entries.append(parse(cruise_id, item))
+        except FixError as e:
+            entries.append(e)
+    return sequence, entries
+
+
+def async_client():
+    """The Redis client of the running event loop, made on first use and kept for later requests."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = redis.asyncio.from_url(settings.INGEST_REDIS_URL)
+    return client
+
+
+async def acknowledged(cruise_id):
+    """The highest sequence number received for ``cruise_id``, 0 before the first."""
+    return int(await async_client().get(sequence_key(cruise_id)) or 0)
+
+
+async def buffer_fixes(cruise_id, sequence, entries):
+    """
+    Buffer the new fixes of a parsed batch.
+
+    Returns the acknowledgement, the number of fixes buffered (``None`` when
+    the batch starts past the next expected sequence number) and the
+    countdown in seconds for a flush to queue, or ``None`` if none is needed.
+    """
+    rows = [json.dumps(entry) if isinstance(entry, dict) else '' for entry in entries]
+    client = async_client()
+    ack, buffered, waiting = await client.eval(
+        ACCEPT_SCRIPT, 2, sequence_key(cruise_id), BUFFER_KEY, sequence, *rows
+    )
+    if buffered < 0:
+        return ack, None, None
+    # The flag expires on its own in case the queued flush never runs.
+    if not buffered or not await client.set(FLUSH_PENDING_KEY, 1, nx=True, ex=settings.INGEST_FLUSH_INTERVAL * 10):
+        return ack, buffered, None
+    return ack, buffered, 0 if waiting >= settings.INGEST_FLUSH_SIZE else settings.INGEST_FLUSH_INTERVAL
+
+
+def flush_buffer(size=None):
+    """
+    Write every buffered fix to the positions table, ``size`` at a time.
+
+    Each batch is moved from the buffer to ``PROCESSING_KEY``, cleaned by the
+    ingest filters and copied in its own transaction, and only then removed.
+    A batch left there by a flush that died is loaded first, less any fixes
+    that were committed before it died. A batch that fails to load is logged
+    and moved to ``DEAD_LETTER_KEY``, and the flush goes on with the next
+    one, so one bad batch cannot hold up the fixes behind it. Fixes for
+    cruises deleted since they arrived are dropped. Returns a
+    :class:`Counter` of positions loaded per cruise id.
+    """
+    size = size or settings.INGEST_FLUSH_SIZE
+    client = redis.Redis.from_url(settings.INGEST_REDIS_URL)
+    loaded = Counter()
+    with client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT, blocking_timeout=FLUSH_LOCK_TIMEOUT) as lock:
+        client.delete(FLUSH_PENDING_KEY)  # Fixes arriving from now on queue another flush.
+        with deferred_route_updates() as touched:
+            while True:
+                batch = load_batch(client, size)
+                if batch is None:
+                    break
+                loaded.update(batch)
+                touched.update(batch)
+                lock.reacquire()
+    return loaded
+
+
+def load_batch(client, size):
+    """
+    Load the next batch of buffered fixes, returning their cruise ids.
+
+    ``None`` once the buffer is empty.
+    """
+    recovered, raw = client.eval(TAKE_SCRIPT, 2, BUFFER_KEY, PROCESSING_KEY, size)
+    if not raw:
+        return None
+    rows = [json.loads(row) for row in raw]
+    if recovered:
+        committed = Position.objects.filter(pk__in=[row['position_id'] for row in rows]).values_list('pk', flat=True)
+        committed = {str(pk) for pk in committed}
+        logger.warning(f"Reloading {len(rows)} fixes left by an interrupted flush, {len(committed)} already loaded")
+        rows = [row for row in rows if row['position_id'] not in committed]
+    cruise_ids = {row['cruise'] for row in rows}
+    existing = {str(pk) for pk in Cruise.objects.filter(pk__in=cruise_ids).values_list('pk', flat=True)}
+    if existing != cruise_ids:
+        logger.warning(f"Dropping buffered fixes of deleted cruises {sorted(cruise_ids - existing)}")
+        rows = [row for row in rows if row['cruise'] in existing]
+    try:
+        with transaction.atomic():
+            rows, dropped = filter_rows(rows)
+            if dropped:
+                logger.info(f"Filtered out {sum(dropped.values())} buffered fixes: {dict(dropped)}")
+            batch = copy_positions(rows)
+            invalidate_responses(Position, cruise_ids=batch)  # COPY sends no post_save signals
+            publish_rows(rows)
+    except Exception as e:
+        logger.error(f"Could not load {len(raw)} buffered fixes, moving them to {DEAD_LETTER_KEY}: {e}")
+        with client.pipeline() as pipe:
+            pipe.rpush(DEAD_LETTER_KEY, *raw).delete(PROCESSING_KEY).execute()
+        return []
+    client.delete(PROCESSING_KEY)
+    return batch
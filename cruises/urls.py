@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 """
 URL configuration for the Pacific Cruises application.
@@ -7,6 +8,8 @@ It registers the following viewsets:
 - CruiseViewSet: Handles CRUD operations for Cruise objects.
 - ScientistViewSet: Handles CRUD operations for Scientist objects.
 - CruiseStatusViewSet: Handles CRUD operations for CruiseStatus objects.
+- RouteViewSet: Read-only cruise routes, optionally simplified.
+- ExportViewSet: Starts and reports on position exports to CSV, GeoParquet or NetCDF.
 
 The urlpatterns list includes the routes generated by the router.
 
@@ -14,15 +17,41 @@ Routes:
 - /cruises/
 - /scientists/
 - /statuses/
+- /routes/
+- /exports/ (and /exports/<export_id>/download/ for the finished file)
+- /cache-stats/: Hit and miss counts of the API response cache.
+- /tiles/<layer>/<z>/<x>/<y>.mvt: Vector tiles of the routes, segments or positions layer.
+- /cruises/<cruise_id>/live/: Server-Sent Events of new positions and route changes (async).
+- /ingest/<cruise_id>/: Live position fixes from ships underway (async).
+
+The async views are served by the uvicorn ``asgi`` service; nginx sends everything else to gunicorn.
+With ``ASYNC_READS`` on, as it is for that service, GETs of /cruises/, /cruises/<cruise_id>/ and
+/cruises/<cruise_id>/positions/ are answered by async views too, ahead of the router.
 """
 from rest_framework.routers import DefaultRouter
-from .views import CruiseViewSet, ScientistViewSet, CruiseStatusViewSet
+from .views import (
+    CruiseViewSet, ScientistViewSet, CruiseStatusViewSet, RouteViewSet, ExportViewSet, async_cruise_detail, async_cruise_list,
+    async_cruise_positions, cache_stats, ingest, live, tile,
+)
 
 router = DefaultRouter()
 router.register(r'cruises', CruiseViewSet)
 router.register(r'scientists', ScientistViewSet)
 router.register(r'statuses', CruiseStatusViewSet)
+router.register(r'routes', RouteViewSet)
+router.register(r'exports', ExportViewSet)
 
 urlpatterns = [
+    path('cruises/<uuid:cruise_id>/live/', live, name='cruise-live'),
     path('', include(router.urls)),
+    path('cache-stats/', cache_stats, name='cache-stats'),
+    path('tiles/<slug:layer>/<int:z>/<int:x>/<int:y>.mvt', tile, name='tile'),
+    path('ingest/<uuid:cruise_id>/', ingest, name='ingest'),
 ]
+
+if settings.ASYNC_READS:
+    urlpatterns[:0] = [
+        path('cruises/', async_cruise_list, name='cruise-list-async'),
+        path('cruises/<uuid:pk>/', async_cruise_detail, name='cruise-detail-async'),
+        path('cruises/<uuid:pk>/positions/', async_cruise_positions, name='cruise-positions-async'),
+    ]
@@ -1,42 +1,556 @@
 from django.shortcuts import render
-from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 
 # Create your views here.
 # my_app/views.py
 
 # cruises/views.py
 # cruises/views.py
-from rest_framework import viewsets
-from .models import Cruise, CruiseStatus
+import hmac
+import mimetypes
+from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, MultiPolygon
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.throttling import ScopedRateThrottle
+from .geo import bbox_polygon, tolerance_for_zoom
+from .asyncdb import PoolExhausted
+from .caching import CachedResponseMixin, response_cache_stats
+from .export import start_export
+from .instrumentation import collected_metrics, render_metrics
+from .models import Cruise, CruiseStatus, Export, Leg, Position, Route, RouteLevel, Vessel, at_or_after, at_or_before
 from .serializers import CruiseSerializer
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_http_methods
 from django.conf import settings
+from django.db.models import Prefetch, Q
+from django.utils.dateparse import parse_date, parse_datetime
 import os 
-from .serializers import CruiseSerializer, ScientistSerializer, CruiseStatusSerializer
+from .serializers import CruiseSerializer, ScientistSerializer, CruiseStatusSerializer, RouteSerializer, RouteSummarySerializer, PositionSerializer, ExportSerializer
+from .pagination import CruiseCursorPagination, PositionKeysetPagination
+from .renderers import TrackRenderer
+from .streaming import STREAM_FORMATS, astream_positions, stream_positions
+from .tracks import encode_track
+from .search import SEARCH_LIMIT, SEARCH_MAX_LIMIT, search_cruises
+from .live import event_stream
+from .tasks import flush_underway_buffer
+from .tiles import LAYERS, render_tile
+from .underway import FixError, acknowledged, buffer_fixes, parse_batch
 
 from .models import Scientist
 from .serializers import ScientistSerializer
 
 
-class CruiseStatusViewSet(viewsets.ModelViewSet):
+class SimplifyMixin:
+    """
+    Serve route paths simplified for display.
+
+    ``?simplify=<degrees>`` picks the coarsest stored level of detail within
+    that tolerance; ``?zoom=<z>`` picks the one that is pixel-accurate at that
+    web map zoom. Without either the full path is returned.
+    """
+
+    def get_simplify(self):
+        params = self.request.query_params
+        try:
+            if 'simplify' in params:
+                tolerance = float(params['simplify'])
+                if not tolerance >= 0:
+                    raise ValueError
+                return tolerance
+            if 'zoom' in params:
+                zoom = int(params['zoom'])
+                if zoom < 0:
+                    raise ValueError
+                return tolerance_for_zoom(zoom)
+        except ValueError:
+            raise ValidationError("simplify must be a non-negative number of degrees and zoom a non-negative integer.")
+        return None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["simplify"] = self.get_simplify()
+        return context
+
+
+def parse_moment(value, name):
+    """An aware datetime from an ISO date or datetime query parameter, UTC unless it says otherwise."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None and (day := parse_date(value)) is not None:
+            moment = datetime.combine(day, datetime.min.time())  # A bare date means its midnight.
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def parse_bbox(value):
+    """``min_lon,min_lat,max_lon,max_lat``; ``min_lon`` may exceed ``max_lon`` across the antimeridian."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValidationError({'bbox': "Expected min_lon,min_lat,max_lon,max_lat."})
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValidationError({'bbox': "Longitudes must lie in -180..180 and latitudes in -90..90, south first."})
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def bbox_filter(min_lon, min_lat, max_lon, max_lat):
+    """
+    Filter for positions inside a lon/lat box.
+
+    The padded polygon overlap narrows the search through the spatial index on
+    ``coordinates``; the exact bounds are then checked on ``lat``/``lon``.
+    """
+    if min_lon > max_lon:
+        return bbox_filter(min_lon, min_lat, 180, max_lat) | bbox_filter(-180, min_lat, max_lon, max_lat)
+    return Q(
+        coordinates__bboverlaps=bbox_polygon(min_lon, min_lat, max_lon, max_lat),
+        lat__range=(min_lat, max_lat), lon__range=(min_lon, max_lon),
+    )
+
+
+def parse_area(params):
+    """The search area from ``?bbox=`` or a WKT or GeoJSON ``?geometry=``."""
+    if 'bbox' in params:
+        min_lon, min_lat, max_lon, max_lat = parse_bbox(params['bbox'])
+        if min_lon > max_lon:
+            return MultiPolygon(
+                bbox_polygon(min_lon, min_lat, 180, max_lat, margin=0),
+                bbox_polygon(-180, min_lat, max_lon, max_lat, margin=0),
+                srid=4326,
+            )
+        return bbox_polygon(min_lon, min_lat, max_lon, max_lat, margin=0)
+    if 'geometry' in params:
+        try:
+            area = GEOSGeometry(params['geometry'])
+        except (ValueError, TypeError, GEOSException, GDALException):
+            raise ValidationError({'geometry': "Expected a WKT or GeoJSON geometry."})
+        if not area.srid:
+            area.srid = 4326
+        return area
+    raise ValidationError("Give a search area with bbox or geometry.")
+
+
+class CruiseStatusViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'statuses'
+    cache_models = (CruiseStatus,)
     queryset = CruiseStatus.objects.all()
     serializer_class = CruiseStatusSerializer
 
 
-class ScientistViewSet(viewsets.ModelViewSet):
+class ScientistViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'scientists'
+    cache_models = (Scientist,)
     queryset = Scientist.objects.all()
     serializer_class = ScientistSerializer
-class CruiseViewSet(viewsets.ModelViewSet):
-    queryset = Cruise.objects.prefetch_related('legs', 'positions', 'scientists').all()  # This prefetches the related Legs
+
+
+class ExportViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Files of positions for download, as CSV, GeoParquet or NetCDF.
+
+    Posting a format and, optionally, cruises writes the file there and then
+    when it is small; larger exports are answered with 202 Accepted and
+    written by a Celery worker, and the export is polled until its
+    ``download_url`` appears.
+
+    Exports are for signed-in users, and one of every cruise for staff only.
+    Starting exports is throttled to the ``exports`` rate. Users see, and
+    download, only the exports they started; staff see them all.
+    """
+    queryset = Export.objects.all()
+    serializer_class = ExportSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'exports'
+
+    def get_throttles(self):
+        # Polling an export is cheap; only starting one is limited.
+        return [ScopedRateThrottle()] if self.action == 'create' else []
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset if self.request.user.is_staff else queryset.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        if not serializer.validated_data.get('cruises') and not self.request.user.is_staff:
+            raise PermissionDenied("Only staff may export every cruise; name the cruises to export.")
+        start_export(serializer.save(user=self.request.user))
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        """The export's file, once it is done."""
+        export = self.get_object()
+        if export.status != 'done' or not export.file:
+            raise Http404("The export has no file yet.")
+        filename = os.path.basename(export.file.name)
+        if not settings.EXPORT_ACCEL_REDIRECT:
+            return FileResponse(export.file.open('rb'), as_attachment=True, filename=filename)
+        # nginx sends the file from its internal location.
+        response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = f'{settings.EXPORT_ACCEL_REDIRECT}{export.file.name}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if response.data['status'] == 'pending':
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+
+class RouteViewSet(CachedResponseMixin, SimplifyMixin, viewsets.ReadOnlyModelViewSet):
+    """Cruise routes as GeoJSON features, optionally simplified with ``?simplify=`` or ``?zoom=``."""
+    cache_namespace = 'routes'
+    cache_models = (Route,)  # Route levels are only ever rewritten along with the route.
+    queryset = Route.objects.prefetch_related('levels').order_by('cruise')
+    serializer_class = RouteSerializer
+
+
+class CruiseViewSet(CachedResponseMixin, SimplifyMixin, viewsets.ModelViewSet):
+    """
+    Cruises, paginated by cursor.
+
+    The list leaves out the heavy ``positions`` and ``route`` fields unless they
+    are asked for with ``?expand=``; the detail view includes them. ``?fields=``
+    narrows either to the named fields. ``?name=`` (part of a cruise name) and
+    ``?status=`` (a status name) filter the list. Routes are simplified as for
+    :class:`RouteViewSet`.
+    """
+    cache_namespace = 'cruises'
+    cache_models = (Cruise, Vessel, CruiseStatus, Leg, Scientist, Position, Route)
+    cache_cruise_kwarg = 'pk'
+    queryset = Cruise.objects.all()
     serializer_class = CruiseSerializer
+    pagination_class = CruiseCursorPagination
+    detail_expand = ('positions', 'route')
+    # What each serialized field reads, so the queries load nothing else.
+    field_columns = {
+        'cruise_id': ('cruise_id',),
+        'iso2_country': ('iso2_country',),
+        'cruise_name': ('cruise_name',),
+        'status_name': ('status', 'status__name'),
+        'vessel_details': ('vessel', 'vessel__vessel_name', 'vessel__vessel_desc', 'vessel__vessel_picture', 'vessel__vessel_credit_url'),
+        'track_summary': tuple(f'route__{name}' for name in RouteSummarySerializer.Meta.fields),
+        'route': ('route__cruise', 'route__path'),
+    }
+    field_relations = {'status_name': 'status', 'vessel_details': 'vessel', 'track_summary': 'route', 'route': 'route'}
+    field_prefetches = {
+        'legs': ('legs', Leg.objects.only('cruise', 'leg_number', 'departure_port', 'return_port', 'start_date', 'end_date')),
+        'scientists': ('scientists', Scientist.objects.only('cruise', 'first_name', 'last_name')),
+        'positions': ('positions', Position.objects.only('cruise', 'date', 'time', 'timestamp', 'lat', 'lon', 'coordinates')),
+        'route': ('route__levels', RouteLevel.objects.only('route', 'tolerance', 'path')),
+    }
+
+    # The model behind each serialized field that another model's rows fill in.
+    field_models = {'legs': Leg, 'scientists': Scientist, 'positions': Position, 'track_summary': Route, 'route': Route}
+
+    def list_cache_models(self, request):
+        if self.action_map.get('get') != 'list':
+            return self.cache_models
+        selected = CruiseSerializer.selected_fields(CruiseSerializer.Meta.fields, request.GET)
+        return (Cruise, *dict.fromkeys(self.field_models[name] for name in selected if name in self.field_models))
+
+    def get_expand(self):
+        return self.detail_expand if self.action != 'list' else ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        if params.get('name'):
+            queryset = queryset.filter(cruise_name__icontains=params['name'])
+        if params.get('status'):
+            queryset = queryset.filter(status__name__iexact=params['status'])
+        return queryset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        selected = CruiseSerializer.selected_fields(
+            CruiseSerializer.Meta.fields, self.request.query_params, self.get_expand()
+        )
+        queryset = queryset.select_related(*(self.field_relations[name] for name in selected if name in self.field_relations))
+        for name in selected:
+            if name in self.field_prefetches:
+                queryset = queryset.prefetch_related(Prefetch(*self.field_prefetches[name]))
+        if self.action in ('list', 'retrieve'):
+            # The cursor pagination reads cruise_name off every page's last row.
+            columns = {'cruise_name'}.union(*(self.field_columns.get(name, ()) for name in selected))
+            queryset = queryset.only(*columns)
+        return queryset
+
+    @action(
+        detail=True,
+        pagination_class=PositionKeysetPagination,
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, TrackRenderer],
+    )
+    def positions(self, request, pk=None):
+        """
+        The cruise's positions in track order, filtered by ``?start=``,
+        ``?end=`` and ``?bbox=``.
+
+        Pages are keyset-paginated GeoJSON; ``?stream=geojson`` or
+        ``?stream=ndjson`` instead streams every matching position at once,
+        and ``?format=track`` (or accepting the track media type) returns them
+        all in the packed binary format of :mod:`cruises.tracks`.
+        """
+        cruise = get_object_or_404(Cruise.objects.only('pk'), pk=pk)
+        positions = self.filtered_positions(cruise.pk)
+        if request.accepted_renderer.format == TrackRenderer.format:
+            return Response(encode_track(positions, cruise.pk))
+        stream_format = self.get_stream_format()
+        if stream_format is not None:
+            return stream_positions(positions, stream_format, filename=f'positions-{cruise.pk}')
+        page = self.paginate_queryset(positions)
+        return self.get_paginated_response(PositionSerializer(page, many=True).data)
+
+    def filtered_positions(self, cruise_id):
+        params = self.request.query_params
+        positions = Position.objects.filter(cruise_id=cruise_id)
+        if 'start' in params:
+            positions = positions.filter(at_or_after(parse_moment(params['start'], 'start')))
+        if 'end' in params:
+            positions = positions.filter(at_or_before(parse_moment(params['end'], 'end')))
+        if 'bbox' in params:
+            positions = positions.filter(bbox_filter(*parse_bbox(params['bbox'])))
+        return positions
+
+    def get_stream_format(self):
+        stream_format = self.request.query_params.get('stream')
+        if stream_format is not None and stream_format not in STREAM_FORMATS:
+            raise ValidationError({'stream': f"Expected one of {', '.join(STREAM_FORMATS)}."})
+        return stream_format
+
+    @action(detail=False)
+    def search(self, request):
+        """
+        Cruises that passed through an area during a time window.
+
+        The area is ``?bbox=`` or a WKT or GeoJSON ``?geometry=``, optionally
+        widened by ``?distance=`` metres. ``?start=``, ``?end=``, ``?country=``
+        and ``?status=`` narrow the search. Cruises that spent longest in the
+        area come first, up to ``?limit=``.
+        """
+        params = request.query_params
+        try:
+            distance = float(params.get('distance', 0))
+            limit = min(int(params.get('limit', SEARCH_LIMIT)), SEARCH_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError("distance must be a number of metres and limit an integer.")
+        if distance < 0 or limit < 1:
+            raise ValidationError("distance must not be negative and limit must be positive.")
+        results = search_cruises(
+            parse_area(params),
+            distance=distance,
+            start=parse_moment(params['start'], 'start') if 'start' in params else None,
+            end=parse_moment(params['end'], 'end') if 'end' in params else None,
+            country=params.get('country'),
+            status=params.get('status'),
+            limit=limit,
+        )
+        return Response({'count': len(results), 'results': results})
 
     def get_serializer_context(self):
         # Adds the request to the serializer context
         context = super(CruiseViewSet, self).get_serializer_context()
-        context.update({"request": self.request})
+        context.update({"request": self.request, "expand": self.get_expand()})
         return context
 
 
+def action_kwargs(viewset_class, action):
+    """The view attributes an ``@action`` sets, such as its pagination and renderers."""
+    return getattr(getattr(viewset_class, action), 'kwargs', {})
+
+
+def read_viewset(viewset_class, request, action, kwargs):
+    """
+    ``viewset_class`` set up for a GET of ``action`` as DRF's dispatch would.
+
+    Authentication is skipped: the reads are open to all (``AllowAny``), and
+    looking up the user is a sync query.
+    """
+    viewset = viewset_class(**action_kwargs(viewset_class, action))
+    viewset.action_map = {'get': action}
+    viewset.args, viewset.kwargs = (), kwargs
+    viewset.headers = viewset.default_response_headers
+    viewset.request = viewset.initialize_request(request, **kwargs)
+    viewset.format_kwarg = viewset.get_format_suffix(**kwargs)
+    return viewset
+
+
+def async_reads(actions, read):
+    """
+    An async view answering GETs with ``read(viewset, **kwargs)`` and other methods with :class:`CruiseViewSet`.
+
+    Responses are cached as the viewset caches them, with the cache calls
+    made off the event loop since django-redis blocks. GETs for a renderer
+    other than JSON, such as the browsable API or the packed track format,
+    are also passed to the sync view.
+    """
+    sync_view = sync_to_async(CruiseViewSet.as_view(actions, **action_kwargs(CruiseViewSet, actions['get'])))
+
+    async def view(request, **kwargs):
+        if request.method != 'GET':
+            return await sync_view(request, **kwargs)
+        viewset = read_viewset(CruiseViewSet, request, actions['get'], kwargs)
+        try:
+            renderer, media_type = viewset.perform_content_negotiation(viewset.request)
+        except Exception as exc:
+            return viewset.finalize_response(viewset.request, viewset.handle_exception(exc))
+        if not isinstance(renderer, JSONRenderer):
+            return await sync_view(request, **kwargs)
+        viewset.request.accepted_renderer, viewset.request.accepted_media_type = renderer, media_type
+
+        key, response = await sync_to_async(viewset.cached_response)(request)
+        if response is not None:
+            return response
+        try:
+            response = await read(viewset, **kwargs)
+        except PoolExhausted:
+            response = Response(
+                {'detail': "Too many position downloads at once; try again shortly."}, status=503, headers={'Retry-After': '5'},
+            )
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return await sync_to_async(viewset.cache_response)(request, key, viewset.finalize_response(viewset.request, response))
+
+    return csrf_exempt(view)
+
+
+async def serialized(serializer):
+    """``serializer.data``, worked out off the event loop in case a field reaches for a relation not loaded."""
+    return await sync_to_async(lambda: serializer.data)()
+
+
+async def read_cruises(viewset):
+    queryset = viewset.filter_queryset(viewset.get_queryset())
+    # DRF's cursor pagination has no async path; its page query runs on a thread.
+    page = await sync_to_async(viewset.paginator.paginate_queryset)(queryset, viewset.request, viewset)
+    return viewset.get_paginated_response(await serialized(viewset.get_serializer(page, many=True)))
+
+
+async def read_cruise(viewset, pk):
+    try:
+        cruise = await viewset.filter_queryset(viewset.get_queryset()).aget(pk=pk)
+    except Cruise.DoesNotExist:
+        raise Http404("No such cruise.")
+    return Response(await serialized(viewset.get_serializer(cruise)))
+
+
+async def read_positions(viewset, pk):
+    if not await Cruise.objects.filter(pk=pk).aexists():
+        raise Http404("No such cruise.")
+    positions = viewset.filtered_positions(pk)
+    stream_format = viewset.get_stream_format()
+    if stream_format is not None:
+        return await astream_positions(positions, stream_format, filename=f'positions-{pk}')
+    page = await viewset.paginator.apaginate_queryset(positions, viewset.request, viewset)
+    return viewset.get_paginated_response(PositionSerializer(page, many=True).data)
+
+
+# Routed ahead of the router's views when ASYNC_READS is on, as it is for the uvicorn service.
+async_cruise_list = async_reads({'get': 'list', 'post': 'create'}, read_cruises)
+async_cruise_detail = async_reads(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}, read_cruise,
+)
+async_cruise_positions = async_reads({'get': 'positions'}, read_positions)
+
+
+@require_GET
+def cache_stats(request):
+    """Hit and miss counts of the API response cache, per endpoint."""
+    viewsets = (CruiseViewSet, RouteViewSet, ScientistViewSet, CruiseStatusViewSet)
+    return JsonResponse(response_cache_stats([viewset.cache_namespace for viewset in viewsets]))
+
+
+@require_GET
+def metrics(request):
+    """Request, query and span metrics of every process, in the Prometheus text format."""
+    return HttpResponse(render_metrics(*collected_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def tile(request, layer, z, x, y):
+    """A Mapbox Vector Tile of routes, segments or positions."""
+    if layer not in LAYERS or z > settings.TILE_MAX_ZOOM or y >= 2 ** z:
+        raise Http404("No such tile.")
+    response = HttpResponse(render_tile(layer, z, x, y), content_type='application/vnd.mapbox-vector-tile')
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+@require_GET
+async def live(request, cruise_id):
+    """Server-Sent Events of new positions and route changes of a cruise; see :mod:`cruises.live`."""
+    if not await Cruise.objects.filter(pk=cruise_id).aexists():
+        raise Http404("No such cruise.")
+    response = StreamingHttpResponse(event_stream(cruise_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Let nginx pass each event on as it arrives.
+    return response
+
+
+def ingest_authorized(request):
+    if not settings.INGEST_TOKEN:
+        return settings.DEBUG  # Open only for local development; fail closed anywhere else.
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme == 'Bearer' and hmac.compare_digest(token, settings.INGEST_TOKEN)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+async def ingest(request, cruise_id):
+    """
+    Live fixes from a ship underway; see :mod:`cruises.underway`.
+
+    GET returns the last sequence number received for the cruise. POST takes
+    a JSON batch, or NMEA sentences with ``?sequence=``. It acknowledges with
+    the last sequence number received and lists the fixes rejected. A batch
+    that would leave a gap is refused with 409 and the same acknowledgement.
+    """
+    if not ingest_authorized(request):
+        return JsonResponse({'detail': "Invalid ingest token."}, status=401)
+    if not await Cruise.objects.filter(pk=cruise_id).aexists():
+        raise Http404("No such cruise.")
+    if request.method == 'GET':
+        return JsonResponse({'cruise': str(cruise_id), 'ack': await acknowledged(cruise_id)})
+
+    try:
+        sequence = request.GET.get('sequence')
+        sequence, entries = parse_batch(
+            cruise_id, request.body, request.content_type, int(sequence) if sequence else None
+        )
+    except (FixError, ValueError) as e:
+        return JsonResponse({'detail': str(e) if isinstance(e, FixError) else "Invalid sequence number."}, status=400)
+    ack, buffered, countdown = await buffer_fixes(cruise_id, sequence, entries)
+    if buffered is None:
+        return JsonResponse({'cruise': str(cruise_id), 'ack': ack, 'detail': f"Resend from sequence {ack + 1}."}, status=409)
+    if countdown is not None:
+        await sync_to_async(flush_underway_buffer.apply_async)(countdown=countdown)
+    return JsonResponse({
+        'cruise': str(cruise_id),
+        'ack': ack,
+        'buffered': buffered,
+        'rejected': [
+            {'sequence': sequence + i, 'detail': str(entry)}
+            for i, entry in enumerate(entries) if isinstance(entry, FixError)
+        ],
+    })
+
+
 @ensure_csrf_cookie
 def index(request):
     try:
@@ -11,10 +11,13 @@ import Style from 'ol/style/Style';
 import Stroke from 'ol/style/Stroke';
 import Icon from 'ol/style/Icon';
 import Point from 'ol/geom/Point';
+import LineString from 'ol/geom/LineString';
 import Feature from 'ol/Feature';
+import { fromLonLat } from 'ol/proj';
 
 /**
  * CruiseDetailMap component renders a map with a cruise route.
+ * The route then follows the live updates the API pushes for the cruise.
  * 
  * @component
  * @param {Object} props - Component properties.
@@ -27,8 +30,11 @@ import Feature from 'ol/Feature';
  */
 const CruiseDetailMap = ({ cruiseId }) => {
   const mapContainerRef = useRef();
+  const apiUrl = (process.env.REACT_APP_API_URL || 'https://cruisedb.corp.spc.int/api').replace(/\/+$/, '');
 
   useEffect(() => {
+    let events;
+    let unmounted = false;
     const map = new Map({
       target: mapContainerRef.current,
       layers: [
@@ -106,6 +112,21 @@ const CruiseDetailMap = ({ cruiseId }) => {
         // Fit the map to the extent of the cruise route
         map.getView().fit(vectorSource.getExtent(), { padding: [50, 50, 50, 50], maxZoom: 10 });
 
+        // New fixes extend the route; any other change replaces it
+        if (unmounted) return;
+        events = new EventSource(`${apiUrl}/cruises/${cruiseId}/live/`);
+        events.addEventListener('extend', (event) => {
+          const { coordinates } = JSON.parse(event.data);
+          vectorSource.addFeature(new Feature(new LineString(coordinates.map((point) => fromLonLat(point)))));
+        });
+        events.addEventListener('route', (event) => {
+          const { path } = JSON.parse(event.data);
+          vectorSource.clear();
+          if (path) {
+            vectorSource.addFeatures(new GeoJSON().readFeatures(path, { featureProjection: 'EPSG:3857' }));
+          }
+        });
+
       } catch (error) {
         console.error('Error fetching route from GeoServer:', error);
       }
@@ -113,8 +134,13 @@ const CruiseDetailMap = ({ cruiseId }) => {
 
     fetchGeoServerData();
 
-    return () => map.setTarget(undefined); // Clean up on unmount
-  }, [cruiseId]);
+    return () => {
+      // Clean up on unmount
+      unmounted = true;
+      if (events) events.close();
+      map.setTarget(undefined);
+    };
+  }, [apiUrl, cruiseId]);
 
   return (
     <div ref={mapContainerRef} className="map-container" style={{ height: '400px', width: '100%' }} />
@@ -4,14 +4,11 @@ import Map from 'ol/Map';
 import View from 'ol/View';
 import TileLayer from 'ol/layer/Tile';
 import OSM from 'ol/source/OSM';
-import VectorLayer from 'ol/layer/Vector';
-import VectorSource from 'ol/source/Vector';
-import GeoJSON from 'ol/format/GeoJSON';
+import VectorTileLayer from 'ol/layer/VectorTile';
+import VectorTileSource from 'ol/source/VectorTile';
+import MVT from 'ol/format/MVT';
 import Style from 'ol/style/Style';
 import Stroke from 'ol/style/Stroke';
-import Icon from 'ol/style/Icon';
-import Feature from 'ol/Feature';
-import Point from 'ol/geom/Point';
 
 const generateRandomColor = () => {
   const letters = '0123456789ABCDEF';
@@ -49,72 +46,29 @@ const CruiseListMap = () => {
       }),
     });
 
-    const fetchGeoServerData = async () => {
-      try {
-        const response = await fetch(`https://cruisedb.corp.spc.int/geoserver/cruise/wfs?service=WFS&version=2.0.0&request=GetFeature&typeName=cruise:cruises_route&outputFormat=application/json`);
-        if (!response.ok) {
-          if (response.status === 404) {
-            throw new Error('Cruise route data not found.');
-          } else {
-            throw new Error(`GeoServer data fetch failed: ${response.status}`);
-          }
-        }
-        const data = await response.json();
-
-        const vectorSource = new VectorSource({
-          features: new GeoJSON().readFeatures(data, {
-            featureProjection: 'EPSG:3857',
+    // Routes come as vector tiles from the API, so only the tiles in view are fetched.
+    const routeLayer = new VectorTileLayer({
+      source: new VectorTileSource({
+        format: new MVT(),
+        url: '/api/tiles/routes/{z}/{x}/{y}.mvt',
+        maxZoom: 14,
+        wrapX: true,
+      }),
+      style: function (feature) {
+        const cruiseColor = getCruiseColor(feature.get('cruise_id'));
+        return new Style({
+          stroke: new Stroke({
+            color: cruiseColor,
+            width: 2,
+            lineDash: [4, 4], // Dotted line
           }),
         });
-
-        const vectorLayer = new VectorLayer({
-          source: vectorSource,
-          style: function (feature) {
-            const cruiseId = feature.get('cruise_id');
-            const cruiseColor = getCruiseColor(cruiseId);
-
-            // Handle MultiLineString and LineString geometries
-            const coordinates = feature.getGeometry().getType() === 'MultiLineString'
-              ? feature.getGeometry().getCoordinates()[0]
-              : feature.getGeometry().getCoordinates();
-            const startPoint = coordinates[0];
-            const endPoint = coordinates[coordinates.length - 1];
-
-            // Create start and end vertex icons
-            const startVertex = new Feature({
-              geometry: new Point(startPoint),
-            });
-            const endVertex = new Feature({
-              geometry: new Point(endPoint),
-            });
-
-            const arrowIcon = new Icon({
-              src: 'https://example.com/path/to/arrow-icon.png', // Update this URL
-              scale: 0.5,
-              rotation: 0,
-            });
-
-            startVertex.setStyle(new Style({ image: arrowIcon }));
-            endVertex.setStyle(new Style({ image: arrowIcon }));
-
-            return new Style({
-              stroke: new Stroke({
-                color: cruiseColor,
-                width: 2,
-                lineDash: [4, 4], // Dotted line
-              }),
-            });
-          },
-        });
-
-        map.addLayer(vectorLayer);
-      } catch (error) {
-        console.error('Error fetching route from GeoServer:', error);
-        alert(error.message || 'Unable to fetch route data. Please try again later.');
-      }
-    };
-
-    fetchGeoServerData();
+      },
+    });
+    routeLayer.getSource().on('tileloaderror', () => {
+      console.error('Error loading route tiles.');
+    });
+    map.addLayer(routeLayer);
 
     return () => map.setTarget(undefined);
   }, [getCruiseColor]);
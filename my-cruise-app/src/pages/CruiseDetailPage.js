@@ -22,7 +22,7 @@ const CruiseDetailPage = () => {
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const [isRetrying, setIsRetrying] = useState(false);
-    const apiUrl = process.env.REACT_APP_API_URL || 'https://cruisedb.corp.spc.int/api/';
+    const apiUrl = (process.env.REACT_APP_API_URL || 'https://cruisedb.corp.spc.int/api').replace(/\/+$/, '');
 
     const fetchCruiseDetail = useCallback(async () => {
         try {
@@ -8,28 +8,25 @@ import countries from 'i18n-iso-countries';
 
 countries.registerLocale(require('i18n-iso-countries/langs/en.json'));
 
-const Pagination = ({ totalItems, itemsPerPage, currentPage, onPageChange }) => {
-    const totalPages = Math.ceil(totalItems / itemsPerPage);
-    if (totalPages <= 1) return null;
+const Pagination = ({ hasPrevious, hasNext, onPrevious, onNext }) => {
+    if (!hasPrevious && !hasNext) return null;
 
     return (
         <div className="pagination">
-            {Array.from({ length: totalPages }, (_, index) => (
-                <button
-                    key={index}
-                    onClick={() => onPageChange(index + 1)}
-                    className={currentPage === index + 1 ? 'page-number active' : 'page-number'}
-                >
-                    {index + 1}
-                </button>
-            ))}
+            <button onClick={onPrevious} disabled={!hasPrevious} className="page-number">
+                Previous
+            </button>
+            <button onClick={onNext} disabled={!hasNext} className="page-number">
+                Next
+            </button>
         </div>
     );
 };
 
 /**
  * CruiseListPage component renders a list of scientific cruises with search and filter functionalities.
- * It also provides pagination and navigation to cruise details.
+ * It also provides pagination and navigation to cruise details. Only the page on screen is fetched:
+ * the API filters by name and status, and the pager follows its cursor links.
  *
  * @component
  * @example
@@ -60,24 +57,24 @@ const Pagination = ({ totalItems, itemsPerPage, currentPage, onPageChange }) =>
  * @property {string} status - The status filter.
  *
  * @typedef {Object} PaginationProps
- * @property {number} totalItems - The total number of items.
- * @property {number} itemsPerPage - The number of items per page.
- * @property {number} currentPage - The current page number.
- * @property {function} onPageChange - The function to handle page change.
+ * @property {boolean} hasPrevious - Whether a page comes before this one.
+ * @property {boolean} hasNext - Whether a page comes after this one.
+ * @property {function} onPrevious - The function to show the previous page.
+ * @property {function} onNext - The function to show the next page.
  */
 const CruiseListPage = () => {
     const [activeTab, setActiveTab] = useState('list');
-    const [currentPage, setCurrentPage] = useState(1);
     const [itemsPerPage] = useState(10);
     const [searchTerm, setSearchTerm] = useState('');
     const [debouncedSearchTerm, setDebouncedSearchTerm] = useState(searchTerm);
     const [filters, setFilters] = useState({ status: '' });
-    const [cruises, setCruises] = useState([]);
+    const [page, setPage] = useState({ results: [], next: null, previous: null });
+    const [pageUrl, setPageUrl] = useState(null);
     const [statuses, setStatuses] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const navigate = useNavigate();
-    const apiUrl = process.env.REACT_APP_API_URL || 'https://cruisedb.corp.spc.int/api';
+    const apiUrl = (process.env.REACT_APP_API_URL || 'https://cruisedb.corp.spc.int/api').replace(/\/+$/, '');
 
     const handleSearchChange = (e) => setDebouncedSearchTerm(e.target.value);
 
@@ -95,37 +92,50 @@ const CruiseListPage = () => {
         };
     }, [debouncedSearchTerm]);
 
-    const filteredCruises = useMemo(() => cruises.filter(cruise => {
-        const name = cruise.cruise_name.toLowerCase();
-        const status = cruise.status_name;
-        return name.includes(searchTerm.toLowerCase()) &&
-            (!filters.status || status === filters.status);
-    }), [cruises, searchTerm, filters.status]);
+    // The first page for the current search and filter; later pages come from its cursor links.
+    const firstPageUrl = useMemo(() => {
+        const params = new URLSearchParams({
+            // Only the summary columns shown in the table.
+            fields: 'cruise_id,cruise_name,iso2_country,status_name,vessel_details,legs',
+            page_size: itemsPerPage,
+        });
+        if (searchTerm) params.set('name', searchTerm);
+        if (filters.status) params.set('status', filters.status);
+        return `${apiUrl}/cruises/?${params}`;
+    }, [apiUrl, itemsPerPage, searchTerm, filters.status]);
 
-    const indexOfLastCruise = currentPage * itemsPerPage;
-    const indexOfFirstCruise = indexOfLastCruise - itemsPerPage;
-    const currentCruises = filteredCruises.slice(indexOfFirstCruise, indexOfLastCruise);
+    useEffect(() => {
+        setPageUrl(firstPageUrl);
+    }, [firstPageUrl]);
 
-    const handlePageChange = pageNumber => setCurrentPage(pageNumber);
     const handleSeeDetails = id => navigate(`/cruises/${id}`);
 
     useEffect(() => {
+        if (!pageUrl) return undefined;
+        let cancelled = false;
         const fetchCruises = async () => {
+            setLoading(true);
             try {
-                const response = await fetch(`${apiUrl}/cruises/`, {
+                const response = await fetch(pageUrl, {
                     headers: { 'Accept': 'application/json' }
                 });
                 if (!response.ok) throw new Error(`Failed to fetch cruises. Status: ${response.status}`);
                 const data = await response.json();
-                setCruises(data);
+                if (!cancelled) {
+                    setPage(data);
+                    setError(null);
+                }
             } catch (error) {
-                setError('An error occurred while loading cruises. Please try again later.');
+                if (!cancelled) setError('An error occurred while loading cruises. Please try again later.');
             } finally {
-                setLoading(false);
+                if (!cancelled) setLoading(false);
             }
         };
         fetchCruises();
-    }, [apiUrl]);
+        return () => {
+            cancelled = true;
+        };
+    }, [pageUrl]);
 
     useEffect(() => {
         const fetchStatuses = async () => {
@@ -194,7 +204,7 @@ const CruiseListPage = () => {
                                             </tr>
                                         </thead>
                                         <tbody>
-                                            {currentCruises.map(cruise => (
+                                            {page.results.map(cruise => (
                                                 <tr key={cruise.cruise_id} role="row">
                                                     <td>{cruise.cruise_name}</td>
                                                     <td>{cruise.status_name}</td>
@@ -225,10 +235,10 @@ const CruiseListPage = () => {
                                     </table>
                                 </div>
                                 <Pagination
-                                    totalItems={filteredCruises.length}
-                                    itemsPerPage={itemsPerPage}
-                                    currentPage={currentPage}
-                                    onPageChange={handlePageChange}
+                                    hasPrevious={Boolean(page.previous)}
+                                    hasNext={Boolean(page.next)}
+                                    onPrevious={() => setPageUrl(page.previous)}
+                                    onNext={() => setPageUrl(page.next)}
                                 />
                             </>
                         )}
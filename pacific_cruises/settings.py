@@ -71,10 +71,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Views opt in with throttle_scope; exports write whole tables to disk
+    'DEFAULT_THROTTLE_RATES': {
+        'exports': os.getenv('EXPORT_THROTTLE_RATE', '10/hour'),
+    },
 }
 
 # Middleware
 MIDDLEWARE = [
+    'cruises.instrumentation.InstrumentationMiddleware',  # Server-Timing and /metrics
     'corsheaders.middleware.CorsMiddleware',  # CORS support
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Static files
@@ -181,6 +186,79 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_IMPORTS = ('cruises.tasks',)
 
+# Rebuild routes in Celery instead of inside the request that saved a position
+ROUTE_REBUILD_ASYNC = os.getenv('ROUTE_REBUILD_ASYNC', 'True') == 'True'
+# Seconds to wait before rebuilding, so a burst of saves is coalesced into one rebuild
+ROUTE_REBUILD_DELAY = int(os.getenv('ROUTE_REBUILD_DELAY', '5'))
+# Simplified copies of each route path stored for ?simplify= and ?zoom= (degrees; about zoom 9, 6 and 3)
+ROUTE_SIMPLIFY_TOLERANCES = [0.002, 0.02, 0.2]
+
+# Vector tiles served from /api/tiles/; cached until a route changes or for this many seconds
+TILE_CACHE_TIMEOUT = int(os.getenv('TILE_CACHE_TIMEOUT', '86400'))
+TILE_MAX_ZOOM = 18
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+# Cached tiles are invalidated per tile down to this zoom when a route changes; deeper tiles go with their ancestor
+TILE_INVALIDATION_ZOOM = int(os.getenv('TILE_INVALIDATION_ZOOM', '5'))
+# The positions layer is empty below this zoom and capped at this many positions per tile
+TILE_POSITIONS_MIN_ZOOM = int(os.getenv('TILE_POSITIONS_MIN_ZOOM', '8'))
+TILE_POSITIONS_LIMIT = int(os.getenv('TILE_POSITIONS_LIMIT', '10000'))
+
+# Seconds a cached API response is kept; any change to the data it was built from drops it sooner
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', '300'))
+
+# Fixes loaded with COPY (track imports and live ingestion) are cleaned first: outliers faster than
+# this many knots are dropped, and fixes within both this many metres and seconds of the last one kept; 0 disables
+INGEST_MAX_SPEED = float(os.getenv('INGEST_MAX_SPEED', '40'))
+INGEST_MIN_DISTANCE = float(os.getenv('INGEST_MIN_DISTANCE', '25'))
+INGEST_MIN_INTERVAL = float(os.getenv('INGEST_MIN_INTERVAL', '60'))
+
+# Live fixes posted to /api/ingest/ are buffered in Redis and copied into the positions table
+# once this many are waiting, or this many seconds after the first one arrives
+INGEST_REDIS_URL = os.getenv('INGEST_REDIS_URL', 'redis://redis:6379/2')
+INGEST_FLUSH_SIZE = int(os.getenv('INGEST_FLUSH_SIZE', '5000'))
+INGEST_FLUSH_INTERVAL = int(os.getenv('INGEST_FLUSH_INTERVAL', '10'))
+INGEST_MAX_BATCH = 10000
+# Bearer token ships must send; when unset, ingestion is refused unless DEBUG is on
+INGEST_TOKEN = os.getenv('INGEST_TOKEN', '')
+
+# Redis for /api/cruises/<id>/live/ pub/sub (publishing is off when empty); idle streams get a comment this often (seconds)
+LIVE_REDIS_URL = os.getenv('LIVE_REDIS_URL', 'redis://redis:6379/2')
+LIVE_KEEPALIVE = 15
+
+# Per-request query counts, timings and hot-path spans, as Server-Timing headers and /metrics;
+# each process copies its metrics to the default cache at most this often (seconds)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_FLUSH_INTERVAL = 10
+# Seconds after its last copy that a process's metrics slot is folded into the retired totals and freed
+METRICS_SLOT_TIMEOUT = int(os.getenv('METRICS_SLOT_TIMEOUT', '3600'))
+
+# Under ASGI, answer GETs of cruises and their positions with async views; each event loop streams positions
+# through its own psycopg pool, and answers 503 when no connection frees up within the timeout (seconds).
+# WhiteNoise is sync-only and would put every async view on a thread through async_to_sync, so it is left
+# out (nginx serves /static/). Django's session, CSRF, auth and messages middleware still run their hooks
+# on the one thread sync_to_async keeps for them, so the gain is in slow downloads sharing a worker, not
+# in requests per second.
+ASYNC_READS = os.getenv('ASYNC_READS', 'False') == 'True'
+if ASYNC_READS:
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+ASYNC_DB_POOL = {
+    'min_size': int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', '2')),
+    'max_size': int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', '10')),
+    'timeout': float(os.getenv('ASYNC_DB_POOL_TIMEOUT', '10')),
+    'max_waiting': int(os.getenv('ASYNC_DB_POOL_MAX_WAITING', '200')),
+    'max_idle': 300,
+}
+
+# Position exports (/api/exports/ and the cruise admin actions) are written to EXPORT_ROOT/exports/ a chunk
+# of this many rows at a time; ones the routes say hold more positions than the limit run in Celery
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_INLINE_LIMIT = int(os.getenv('EXPORT_INLINE_LIMIT', '100000'))
+# Export files stay out of MEDIA_ROOT and are only served by /api/exports/<id>/download/ to their owner and staff;
+# behind nginx the view hands the file over with X-Accel-Redirect to this internal location, when set
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', os.path.join(BASE_DIR, 'private'))
+EXPORT_ACCEL_REDIRECT = os.getenv('EXPORT_ACCEL_REDIRECT', '')
+
 # Logging configuration
 LOGGING = {
     'version': 1,
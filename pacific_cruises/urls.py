@@ -11,6 +11,7 @@ This module defines the URL patterns for the project, including:
 Routes:
 - 'admin/': Admin site.
 - 'api/': Includes routes from the cruises app.
+- 'metrics': Prometheus metrics of the API, for scraping from inside the network.
 - 'media/<path>': Serves media files from MEDIA_ROOT.
 - '.*': Serves index.html for all other paths.
 
@@ -21,10 +22,12 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.static import serve
 from django.views.generic import TemplateView
+from cruises.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('cruises.urls')),  # Including the API routes from cruises app
+    path('metrics', metrics, name='metrics'),
     re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),  # Serving media files
     # Serve index.html for all other paths (for React app)
     re_path(r'^.*$', TemplateView.as_view(template_name='index.html'), name='home'),